@@ -0,0 +1,176 @@
+"""
+Multi-step tool execution for agent turns.
+
+A turn starts by planning its tool calls from the message (plan_tool_calls):
+the message is split into clauses, and each clause becomes a call of one of
+the agent's tools, e.g. "what is 12 * 3, then add 4, and what time is it"
+plans calculator(12, 3, multiply), calculator(<previous result>, 4, add) and
+current_time(). A call that needs another call's result depends on it.
+
+AgentLoop then runs the plan in steps. Each step starts every call whose
+dependencies have finished, concurrently, so a turn takes about as long as its
+slowest chain of calls rather than the sum of all of them. A turn is bounded
+by a number of steps, a number of calls and a time budget; calls that do not
+finish in time are recorded as failed.
+"""
+import os
+import re
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import models as models
+
+logger = logging.getLogger(__name__)
+
+AGENT_MAX_STEPS = int(os.environ.get("AGENT_MAX_STEPS", "4"))
+AGENT_MAX_TOOL_CALLS = int(os.environ.get("AGENT_MAX_TOOL_CALLS", "8"))
+AGENT_TURN_BUDGET = float(os.environ.get("AGENT_TURN_BUDGET", "20"))  # seconds
+
+# Clause boundaries: sentence punctuation, "then"/"also", and "and" before a new question or command
+CLAUSE_BOUNDARY = re.compile(
+    r"[?!;\n]+|,?\s+(?:and then|then|and also|also)\s+|"
+    r"\s+and\s+(?=(?:what|who|where|when|how|search|find|look up|calculate|compute|tell me|add|subtract|multiply|divide)\b)",
+    re.IGNORECASE,
+)
+NUMBER = r"(-?\d+(?:\.\d+)?)"
+OPERATORS = {
+    "+": "add", "plus": "add",
+    "-": "subtract", "minus": "subtract",
+    "*": "multiply", "x": "multiply", "times": "multiply", "multiplied by": "multiply",
+    "/": "divide", "divided by": "divide",
+}
+EXPRESSION = re.compile(rf"{NUMBER}\s*(\+|-|\*|/|\bx\b|\bplus\b|\bminus\b|\btimes\b|\bmultiplied by\b|\bdivided by\b)\s*{NUMBER}", re.IGNORECASE)
+# A clause continuing from the previous calculation, e.g. "add 4" or "divide it by 2"
+FOLLOW_UP = re.compile(rf"^(add|plus|subtract|minus|multiply(?: it)? by|times|divide(?: it)? by)\s+{NUMBER}$", re.IGNORECASE)
+FOLLOW_UP_OPERATORS = {"add": "add", "plus": "add", "subtract": "subtract", "minus": "subtract", "times": "multiply", "multiply": "multiply", "divide": "divide"}
+TIME_QUESTION = re.compile(r"\b(?:time|date|today)\b", re.IGNORECASE)
+RESULT_NUMBER = re.compile(r"-?\d+(?:\.\d+)?(?:e[+-]?\d+)?", re.IGNORECASE)
+
+
+def split_clauses(message: str) -> List[str]:
+    """Splits a message into the clauses that are planned separately."""
+    return [clause.strip(" .,") for clause in CLAUSE_BOUNDARY.split(message) if clause and clause.strip(" .,")]
+
+
+def plan_tool_calls(agent: models.AgentDetail, message: str) -> List[models.PlannedToolCall]:
+    """Plans the calls of the agent's tools that a message asks for, in the order they are asked for."""
+    tools = set(agent.tools)
+    plan: List[models.PlannedToolCall] = []
+    last_calculation: Optional[int] = None
+
+    def add(call: models.PlannedToolCall) -> int:
+        for i, planned in enumerate(plan):
+            if planned == call:
+                return i
+        plan.append(call)
+        return len(plan) - 1
+
+    for clause in split_clauses(message):
+        if "calculator" in tools:
+            expressions = list(EXPRESSION.finditer(clause))
+            for a, op, b in (match.groups() for match in expressions):
+                last_calculation = add(models.PlannedToolCall(
+                    tool="calculator", args={"a": float(a), "b": float(b), "op": OPERATORS[op.lower()]},
+                ))
+            if expressions:
+                continue
+            follow_up = FOLLOW_UP.match(clause)
+            if follow_up and last_calculation is not None:
+                op = FOLLOW_UP_OPERATORS[follow_up.group(1).split()[0].lower()]
+                last_calculation = add(models.PlannedToolCall(
+                    tool="calculator", args={"b": float(follow_up.group(2)), "op": op},
+                    depends_on=last_calculation, input_arg="a",
+                ))
+                continue
+        if "current_time" in tools and TIME_QUESTION.search(clause):
+            add(models.PlannedToolCall(tool="current_time"))
+            continue
+        if "web_search" in tools:
+            add(models.PlannedToolCall(tool="web_search", args={"query": clause}))
+    return plan
+
+
+class AgentLoop:
+    """Runs planned tool calls step by step, with the independent calls of each step in parallel."""
+
+    def __init__(
+        self,
+        call_tool: Callable[[str, Dict[str, Any]], Awaitable[models.ToolCall]],
+        max_steps: int = AGENT_MAX_STEPS,
+        max_calls: int = AGENT_MAX_TOOL_CALLS,
+        time_budget: float = AGENT_TURN_BUDGET,
+    ):
+        self.call_tool = call_tool
+        self.max_steps = max_steps
+        self.max_calls = max_calls
+        self.time_budget = time_budget
+
+    async def run(self, plan: List[models.PlannedToolCall], results: List[Optional[models.ToolCall]]) -> AsyncIterator[models.ChatStreamEvent]:
+        """
+        Runs a plan, yielding `tool_call_started` and `tool_call_finished` events as
+        calls start and finish. `results` is filled with each planned call's result,
+        in plan order; calls left out by the limits stay None.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.time_budget
+        if len(plan) > self.max_calls:
+            logger.warning(f"Agent turn planned {len(plan)} tool calls; running the first {self.max_calls}.")
+        results[:] = [None] * len(plan)
+        remaining = set(range(min(len(plan), self.max_calls)))
+
+        for _ in range(self.max_steps):
+            ready = [i for i in sorted(remaining) if plan[i].depends_on is None or results[plan[i].depends_on] is not None]
+            if not ready:
+                break
+            remaining.difference_update(ready)
+            # Every call of the step is started before any event is sent
+            tasks, events = {}, []
+            for i in ready:
+                call = plan[i]
+                args = dict(call.args)
+                if call.depends_on is not None:
+                    error = self._fill_input(call, args, results[call.depends_on])
+                    if error is not None:
+                        results[i] = models.ToolCall(tool=call.tool, args=args, result=error)
+                        events.append(models.ChatStreamEvent(event="tool_call_finished", data=results[i].model_dump()))
+                        continue
+                tasks[asyncio.ensure_future(self.call_tool(call.tool, args))] = (i, args)
+                events.append(models.ChatStreamEvent(event="tool_call_started", data={"tool": call.tool, "args": args}))
+            for event in events:
+                yield event
+
+            pending = set(tasks)
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()), return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        break
+                    for task in done:
+                        i, _ = tasks[task]
+                        results[i] = task.result()
+                        yield models.ChatStreamEvent(event="tool_call_finished", data=results[i].model_dump())
+            finally:
+                # Also reached when the client goes away mid-turn
+                for task in pending:
+                    task.cancel()
+            if pending:
+                logger.warning(f"Agent turn ran out of its {self.time_budget}s budget with {len(pending)} tool calls running.")
+                for task in pending:
+                    i, args = tasks[task]
+                    results[i] = models.ToolCall(
+                        tool=plan[i].tool, args=args, result=f"Error: The turn's {self.time_budget}s time budget ran out before this call finished.",
+                    )
+                    yield models.ChatStreamEvent(event="tool_call_finished", data=results[i].model_dump())
+                return
+        if remaining:
+            logger.warning(f"Agent turn reached its limit of {self.max_steps} steps; {len(remaining)} planned tool calls did not run.")
+
+    @staticmethod
+    def _fill_input(call: models.PlannedToolCall, args: Dict[str, Any], dependency: models.ToolCall) -> Optional[str]:
+        """Fills `args` from the result of the call this one depends on, or returns why it cannot."""
+        numbers = RESULT_NUMBER.findall(dependency.result) if not dependency.result.startswith("Error:") else []
+        if not numbers:
+            return f"Error: Skipped because the {dependency.tool} call it depends on returned no number."
+        args[call.input_arg] = float(numbers[-1])
+        return None
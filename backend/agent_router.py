@@ -0,0 +1,139 @@
+"""
+Routes chat messages to agents.
+
+Each agent lists trigger phrases ("divided by", "who is", "+"). When the router
+is built they are compiled into one lookup table from phrase to the agents it
+triggers. A message is tokenized once, and each of its n-grams, up to the
+longest trigger, is looked up in that table, so routing costs the same however
+many agents and triggers there are. When several agents are triggered, the
+one listed first wins.
+
+In "semantic" mode the router instead embeds the message and picks the agent
+whose centroid, the mean embedding of its example messages, is most similar,
+falling back to the default agent below `semantic_threshold`. "hybrid" mode
+uses the triggers first and the centroids for messages that trigger nothing.
+Batches are embedded and scored together in a single matrix product.
+"""
+import re
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import models as models
+from models import AgentDetail
+from knowledge.embeddings import get_embedder, HASHING_EMBEDDER
+
+logger = logging.getLogger(__name__)
+
+ROUTER_MODES = ("rules", "semantic", "hybrid")
+DEFAULT_SEMANTIC_THRESHOLD = 0.2
+
+# Words (hyphenated words stay whole), numbers and single symbols such as operators
+TOKEN = re.compile(r"[^\W\d_]+(?:['-][^\W\d_]+)*|\d+(?:\.\d+)?|[^\w\s]")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN.findall(text.lower())
+
+
+class AgentRouter:
+    """Picks an agent for a message by trigger phrases, by example similarity, or both."""
+
+    def __init__(
+        self,
+        agents: Sequence[AgentDetail],
+        default_agent: str,
+        mode: str = "rules",
+        embedding_model: str = HASHING_EMBEDDER,
+        semantic_threshold: float = DEFAULT_SEMANTIC_THRESHOLD,
+    ):
+        if mode not in ROUTER_MODES:
+            raise ValueError(f"Unknown router mode '{mode}', expected one of {ROUTER_MODES}.")
+        self.agents = list(agents)
+        self.by_name = {agent.name: agent for agent in self.agents}
+        if default_agent not in self.by_name:
+            raise ValueError(f"Default agent '{default_agent}' is not defined.")
+        self.default_agent = self.by_name[default_agent]
+        self.mode = mode
+        self.embedding_model = embedding_model
+        self.semantic_threshold = semantic_threshold
+
+        # phrase tokens -> index of the first agent it triggers
+        self._triggers: Dict[Tuple[str, ...], int] = {}
+        for index, agent in enumerate(self.agents):
+            for trigger in agent.triggers:
+                tokens = tuple(tokenize(trigger))
+                if tokens:
+                    self._triggers.setdefault(tokens, index)
+        self._max_ngram = max((len(tokens) for tokens in self._triggers), default=0)
+
+        # Computed on first semantic lookup, so rule-only routing never loads an embedder
+        self._centroid_agents: List[int] = []
+        self._centroids: Optional[np.ndarray] = None
+        self._centroids_lock = threading.Lock()
+
+    def _load_centroids(self):
+        embedder = get_embedder(self.embedding_model)
+        centroids = []
+        for index, agent in enumerate(self.agents):
+            if not agent.examples:
+                continue
+            centroid = embedder.embed(list(agent.examples)).mean(axis=0)
+            norm = np.linalg.norm(centroid)
+            if norm > 0:
+                self._centroid_agents.append(index)
+                centroids.append(centroid / norm)
+        self._centroids = np.vstack(centroids) if centroids else np.zeros((0, embedder.dim), dtype=np.float32)
+        logger.info(f"Agent router: computed centroids for {len(centroids)} agents with '{embedder.name}' embeddings.")
+
+    def match_rules(self, message: str) -> Tuple[Optional[int], Optional[str]]:
+        """Returns the index of the first-listed agent triggered by the message and the trigger, or (None, None)."""
+        tokens = tokenize(message)
+        best, matched = None, None
+        for start in range(len(tokens)):
+            for length in range(1, min(self._max_ngram, len(tokens) - start) + 1):
+                ngram = tuple(tokens[start:start + length])
+                index = self._triggers.get(ngram)
+                if index is not None and (best is None or index < best):
+                    best, matched = index, " ".join(ngram)
+        return best, matched
+
+    def match_semantic(self, messages: List[str]) -> List[Tuple[Optional[int], float]]:
+        """Returns the index of the closest agent centroid and its cosine similarity for each message."""
+        with self._centroids_lock:
+            if self._centroids is None:
+                self._load_centroids()
+        if not messages or not len(self._centroids):
+            return [(None, 0.0)] * len(messages)
+        scores = get_embedder(self.embedding_model).embed(messages) @ self._centroids.T
+        best = scores.argmax(axis=1)
+        return [(self._centroid_agents[column], float(scores[row, column])) for row, column in enumerate(best)]
+
+    def classify(self, messages: List[str], mode: Optional[str] = None) -> List[models.AgentRouteResult]:
+        """Routes a batch of messages, recording for each how its agent was chosen."""
+        mode = mode or self.mode
+        if mode not in ROUTER_MODES:
+            raise ValueError(f"Unknown router mode '{mode}', expected one of {ROUTER_MODES}.")
+        results: List[Optional[models.AgentRouteResult]] = [None] * len(messages)
+        unmatched = []
+        for position, message in enumerate(messages):
+            index, trigger = self.match_rules(message) if mode != "semantic" else (None, None)
+            if index is not None:
+                results[position] = models.AgentRouteResult(agent=self.agents[index].name, method="rule", trigger=trigger)
+            else:
+                unmatched.append(position)
+        if mode != "rules" and unmatched:
+            for position, (index, score) in zip(unmatched, self.match_semantic([messages[p] for p in unmatched])):
+                if index is not None and score >= self.semantic_threshold:
+                    results[position] = models.AgentRouteResult(agent=self.agents[index].name, method="semantic", score=score)
+                else:
+                    results[position] = models.AgentRouteResult(agent=self.default_agent.name, method="default", score=score)
+        return [result or models.AgentRouteResult(agent=self.default_agent.name, method="default") for result in results]
+
+    def route(self, message: str, requested_agent: Optional[str] = None) -> AgentDetail:
+        """Returns the requested agent if it exists, otherwise the agent the router picks for the message."""
+        if requested_agent and requested_agent in self.by_name:
+            return self.by_name[requested_agent]
+        return self.by_name[self.classify([message])[0].agent]
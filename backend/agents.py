@@ -1,30 +1,93 @@
 """
 Agent definitions and routing logic for the MCP Server.
+
+Agents are routed by their `triggers` and `examples` (see agent_router.py).
+More agents can be added without code changes by listing them in a JSON file
+named by the AGENTS_FILE environment variable; an agent there with the name of
+a built-in agent replaces it.
 """
-import re
+import os
+import json
+import logging
 from typing import List, Optional
 
 from models import AgentDetail
+from agent_router import AgentRouter, DEFAULT_SEMANTIC_THRESHOLD
+from knowledge.embeddings import HASHING_EMBEDDER
+
+logger = logging.getLogger(__name__)
 
-# Agent Definitions
+DEFAULT_AGENT = "Generalist"
+AGENTS_FILE = os.environ.get("AGENTS_FILE")
+AGENT_ROUTER_MODE = os.environ.get("AGENT_ROUTER_MODE", "rules")  # "rules", "semantic" or "hybrid"
+AGENT_ROUTER_EMBEDDING_MODEL = os.environ.get("AGENT_ROUTER_EMBEDDING_MODEL", HASHING_EMBEDDER)
+AGENT_ROUTER_THRESHOLD = float(os.environ.get("AGENT_ROUTER_THRESHOLD", str(DEFAULT_SEMANTIC_THRESHOLD)))
+
+# Agent Definitions. When several agents' triggers match, the one listed first wins.
 AGENTS = {
     "Generalist": AgentDetail(
         name="Generalist",
         description="A helpful general assistant for everyday questions.",
         system_prompt="You are a helpful general assistant. Be friendly and concise.",
+        tools=["current_time", "calculator"],
+        examples=[
+            "hello, how are you today",
+            "what time is it",
+            "write a short poem about autumn",
+            "give me some advice for my trip",
+            "thanks, that was helpful",
+        ],
     ),
     "MathWhiz": AgentDetail(
         name="MathWhiz",
         description="A specialist for solving mathematical problems.",
         system_prompt="You are a mathematical genius. You must use the calculator tool to solve problems.",
+        tools=["calculator"],
+        triggers=["calculate", "plus", "minus", "times", "divided by", "+", "-", "*", "/"],
+        examples=[
+            "calculate 12 times 7",
+            "what is 144 divided by 12",
+            "add 250 plus 375",
+            "subtract 19 minus 4",
+            "solve 3 * 9 + 2",
+        ],
     ),
     "WebResearcher": AgentDetail(
         name="WebResearcher",
         description="A specialist for finding information on the web.",
         system_prompt="You are a diligent web researcher. You must use the web_search tool to find information.",
+        tools=["web_search", "calculator", "current_time"],
+        triggers=["search", "find", "what is", "who is", "tell me about"],
+        examples=[
+            "search the web for the latest news",
+            "who is the president of France",
+            "find information about electric cars",
+            "tell me about the history of Rome",
+            "look up reviews of this laptop",
+        ],
     ),
 }
 
+def load_agents_file(path: str):
+    """Adds the agents listed in a JSON file to AGENTS, replacing built-in agents of the same name."""
+    with open(path, "r", encoding="utf-8") as f:
+        for entry in json.load(f):
+            agent = AgentDetail(**entry)
+            AGENTS[agent.name] = agent
+    logger.info(f"Loaded agents from {path}; {len(AGENTS)} agents are defined.")
+
+if AGENTS_FILE:
+    load_agents_file(AGENTS_FILE)
+
+# Trigger phrases of all agents are compiled into a single matcher
+router = AgentRouter(
+    list(AGENTS.values()),
+    default_agent=DEFAULT_AGENT,
+    mode=AGENT_ROUTER_MODE,
+    embedding_model=AGENT_ROUTER_EMBEDDING_MODEL,
+    semantic_threshold=AGENT_ROUTER_THRESHOLD,
+)
+
 def get_agents_list() -> List[AgentDetail]:
     """Returns a list of all available agent details."""
     return list(AGENTS.values())
@@ -33,13 +96,4 @@ def select_agent(message: str, requested_agent: Optional[str] = None) -> AgentDe
     """
     Selects the appropriate agent based on the user's message or request.
     """
-    if requested_agent and requested_agent in AGENTS:
-        return AGENTS[requested_agent]
-
-    # Simple rule-based routing
-    if re.search(r'\b(calculate|plus|minus|times|divided by|\+|\-|\*|\/)\b', message, re.IGNORECASE):
-        return AGENTS["MathWhiz"]
-    if re.search(r'\b(search|find|what is|who is|tell me about)\b', message, re.IGNORECASE):
-        return AGENTS["WebResearcher"]
-
-    return AGENTS["Generalist"]
+    return router.route(message, requested_agent)
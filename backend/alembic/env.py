@@ -19,6 +19,11 @@ if config.config_file_name is not None:
 # add your model's MetaData object here
 # for 'autogenerate' support
 from sql_models import Base
+from database import SQLALCHEMY_DATABASE_URL
+
+# Migrate the database the application uses (the DATABASE_URL environment variable, or
+# the default SQLite file) rather than a URL of its own
+config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
 target_metadata = Base.metadata
 
 # other values from the config, defined by the needs of env.py,
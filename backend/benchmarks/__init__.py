@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Guruji backend. Run them from the backend directory, e.g.
+`python -m benchmarks.ann_recall --help`.
+"""
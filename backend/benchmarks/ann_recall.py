@@ -0,0 +1,137 @@
+"""
+Recall@k vs. latency benchmark for the IVF index against exact search.
+
+Builds (or reuses) a vector index, then for every nlist/nprobe combination
+reports build time, recall@k relative to exact search, per-query latency
+percentiles and throughput, so that settings can be chosen per KB size:
+
+    python -m benchmarks.ann_recall --rows 500000 --dim 384 --nlist 1024,2048 --nprobe 4,8,16,32
+
+Pass `--kb-path` to benchmark an existing knowledge base index instead of
+synthetic clustered data. The index files are never modified in that case;
+the IVF index is built in a temporary copy.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from knowledge import ann_index
+from knowledge.manifest import index_path
+from knowledge.ann_index import sync_ivf_index, open_ivf_index, IVF_DIR
+from knowledge.vector_index import VectorIndexWriter, open_index, META_FILE, VECTORS_FILE, CHUNKS_FILE, CHUNK_INDEX_FILE
+
+
+def synthetic_index(path: str, rows: int, dim: int, clusters: int, seed: int):
+    """Writes `rows` unit vectors drawn from a Gaussian mixture to a new index."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    writer = VectorIndexWriter(path, dim, "synthetic")
+    batch = 65536
+    for start in range(0, rows, batch):
+        n = min(batch, rows - start)
+        vectors = centers[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        writer.add(vectors, [{"source": "synthetic", "chunk": start + i, "text": ""} for i in range(n)])
+    writer.close()
+
+
+def sample_queries(index, count: int, seed: int) -> np.ndarray:
+    """Perturbed copies of random indexed vectors, so queries resemble real traffic."""
+    rng = np.random.default_rng(seed + 1)
+    rows = np.sort(rng.choice(index.count, count, replace=False))
+    queries = np.asarray(index._vectors[rows]) + 0.1 * rng.standard_normal((count, index.dim)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_queries(search, queries: np.ndarray):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(search(query[None, :])[1][0])
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.array(results), np.array(latencies)
+
+
+def summarize(latencies: np.ndarray):
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "qps": float(1000 * len(latencies) / latencies.sum()),
+    }
+
+
+def recall(approx: np.ndarray, exact: np.ndarray) -> float:
+    hits = sum(len(set(a[a >= 0]) & set(e)) for a, e in zip(approx, exact))
+    return hits / exact.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kb-path", help="Benchmark an existing knowledge base index directory.")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=256, help="Mixture components of the synthetic data.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", default="", help="Comma-separated list counts; defaults to the automatic choice.")
+    parser.add_argument("--nprobe", default="1,4,8,16,32,64")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="ann-bench-")
+    try:
+        if args.kb_path:
+            for name in (META_FILE, VECTORS_FILE, CHUNKS_FILE, CHUNK_INDEX_FILE):
+                os.symlink(os.path.abspath(os.path.join(index_path(args.kb_path), name)), os.path.join(workdir, name))
+        else:
+            print(f"Building a synthetic index of {args.rows} x {args.dim} vectors...")
+            synthetic_index(workdir, args.rows, args.dim, args.clusters, args.seed)
+        index = open_index(workdir)
+        ann_index.MIN_TRAIN_ROWS = min(ann_index.MIN_TRAIN_ROWS, index.count)
+        queries = sample_queries(index, min(args.queries, index.count), args.seed)
+
+        exact_rows, exact_latencies = time_queries(lambda q: index.search(q, args.k), queries)
+        report = {"rows": index.count, "dim": index.dim, "k": args.k, "exact": summarize(exact_latencies), "ivf": []}
+        print(f"\n{index.count} rows, {index.dim} dims, k={args.k}")
+        print(f"exact: p50 {report['exact']['p50_ms']:.2f} ms, p95 {report['exact']['p95_ms']:.2f} ms, {report['exact']['qps']:.0f} qps\n")
+        print(f"{'nlist':>7} {'build s':>8} {'nprobe':>7} {'recall':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'qps':>8} {'speedup':>8}")
+
+        nlists = [int(n) for n in args.nlist.split(",") if n] or [None]
+        for nlist in nlists:
+            shutil.rmtree(os.path.join(workdir, IVF_DIR), ignore_errors=True)
+            started = time.perf_counter()
+            meta = sync_ivf_index(workdir, nlist, seed=args.seed)
+            build_seconds = time.perf_counter() - started
+            ivf = open_ivf_index(workdir, index)
+            for nprobe in (int(n) for n in args.nprobe.split(",") if n):
+                if nprobe > meta["nlist"]:
+                    continue
+                rows, latencies = time_queries(lambda q: ivf.search(q, args.k, nprobe), queries)
+                stats = summarize(latencies)
+                stats.update(nlist=meta["nlist"], nprobe=nprobe, build_seconds=build_seconds, recall=recall(rows, exact_rows))
+                report["ivf"].append(stats)
+                print(
+                    f"{meta['nlist']:>7} {build_seconds:>8.2f} {nprobe:>7} {stats['recall']:>7.3f} {stats['p50_ms']:>8.2f} "
+                    f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['qps']:>8.0f} "
+                    f"{report['exact']['p50_ms'] / stats['p50_ms']:>7.1f}x"
+                )
+
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,444 @@
+"""
+Load and latency benchmark of the API and MCP endpoints.
+
+Runs scripted workloads against `main.app`, either in-process through httpx's
+ASGI transport or over a real socket against uvicorn in a subprocess:
+
+*   chat-<agent>: POST /chat turns routed to each agent. Every message is
+    unique, so the response cache never answers and each turn runs its tools;
+*   history-<n>: GET /history pages (50 messages, newest first) of a session
+    holding n messages;
+*   tools-list: GET /tools;
+*   kb-crud: create, read, update and delete of a knowledge base;
+*   mcp-tools-call: MCP `tools/call` of the calculator over /mcp/mcp.
+
+For each workload it reports operations per second, p50/p95/p99 latency and
+the database queries per operation, counted on the server's engines:
+
+    python -m benchmarks.api --transport asgi,uvicorn --requests 200 --concurrency 10 --json results.json
+
+With `--baseline`, the results are compared with the `--json` output of an
+earlier run. The run fails (exit status 1) if a workload's p95 latency or
+throughput got worse by more than `--tolerance`, or it issues more queries or
+fails more operations than before.
+
+A temporary SQLite database is used unless `--url` is given.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# database.py reads DATABASE_URL when it is imported, so the application
+# modules are only imported once the benchmark database is known.
+
+HISTORY_PAGE_SIZE = 50
+MCP_HEADERS = {"Accept": "application/json, text/event-stream", "Content-Type": "application/json"}
+KB_SETTINGS = {
+    "vector_store": "flat",
+    "allowed_file_types": [".txt"],
+    "parsing_library": "plain",
+    "embedding_model": "hashing",
+    "chunking_strategy": "fixed",
+    "chunk_size": 500,
+    "chunk_overlap": 50,
+    "metadata_strategy": "none",
+}
+
+
+class QueryCounter:
+    """Counts the statements executed on a set of SQLAlchemy engines."""
+
+    def __init__(self, engines):
+        from sqlalchemy import event
+
+        self.count = 0
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def instrument_app():
+    """Imports the application, quietens its request logging and adds GET /benchmark/queries."""
+    import main
+    from database import engine, async_engine
+
+    logging.getLogger().setLevel(logging.WARNING)
+    counter = QueryCounter([engine, async_engine.sync_engine])
+    main.app.add_api_route("/benchmark/queries", lambda: {"queries": counter.count}, include_in_schema=False)
+    return main.app
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/benchmark/queries", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"The server did not start at {url}.")
+
+
+# --- Workloads ---
+# Each workload has a setup, run once before it is timed, and an operation,
+# run `--warmup` times untimed and then `--requests` times by `--concurrency`
+# workers. Operations raise on failure.
+
+async def create_user(client: httpx.AsyncClient, name: str) -> Dict[str, str]:
+    username = f"{name}-{os.urandom(4).hex()}"
+    (await client.post("/signup", json={"name": name, "username": username, "email": f"{username}@example.com", "password": "benchmark"})).raise_for_status()
+    response = await client.post("/login", json={"login_identifier": username, "password": "benchmark"})
+    response.raise_for_status()
+    login = response.json()
+    return {"user_id": login["user_id"], "authorization": f"Bearer {login['access_token']}"}
+
+
+async def new_session(client: httpx.AsyncClient, user: Dict[str, str]) -> str:
+    response = await client.post("/new-session", headers={"Authorization": user["authorization"]})
+    response.raise_for_status()
+    return response.json()["session_id"]
+
+
+def chat_workload(agent: Dict[str, Any], concurrency: int):
+    messages = agent["examples"] or [f"Hello {agent['name']}"]
+
+    async def setup(client):
+        user = await create_user(client, "bench-chat")
+        return {"user": user, "sessions": [await new_session(client, user) for _ in range(concurrency)]}
+
+    async def operation(client, state, i):
+        response = await client.post("/chat", headers={"Authorization": state["user"]["authorization"]}, json={
+            "session_id": state["sessions"][i % concurrency],
+            "message": f"{messages[i % len(messages)]} (request {i})",
+            "agent": agent["name"],
+            "provider": "none",
+            "model": "none",
+            "temperature": 0.0,
+            "max_tokens": 256,
+            "timeout": 30,
+            "max_retries": 0,
+        })
+        response.raise_for_status()
+
+    return setup, operation
+
+
+def history_workload(messages: int):
+    async def setup(client):
+        import sql_models as sql_models
+        from database import SessionLocal
+
+        user = await create_user(client, "bench-history")
+        session_id = await new_session(client, user)
+        start = datetime.utcnow() - timedelta(days=1)
+        with SessionLocal() as db:
+            db.bulk_save_objects([
+                sql_models.ChatMessage(
+                    user_id=user["user_id"],
+                    session_id=session_id,
+                    role="user" if i % 2 == 0 else "assistant",
+                    content=f"Message {i} of the benchmark conversation.",
+                    tool_calls=[],
+                    timestamp=start + timedelta(seconds=i),
+                )
+                for i in range(messages)
+            ])
+            db.commit()
+        return {"session_id": session_id}
+
+    async def operation(client, state, i):
+        response = await client.get(f"/history/{state['session_id']}", params={"limit": HISTORY_PAGE_SIZE, "order": "desc"})
+        response.raise_for_status()
+
+    return setup, operation
+
+
+def tools_list_workload():
+    async def setup(client):
+        return {}
+
+    async def operation(client, state, i):
+        (await client.get("/tools")).raise_for_status()
+
+    return setup, operation
+
+
+def kb_crud_workload():
+    async def setup(client):
+        return await create_user(client, "bench-kb")
+
+    async def operation(client, state, i):
+        kb = dict(KB_SETTINGS, user_id=state["user_id"], kb_name=f"bench-kb-{i}")
+        response = await client.post("/kb/create", json=kb)
+        response.raise_for_status()
+        kb_id = response.json()["id"]
+        (await client.get(f"/kb/{kb_id}")).raise_for_status()
+        (await client.put(f"/kb/{kb_id}", json=dict(kb, chunk_size=800))).raise_for_status()
+        (await client.delete(f"/kb/{kb_id}")).raise_for_status()
+
+    return setup, operation
+
+
+def mcp_result(response: httpx.Response) -> Dict[str, Any]:
+    """Returns the JSON-RPC message of an MCP response, sent as JSON or as a single SSE event."""
+    response.raise_for_status()
+    if response.headers.get("content-type", "").startswith("text/event-stream"):
+        data = [line[5:].strip() for line in response.text.splitlines() if line.startswith("data:")]
+        message = json.loads(data[-1])
+    else:
+        message = response.json()
+    if "error" in message:
+        raise RuntimeError(f"MCP error: {message['error']}")
+    return message
+
+
+def mcp_workload(concurrency: int):
+    async def setup(client):
+        sessions = []
+        for _ in range(concurrency):
+            response = await client.post("/mcp/mcp", headers=MCP_HEADERS, json={
+                "jsonrpc": "2.0", "id": 0, "method": "initialize",
+                "params": {"protocolVersion": "2025-03-26", "capabilities": {}, "clientInfo": {"name": "benchmark", "version": "1"}},
+            })
+            mcp_result(response)
+            headers = dict(MCP_HEADERS, **{"mcp-session-id": response.headers["mcp-session-id"]})
+            (await client.post("/mcp/mcp", headers=headers, json={"jsonrpc": "2.0", "method": "notifications/initialized"})).raise_for_status()
+            sessions.append(headers)
+        return {"sessions": sessions}
+
+    async def operation(client, state, i):
+        message = mcp_result(await client.post("/mcp/mcp", headers=state["sessions"][i % concurrency], json={
+            "jsonrpc": "2.0", "id": i + 1, "method": "tools/call",
+            "params": {"name": "calculator", "arguments": {"a": i, "b": 2, "op": "multiply"}},
+        }))
+        if message["result"].get("isError"):
+            raise RuntimeError(f"Tool call failed: {message['result']}")
+
+    return setup, operation
+
+
+async def build_workloads(client: httpx.AsyncClient, args) -> Dict[str, tuple]:
+    """Returns the selected workloads by name."""
+    response = await client.get("/agents")
+    response.raise_for_status()
+    workloads = {f"chat-{agent['name']}": chat_workload(agent, args.concurrency) for agent in response.json()["agents"]}
+    for size in (int(n) for n in args.history_sizes.split(",") if n):
+        workloads[f"history-{size}"] = history_workload(size)
+    workloads["tools-list"] = tools_list_workload()
+    workloads["kb-crud"] = kb_crud_workload()
+    workloads["mcp-tools-call"] = mcp_workload(args.concurrency)
+    selected = [prefix for prefix in args.workloads.split(",") if prefix]
+    return {name: workload for name, workload in workloads.items() if not selected or any(name.startswith(p) for p in selected)}
+
+
+async def query_count(client: httpx.AsyncClient) -> int:
+    response = await client.get("/benchmark/queries")
+    response.raise_for_status()
+    return response.json()["queries"]
+
+
+async def run_workload(client: httpx.AsyncClient, name: str, setup: Callable[..., Awaitable], operation: Callable[..., Awaitable], args) -> Dict[str, Any]:
+    state = await setup(client)
+    for i in range(args.requests, args.requests + args.warmup):
+        await operation(client, state, i)
+    latencies = np.zeros(args.requests)
+    failures = []
+    next_operation = iter(range(args.requests))
+
+    async def worker():
+        for i in next_operation:
+            started = time.perf_counter()
+            try:
+                await operation(client, state, i)
+            except Exception as e:
+                failures.append(f"{type(e).__name__}: {e}")
+            latencies[i] = time.perf_counter() - started
+
+    queries = await query_count(client)
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    queries = await query_count(client) - queries
+    if failures:
+        logging.warning(f"{name}: {len(failures)} operations failed, e.g. {failures[0]}")
+    return {
+        "workload": name,
+        "operations": args.requests,
+        "failures": len(failures),
+        "ops_per_s": args.requests / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "queries_per_op": queries / args.requests,
+    }
+
+
+async def run_workloads(client: httpx.AsyncClient, transport: str, args) -> List[Dict[str, Any]]:
+    results = []
+    for name, (setup, operation) in (await build_workloads(client, args)).items():
+        result = {"transport": transport}
+        result.update(await run_workload(client, name, setup, operation, args))
+        print_result(result)
+        results.append(result)
+    return results
+
+
+async def run_asgi(args) -> List[Dict[str, Any]]:
+    app = instrument_app()
+    async with app.router.lifespan_context(app):
+        # The MCP endpoint only accepts local Host headers
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://127.0.0.1:8000", timeout=120) as client:
+            return await run_workloads(client, "asgi", args)
+
+
+async def run_uvicorn(args, env: Dict[str, str]) -> List[Dict[str, Any]]:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.api", "--serve", "--port", str(port)], cwd=BACKEND_DIR, env=env)
+    try:
+        await asyncio.to_thread(wait_until_up, url)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+            return await run_workloads(client, "uvicorn", args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def serve(port: int):
+    """Runs the instrumented application with uvicorn; used by the uvicorn transport."""
+    import uvicorn
+
+    uvicorn.run(instrument_app(), host="127.0.0.1", port=port, log_level="warning")
+
+
+# --- Reporting ---
+
+def print_header():
+    print(f"{'transport':>9} {'workload':<22} {'ops/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries/op':>10} {'failed':>7}")
+
+
+def print_result(result: Dict[str, Any]):
+    print(
+        f"{result['transport']:>9} {result['workload']:<22} {result['ops_per_s']:>8.1f} {result['p50_ms']:>8.1f} "
+        f"{result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['queries_per_op']:>10.2f} {result['failures']:>7}",
+        flush=True,
+    )
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float, min_delta_ms: float) -> List[str]:
+    """
+    Returns a description of every regression against the baseline results. Latency
+    and throughput only regress if they worsen by more than `tolerance` and the time
+    per operation grows by more than `min_delta_ms`, so sub-millisecond noise is ignored.
+    """
+    previous = {(r["transport"], r["workload"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get((result["transport"], result["workload"]))
+        if before is None:
+            continue
+        label = f"{result['transport']} {result['workload']}"
+        if result["p95_ms"] > max(before["p95_ms"] * (1 + tolerance), before["p95_ms"] + min_delta_ms):
+            regressions.append(f"{label}: p95 latency {before['p95_ms']:.1f} -> {result['p95_ms']:.1f} ms")
+        # Time per operation per client, in ms
+        op_ms, before_op_ms = 1000 * baseline["concurrency"] / result["ops_per_s"], 1000 * baseline["concurrency"] / before["ops_per_s"]
+        if result["ops_per_s"] < before["ops_per_s"] * (1 - tolerance) and op_ms - before_op_ms > min_delta_ms:
+            regressions.append(f"{label}: throughput {before['ops_per_s']:.1f} -> {result['ops_per_s']:.1f} ops/s")
+        # Query counts are deterministic up to batching, so any real increase is a regression
+        if result["queries_per_op"] > before["queries_per_op"] + 0.5:
+            regressions.append(f"{label}: queries per operation {before['queries_per_op']:.2f} -> {result['queries_per_op']:.2f}")
+        if result["failures"] > before["failures"]:
+            regressions.append(f"{label}: failed operations {before['failures']} -> {result['failures']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", default="asgi,uvicorn", help="Comma-separated: asgi (in-process) and/or uvicorn (over a socket).")
+    parser.add_argument("--workloads", default="", help="Comma-separated workload name prefixes, e.g. chat,history; all by default.")
+    parser.add_argument("--requests", type=int, default=200, help="Operations per workload.")
+    parser.add_argument("--warmup", type=int, default=5, help="Untimed operations run before each workload.")
+    parser.add_argument("--concurrency", type=int, default=10, help="Concurrent clients per workload.")
+    parser.add_argument("--history-sizes", default="10,100,1000", help="Comma-separated numbers of messages in the sessions read by the history workloads.")
+    parser.add_argument("--url", help="Database URL; defaults to a temporary SQLite file.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    parser.add_argument("--baseline", help="Results of an earlier run (--json) to compare with.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative worsening of p95 latency and throughput.")
+    parser.add_argument("--min-delta-ms", type=float, default=5.0, help="Latency changes smaller than this are never regressions.")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=8000, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="api-bench-")
+    os.environ["DATABASE_URL"] = args.url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    try:
+        transports = [t for t in args.transport.split(",") if t]
+        print(f"{args.requests} operations per workload, {args.concurrency} concurrent clients")
+        print_header()
+        results = []
+        for transport in transports:
+            if transport == "asgi":
+                results += asyncio.run(run_asgi(args))
+            elif transport == "uvicorn":
+                results += asyncio.run(run_uvicorn(args, dict(os.environ)))
+            else:
+                parser.error(f"Unknown transport '{transport}'.")
+
+        report = {
+            "created_at": datetime.utcnow().isoformat(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "results": results,
+        }
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        if args.baseline:
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+            compared = {(r["transport"], r["workload"]) for r in baseline["results"]} & {(r["transport"], r["workload"]) for r in results}
+            regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+            if regressions:
+                print(f"\n{len(regressions)} regressions against {args.baseline}:")
+                for regression in regressions:
+                    print(f"  {regression}")
+                sys.exit(1)
+            print(f"\nNo regressions against {args.baseline} in the {len(compared)} workloads run by both.")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
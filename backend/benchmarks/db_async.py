@@ -0,0 +1,213 @@
+"""
+Throughput of `async def` handlers using the synchronous vs. the async database session.
+
+Simulates many concurrent chat-style requests. Each one loads a session, reads a
+page of its history, awaits a simulated upstream call (an LLM or a tool) and,
+for a fraction of requests, appends a message. It is run twice:
+
+*   sync: the queries go through `SessionLocal` directly on the event loop, as
+    the handlers did before, so every query stalls all other requests;
+*   async: the queries go through `AsyncSessionLocal`.
+
+For each mode it reports requests per second, latency percentiles and the
+worst event-loop stall seen by a 1 ms ticker:
+
+    python -m benchmarks.db_async --concurrency 50,200,500 --requests 5000
+
+By default a temporary SQLite database is created and seeded. Pass `--url` to
+run against another database (its async driver, e.g. asyncpg, must be installed);
+the tables are created there if missing, and seeded rows are left in place.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sql_models as sql_models
+from database import Base, async_database_url
+
+PAGE_SIZE = 50
+
+
+def seed(url: str, sessions: int, messages: int):
+    """Creates the tables and `sessions` chat sessions of `messages` messages each. Returns the session ids and user id."""
+    engine = create_engine(url)
+    Base.metadata.create_all(engine)
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    with sessionmaker(bind=engine)() as db:
+        user = sql_models.user_registry(name="bench", username=f"bench-{uuid.uuid4().hex[:8]}", email="bench@example.com", password="-")
+        db.add(user)
+        db.flush()
+        start = datetime.utcnow() - timedelta(days=1)
+        for session_id in session_ids:
+            db.add(sql_models.ChatSession(user_id=user.id, session_id=session_id, title="Benchmark"))
+        db.flush()
+        for session_id in session_ids:
+            db.bulk_save_objects([
+                sql_models.ChatMessage(
+                    user_id=user.id,
+                    session_id=session_id,
+                    role="user" if i % 2 == 0 else "assistant",
+                    content=f"Message {i} of the benchmark conversation.",
+                    tool_calls=[],
+                    timestamp=start + timedelta(seconds=i),
+                )
+                for i in range(messages)
+            ])
+        db.commit()
+        user_id = user.id
+    engine.dispose()
+    return session_ids, user_id
+
+
+def history_page(session_id: str):
+    message = sql_models.ChatMessage
+    return (
+        select(message.id, message.role, message.content, message.timestamp)
+        .where(message.session_id == session_id)
+        .order_by(message.timestamp.desc(), message.id.desc())
+        .limit(PAGE_SIZE)
+    )
+
+
+def new_message(session_id: str, user_id) -> sql_models.ChatMessage:
+    return sql_models.ChatMessage(user_id=user_id, session_id=session_id, role="user", content="benchmark", tool_calls=[])
+
+
+# Both request kinds release their connection before the simulated upstream call: a
+# coroutine holding a pooled sync connection across an await can exhaust the pool and
+# then block the event loop waiting for a connection that can never be returned.
+
+async def sync_request(factory, session_id: str, user_id, write: bool, io_seconds: float):
+    # The old handlers: blocking queries inside a coroutine
+    with factory() as db:
+        db.execute(select(sql_models.ChatSession).where(sql_models.ChatSession.session_id == session_id)).scalars().first()
+        db.execute(history_page(session_id)).all()
+    await asyncio.sleep(io_seconds)
+    if write:
+        with factory() as db:
+            db.add(new_message(session_id, user_id))
+            db.commit()
+
+
+async def async_request(factory, session_id: str, user_id, write: bool, io_seconds: float):
+    async with factory() as db:
+        (await db.execute(select(sql_models.ChatSession).where(sql_models.ChatSession.session_id == session_id))).scalars().first()
+        (await db.execute(history_page(session_id))).all()
+    await asyncio.sleep(io_seconds)
+    if write:
+        async with factory() as db:
+            db.add(new_message(session_id, user_id))
+            await db.commit()
+
+
+async def run_load(request, factory, session_ids, user_id, args, concurrency: int):
+    rng = random.Random(args.seed)
+    plan = [(rng.choice(session_ids), rng.random() < args.write_ratio) for _ in range(args.requests)]
+    latencies = np.zeros(len(plan))
+    next_request = iter(range(len(plan)))
+    stalls = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    async def worker():
+        for i in next_request:
+            session_id, write = plan[i]
+            started = time.perf_counter()
+            await request(factory, session_id, user_id, write, args.io_ms / 1000)
+            latencies[i] = time.perf_counter() - started
+
+    tick = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await tick
+    return {
+        "concurrency": concurrency,
+        "rps": len(plan) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p95_ms": float(np.percentile(latencies, 95) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "max_loop_stall_ms": float(max(stalls, default=0.0) * 1000),
+    }
+
+
+async def run_async_mode(url: str, session_ids, user_id, args, concurrency: int):
+    engine = create_async_engine(async_database_url(url), pool_size=args.pool_size, max_overflow=0, pool_timeout=300)
+    try:
+        factory = async_sessionmaker(engine, expire_on_commit=False)
+        return await run_load(async_request, factory, session_ids, user_id, args, concurrency)
+    finally:
+        await engine.dispose()
+
+
+async def run_sync_mode(url: str, session_ids, user_id, args, concurrency: int):
+    engine = create_engine(url, pool_size=args.pool_size, max_overflow=0, pool_timeout=300)
+    try:
+        factory = sessionmaker(bind=engine, expire_on_commit=False)
+        return await run_load(sync_request, factory, session_ids, user_id, args, concurrency)
+    finally:
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Database URL with a sync driver; defaults to a temporary SQLite file.")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=500, help="Messages per seeded session.")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", default="10,100,500", help="Comma-separated numbers of concurrent clients.")
+    parser.add_argument("--io-ms", type=float, default=20.0, help="Simulated upstream latency per request.")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--pool-size", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="db-bench-")
+    url = args.url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    try:
+        print(f"Seeding {args.sessions} sessions x {args.messages} messages...")
+        session_ids, user_id = seed(url, args.sessions, args.messages)
+        report = {"url": make_url(url).render_as_string(hide_password=True), "requests": args.requests, "io_ms": args.io_ms, "write_ratio": args.write_ratio, "runs": []}
+        print(f"\n{args.requests} requests, {args.io_ms:g} ms simulated upstream latency, {args.write_ratio:.0%} writes")
+        print(f"{'mode':>6} {'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'loop stall ms':>14}")
+        for concurrency in (int(n) for n in args.concurrency.split(",") if n):
+            for mode, run in (("sync", run_sync_mode), ("async", run_async_mode)):
+                stats = asyncio.run(run(url, session_ids, user_id, args, concurrency))
+                stats["mode"] = mode
+                report["runs"].append(stats)
+                print(
+                    f"{mode:>6} {stats['concurrency']:>8} {stats['rps']:>9.0f} {stats['p50_ms']:>9.1f} "
+                    f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['max_loop_stall_ms']:>14.1f}"
+                )
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
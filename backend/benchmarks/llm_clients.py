@@ -0,0 +1,148 @@
+"""
+Streaming throughput of the model provider clients against the local mock provider.
+
+Starts `llm.mock_server` in a subprocess and streams `--requests` completions at
+each `--concurrency`, twice:
+
+*   pooled: every request goes through one shared ProviderClient, as the chat
+    endpoints do, so connections are reused;
+*   per-request: every request creates (and closes) its own client, as code that
+    opens an HTTP client per call would.
+
+For each run it reports completions per second, time-to-first-token and total
+latency percentiles, retries and failures:
+
+    python -m benchmarks.llm_clients --concurrency 10,100,500 --requests 2000 --error-rate 0.02
+
+Against the local mock server a new connection costs a TCP handshake only; against
+a real provider it also costs a TLS handshake, so the gap is wider there.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models as models
+from llm.clients import OpenAIClient
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 20.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/stats", timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    raise RuntimeError(f"The mock provider did not start at {url}.")
+
+
+async def run_load(mode: str, base_url: str, args, concurrency: int):
+    shared = OpenAIClient("Mock", f"{base_url}/v1", max_concurrency=concurrency, requires_api_key=False)
+    request = models.CompletionRequest(
+        provider="Mock",
+        model="mock",
+        messages=[models.LLMMessage(role="user", content="Benchmark the provider client.")],
+        max_tokens=args.tokens,
+        timeout=30,
+        max_retries=args.max_retries,
+    )
+    first_token, total = [], []
+    failures = retries = 0
+    pending = iter(range(args.requests))
+
+    async def worker():
+        nonlocal failures, retries
+        for _ in pending:
+            client = shared if mode == "pooled" else OpenAIClient("Mock", f"{base_url}/v1", max_concurrency=1, requires_api_key=False)
+            started = time.perf_counter()
+            first = None
+            try:
+                async for _ in client.stream(request):
+                    if first is None:
+                        first = time.perf_counter() - started
+                first_token.append(first or 0.0)
+                total.append(time.perf_counter() - started)
+            except Exception:
+                failures += 1
+            finally:
+                if client is not shared:
+                    retries += client.retries
+                    await client.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    retries += shared.retries
+    await shared.close()
+    first_token, total = np.array(first_token), np.array(total)
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "rps": len(total) / elapsed,
+        "ttft_p50_ms": float(np.percentile(first_token, 50) * 1000) if len(total) else None,
+        "ttft_p95_ms": float(np.percentile(first_token, 95) * 1000) if len(total) else None,
+        "total_p50_ms": float(np.percentile(total, 50) * 1000) if len(total) else None,
+        "total_p95_ms": float(np.percentile(total, 95) * 1000) if len(total) else None,
+        "retries": retries,
+        "failures": failures,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", default="10,100,500", help="Comma-separated numbers of concurrent streams.")
+    parser.add_argument("--tokens", type=int, default=20, help="Tokens per completion.")
+    parser.add_argument("--first-token-ms", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=2.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests the mock rejects with 503.")
+    parser.add_argument("--max-retries", type=int, default=2)
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "llm.mock_server", "--port", str(port), "--tokens", str(args.tokens),
+         "--first-token-ms", str(args.first_token_ms), "--token-ms", str(args.token_ms), "--error-rate", str(args.error_rate)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    try:
+        wait_until_up(base_url)
+        report = {"requests": args.requests, "tokens": args.tokens, "first_token_ms": args.first_token_ms, "error_rate": args.error_rate, "runs": []}
+        print(f"{args.requests} streamed completions of {args.tokens} tokens, {args.first_token_ms:g} ms to first token, {args.error_rate:.0%} errors")
+        print(f"{'mode':>12} {'streams':>8} {'req/s':>8} {'ttft p50':>9} {'ttft p95':>9} {'p50 ms':>8} {'p95 ms':>8} {'retries':>8} {'failed':>7}")
+        for concurrency in (int(n) for n in args.concurrency.split(",") if n):
+            for mode in ("pooled", "per-request"):
+                stats = asyncio.run(run_load(mode, base_url, args, concurrency))
+                report["runs"].append(stats)
+                print(
+                    f"{mode:>12} {concurrency:>8} {stats['rps']:>8.0f} {stats['ttft_p50_ms'] or 0:>9.1f} {stats['ttft_p95_ms'] or 0:>9.1f} "
+                    f"{stats['total_p50_ms'] or 0:>8.1f} {stats['total_p95_ms'] or 0:>8.1f} {stats['retries']:>8} {stats['failures']:>7}"
+                )
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
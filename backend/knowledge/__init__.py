@@ -0,0 +1,4 @@
+"""
+Knowledge base subsystem: document parsing, chunking, embedding and the
+on-disk indexes that back retrieval for the chat agents.
+"""
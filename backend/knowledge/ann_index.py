@@ -0,0 +1,254 @@
+"""
+Inverted-file (IVF) approximate nearest-neighbour index for large knowledge bases.
+
+The vectors are partitioned into `nlist` clusters by spherical k-means. A search
+scores the query against the cluster centroids, then scores exactly only the rows
+of the `nprobe` closest clusters. Build and search parameters are set through the
+knowledge base's `vector_store` field, e.g. "ivf" or "ivf:nlist=1024,nprobe=16".
+
+The index lives in `<kb path>/ivf` next to the exact index it accelerates and
+reuses its memory-mapped vectors. It stores the centroids plus one cluster id per
+row in an append-only file, so newly ingested rows are inserted incrementally
+without retraining. Rows that have not been assigned yet are scored exactly, so
+search results always cover the whole index.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from knowledge.vector_index import VectorIndex, open_index, write_meta
+
+logger = logging.getLogger(__name__)
+
+IVF_DIR = "ivf"
+IVF_META_FILE = "meta.json"
+DEFAULT_NPROBE = 8
+MIN_TRAIN_ROWS = 2048  # smaller indexes are searched exactly
+MAX_TRAIN_SAMPLE = 100_000
+KMEANS_ITERATIONS = 20
+RETRAIN_GROWTH = 8  # retrain once the index is this many times larger than at training
+ASSIGN_BLOCK_ROWS = 65536
+
+
+def parse_vector_store(vector_store: Optional[str]) -> Tuple[str, Dict[str, int]]:
+    """
+    Splits a `vector_store` setting into an index kind and its parameters.
+
+    "ivf:nlist=1024,nprobe=16" -> ("ivf", {"nlist": 1024, "nprobe": 16}). Any
+    setting other than "ivf" selects exact search.
+    """
+    kind, _, options = (vector_store or "").strip().lower().partition(":")
+    params: Dict[str, int] = {}
+    for option in filter(None, (part.strip() for part in options.split(","))):
+        key, _, value = option.partition("=")
+        try:
+            params[key.strip()] = int(value)
+        except ValueError:
+            logger.warning(f"Ignoring invalid vector store option '{option}'.")
+    return ("ivf" if kind == "ivf" else "exact"), params
+
+
+def default_nlist(rows: int) -> int:
+    """A cluster count that keeps both the centroid scan and the probed lists small."""
+    return int(min(65536, max(16, 4 * np.sqrt(rows))))
+
+
+def train_kmeans(sample: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Returns `nlist` unit-norm centroids fitted to `sample` with spherical k-means."""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(sample))
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        # Re-seed empty clusters with random sample points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        centroids = (sums / np.maximum(norms, 1e-12)).astype(np.float32)
+    return centroids
+
+
+def _assign(centroids: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BLOCK_ROWS):
+        block = np.asarray(vectors[start:start + ASSIGN_BLOCK_ROWS])
+        assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def _read_ivf_meta(ivf_path: str) -> Optional[Dict[str, Any]]:
+    meta_path = os.path.join(ivf_path, IVF_META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+_sync_locks: Dict[str, threading.Lock] = {}
+_sync_locks_lock = threading.Lock()
+
+
+def sync_ivf_index(path: str, nlist: Optional[int] = None, seed: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    Brings the IVF index at `path` up to date with the exact index.
+
+    Trains the centroids when the index is first large enough (or has grown
+    RETRAIN_GROWTH times since training, or `nlist` changed), and otherwise only
+    assigns rows added since the last sync. Each training writes a new generation
+    of files, and swapping `meta.json` makes it visible atomically.
+    """
+    with _sync_locks_lock:
+        lock = _sync_locks.setdefault(path, threading.Lock())
+    with lock:
+        return _sync_ivf_index(path, nlist, seed)
+
+
+def _sync_ivf_index(path: str, nlist: Optional[int], seed: int) -> Optional[Dict[str, Any]]:
+    index = open_index(path)
+    if index is None or index.count < MIN_TRAIN_ROWS:
+        return None
+    ivf_path = os.path.join(path, IVF_DIR)
+    os.makedirs(ivf_path, exist_ok=True)
+    meta = _read_ivf_meta(ivf_path)
+
+    wanted_nlist = nlist or default_nlist(index.count)
+    retrain = (
+        meta is None
+        or meta["dim"] != index.dim
+        or (nlist is not None and meta["nlist"] != nlist)
+        or index.count >= RETRAIN_GROWTH * meta["trained_rows"]
+    )
+
+    if retrain:
+        started = time.monotonic()
+        generation = (meta["generation"] + 1) if meta else 1
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(index.count, min(index.count, MAX_TRAIN_SAMPLE), replace=False))
+        centroids = train_kmeans(np.asarray(index._vectors[sample_rows]), wanted_nlist, seed=seed)
+        assignments = _assign(centroids, index._vectors)
+        centroids.tofile(os.path.join(ivf_path, f"centroids.{generation}.f32"))
+        assignments.tofile(os.path.join(ivf_path, f"assignments.{generation}.i32"))
+        new_meta = {
+            "generation": generation,
+            "dim": index.dim,
+            "nlist": len(centroids),
+            "trained_rows": index.count,
+            "assigned": index.count,
+        }
+        write_meta(ivf_path, new_meta)
+        if meta:
+            for name in (f"centroids.{meta['generation']}.f32", f"assignments.{meta['generation']}.i32"):
+                try:
+                    os.remove(os.path.join(ivf_path, name))
+                except FileNotFoundError:
+                    pass
+        logger.info(
+            f"Trained IVF index for '{path}': {len(centroids)} lists over {index.count} rows "
+            f"in {time.monotonic() - started:.2f}s."
+        )
+        return new_meta
+
+    if meta["assigned"] < index.count:
+        centroids = np.fromfile(os.path.join(ivf_path, f"centroids.{meta['generation']}.f32"), dtype=np.float32)
+        centroids = centroids.reshape(meta["nlist"], meta["dim"])
+        assignments = _assign(centroids, index._vectors[meta["assigned"]:index.count])
+        assignments_path = os.path.join(ivf_path, f"assignments.{meta['generation']}.i32")
+        with open(assignments_path, "r+b") as f:
+            # Drop assignments written by an interrupted sync before appending
+            f.truncate(meta["assigned"] * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(assignments.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        meta["assigned"] = index.count
+        write_meta(ivf_path, meta)
+    return meta
+
+
+class IVFIndex:
+    """A read-only IVF view over a VectorIndex."""
+
+    def __init__(self, path: str, index: VectorIndex, meta: Dict[str, Any]):
+        ivf_path = os.path.join(path, IVF_DIR)
+        self.index = index
+        self.nlist = meta["nlist"]
+        self.centroids = np.fromfile(
+            os.path.join(ivf_path, f"centroids.{meta['generation']}.f32"), dtype=np.float32
+        ).reshape(self.nlist, meta["dim"])
+        self.assigned = min(meta["assigned"], index.count)
+        assignments = np.fromfile(
+            os.path.join(ivf_path, f"assignments.{meta['generation']}.i32"), dtype=np.int32, count=self.assigned
+        )
+        # Rows grouped by list: rows of list i are order[offsets[i]:offsets[i + 1]]
+        self.order = np.argsort(assignments, kind="stable").astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=self.nlist))])
+
+    def search(self, queries: np.ndarray, k: int, nprobe: int = DEFAULT_NPROBE) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns approximate top-k (scores, rows) per query, best first, like
+        VectorIndex.search. Queries whose probed lists hold fewer than k rows are
+        padded with row -1.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = max(1, min(nprobe, self.nlist))
+        centroid_scores = queries @ self.centroids.T
+        probes = np.argpartition(-centroid_scores, nprobe - 1, axis=1)[:, :nprobe]
+        unassigned = np.arange(self.assigned, self.index.count, dtype=np.int64)
+
+        k = min(k, self.index.count)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows = np.concatenate([self.order[self.offsets[p]:self.offsets[p + 1]] for p in probes[i]] + [unassigned])
+            if not len(rows):
+                continue
+            rows.sort()  # sequential reads from the memory map
+            scores = np.asarray(self.index._vectors[rows]) @ query
+            top = min(k, len(rows))
+            best = np.argpartition(-scores, top - 1)[:top]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            all_scores[i, :top] = scores[best]
+            all_rows[i, :top] = rows[best]
+        return all_scores, all_rows
+
+
+_open_ivf_indexes: Dict[str, Tuple[Any, IVFIndex]] = {}
+_open_ivf_lock = threading.Lock()
+
+
+def open_ivf_index(path: str, index: VectorIndex) -> Optional[IVFIndex]:
+    """Returns a shared IVF reader for `path`, or None if the IVF index has not been trained."""
+    ivf_meta_path = os.path.join(path, IVF_DIR, IVF_META_FILE)
+    try:
+        version = (os.stat(ivf_meta_path).st_mtime_ns, id(index))
+    except FileNotFoundError:
+        return None
+    with _open_ivf_lock:
+        cached = _open_ivf_indexes.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        meta = _read_ivf_meta(os.path.join(path, IVF_DIR))
+        if meta is None or meta["dim"] != index.dim:
+            return None
+        try:
+            ivf = IVFIndex(path, index, meta)
+        except FileNotFoundError:
+            # A retrain replaced this generation meanwhile; search exactly this time
+            return None
+        _open_ivf_indexes[path] = (version, ivf)
+        return ivf
+
+
+def forget_ivf_index(path: str):
+    """Drops the shared IVF reader for `path`, e.g. before its files are deleted."""
+    with _open_ivf_lock:
+        _open_ivf_indexes.pop(path, None)
@@ -0,0 +1,102 @@
+"""
+Streaming text chunkers driven by a knowledge base's chunking settings.
+"""
+import re
+from typing import Iterable, Iterator
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+PARAGRAPH_BOUNDARY = re.compile(r"\n\s*\n")
+WHITESPACE = re.compile(r"\s+")
+
+
+def iter_fixed_size_chunks(blocks: Iterable[str], chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """Splits streamed text into windows of `chunk_size` characters overlapping by `chunk_overlap`."""
+    step = chunk_size - chunk_overlap
+    buffer = ""
+    emitted = False
+    for block in blocks:
+        buffer += block
+        while len(buffer) >= chunk_size:
+            yield buffer[:chunk_size]
+            buffer = buffer[step:]
+            emitted = True
+    # Skip a tail that only repeats the overlap of the previous chunk
+    if buffer.strip() and (not emitted or len(buffer) > chunk_overlap):
+        yield buffer
+
+
+def iter_packed_chunks(blocks: Iterable[str], boundary: re.Pattern, chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """
+    Splits streamed text on `boundary` (sentences or paragraphs) and packs the
+    pieces into chunks of up to `chunk_size` characters. Pieces longer than a chunk
+    are split with the fixed-size strategy. Consecutive chunks share up to
+    `chunk_overlap` characters of trailing pieces.
+    """
+    # Text without any boundary is cut anyway once it grows this large
+    max_pending = max(8 * chunk_size, 1 << 16)
+    current = []
+    current_len = 0
+    fresh = False  # Whether `current` holds pieces not emitted yet
+
+    def flush():
+        nonlocal current, current_len, fresh
+        chunk = " ".join(current)
+        # Carry trailing pieces into the next chunk as overlap
+        carried, carried_len = [], 0
+        for piece in reversed(current):
+            if carried_len + len(piece) > chunk_overlap:
+                break
+            carried.insert(0, piece)
+            carried_len += len(piece) + 1
+        current, current_len, fresh = carried, carried_len, False
+        return chunk
+
+    def add(piece):
+        nonlocal current_len, fresh
+        piece = WHITESPACE.sub(" ", piece).strip()
+        if not piece:
+            return
+        if len(piece) > chunk_size:
+            if fresh:
+                yield flush()
+            # The fixed-size chunks carry their own overlap
+            current.clear()
+            current_len, fresh = 0, False
+            yield from iter_fixed_size_chunks([piece], chunk_size, chunk_overlap)
+            return
+        if current_len + len(piece) > chunk_size and fresh:
+            yield flush()
+        current.append(piece)
+        current_len += len(piece) + 1
+        fresh = True
+
+    pending = ""
+    for block in blocks:
+        pending += block
+        pieces = boundary.split(pending)
+        # The last piece may continue in the next block
+        pending = pieces.pop()
+        for piece in pieces:
+            yield from add(piece)
+        if len(pending) > max_pending:
+            yield from add(pending)
+            pending = ""
+    yield from add(pending)
+    if fresh:
+        yield " ".join(current)
+
+
+def iter_chunks(blocks: Iterable[str], chunking_strategy: str, chunk_size: int, chunk_overlap: int) -> Iterator[str]:
+    """
+    Splits streamed text into chunks using the knowledge base's chunking strategy.
+
+    Supported strategies are "fixed-size" (the default), "sentence" and "paragraph".
+    """
+    chunk_size = max(1, chunk_size or 512)
+    chunk_overlap = min(max(0, chunk_overlap or 0), chunk_size - 1)
+    strategy = (chunking_strategy or "").lower()
+    if strategy == "sentence":
+        return iter_packed_chunks(blocks, SENTENCE_BOUNDARY, chunk_size, chunk_overlap)
+    if strategy == "paragraph":
+        return iter_packed_chunks(blocks, PARAGRAPH_BOUNDARY, chunk_size, chunk_overlap)
+    return iter_fixed_size_chunks(blocks, chunk_size, chunk_overlap)
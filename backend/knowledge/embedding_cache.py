@@ -0,0 +1,224 @@
+"""
+Content-addressed cache of chunk and query embeddings.
+
+The same documents are often ingested into several knowledge bases that use the
+same embedding model, so embeddings are cached by (embedding model, normalized
+text hash) rather than per knowledge base. The cache has two tiers:
+
+*   an in-memory LRU of recently used vectors, bounded in bytes,
+*   a SQLite file holding the vectors as float32 blobs, bounded in bytes by
+    evicting the least recently used entries.
+"""
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import models as models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_MEMORY_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+EVICTION_TARGET = 0.9  # fraction of the disk budget kept after an eviction
+LOOKUP_BATCH = 500  # keys per SELECT, below SQLite's bound-parameter limit
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    """Returns the cache key of a text: a hash of the model name and the whitespace- and Unicode-normalized text."""
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return hashlib.blake2b(f"{model_name}\0{normalized}".encode("utf-8"), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """A two-tier (memory, then disk) cache of embeddings with hit/miss counters."""
+
+    def __init__(
+        self,
+        path: str,
+        max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES,
+        max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+    ):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._memory_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key BLOB PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)")
+        self._disk_entries, self._disk_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = vector
+        self._memory_bytes += vector.nbytes
+        while self._memory_bytes > self.max_memory_bytes and self._memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted.nbytes
+
+    def get_many(self, keys: List[bytes], dim: int) -> Dict[bytes, np.ndarray]:
+        """Returns the cached vectors among `keys`, checking memory first and then disk."""
+        found: Dict[bytes, np.ndarray] = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                else:
+                    missing.append(key)
+            self.memory_hits += len(found)
+
+            now = int(time.time())
+            if self._conn is None:
+                missing = []
+            for start in range(0, len(missing), LOOKUP_BATCH):
+                batch = missing[start:start + LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                hits = []
+                for key, blob in rows:
+                    if len(blob) != dim * 4:
+                        continue
+                    vector = np.frombuffer(blob, dtype=np.float32)
+                    found[key] = vector
+                    self._remember(key, vector)
+                    hits.append(key)
+                self.disk_hits += len(hits)
+                if hits:
+                    self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in hits])
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model_name: str, entries: Dict[bytes, np.ndarray]):
+        """Stores freshly computed vectors, evicting the least recently used ones if the disk budget is exceeded."""
+        if not entries:
+            return
+        now = int(time.time())
+        with self._lock:
+            added_bytes = 0
+            rows = []
+            for key, vector in entries.items():
+                vector = np.ascontiguousarray(vector, dtype=np.float32)
+                self._remember(key, vector)
+                rows.append((key, model_name, vector.tobytes(), now))
+                added_bytes += vector.nbytes
+            if self._conn is None:
+                return
+            self._conn.execute("BEGIN")
+            try:
+                before = self._conn.total_changes
+                self._conn.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+                inserted = self._conn.total_changes - before
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._disk_entries += inserted
+            self._disk_bytes += added_bytes * inserted // len(rows)
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict()
+
+    def _evict(self):
+        average = self._disk_bytes / max(1, self._disk_entries)
+        count = int((self._disk_bytes - EVICTION_TARGET * self.max_disk_bytes) / max(1.0, average)) + 1
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)", (count,)
+        )
+        self._conn.execute("PRAGMA incremental_vacuum")
+        self._disk_entries, self._disk_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        self.evictions += count
+        logger.info(f"Evicted {count} embeddings from the embedding cache.")
+
+    def stats(self) -> models.EmbeddingCacheStats:
+        """Returns the cache's size and hit/miss counters."""
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return models.EmbeddingCacheStats(
+            memory_entries=len(self._memory),
+            memory_bytes=self._memory_bytes,
+            max_memory_bytes=self.max_memory_bytes,
+            disk_entries=self._disk_entries,
+            disk_bytes=self._disk_bytes,
+            max_disk_bytes=self.max_disk_bytes,
+            memory_hits=self.memory_hits,
+            disk_hits=self.disk_hits,
+            misses=self.misses,
+            hit_rate=hits / lookups if lookups else 0.0,
+            evictions=self.evictions,
+        )
+
+    def close(self):
+        """Closes the cache file; the in-memory tier stays usable, e.g. by jobs finishing in the background."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class CachedEmbedder:
+    """Wraps an embedder so that only texts missing from the cache are embedded."""
+
+    def __init__(self, embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.name = embedder.name
+        self.dim = embedder.dim
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        keys = [cache_key(self.name, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)), self.dim)
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            computed = self.embedder.embed(list(missing.values()))
+            fresh = dict(zip(missing.keys(), computed))
+            self.cache.put_many(self.name, fresh)
+            found.update(fresh)
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for row, key in enumerate(keys):
+            vectors[row] = found[key]
+        return vectors
+
+
+_cache: Optional[EmbeddingCache] = None
+
+
+def set_embedding_cache(cache: Optional[EmbeddingCache]):
+    """Routes embeddings from get_embedder through `cache` (or through no cache, if None)."""
+    global _cache
+    _cache = cache
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    return _cache
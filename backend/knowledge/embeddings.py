@@ -0,0 +1,113 @@
+"""
+Embedding models for knowledge base chunks and queries.
+
+The built-in "hashing" embedder needs nothing beyond NumPy and is always
+available. Any other `embedding_model` is loaded with sentence-transformers when
+that package is installed; otherwise the hashing embedder is used instead, and
+the name of the embedder actually used is recorded with the index so that
+queries are embedded the same way as the chunks.
+
+When an embedding cache is configured, embedders returned by get_embedder only
+compute embeddings for texts that are not already cached.
+"""
+import re
+import zlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List
+
+import numpy as np
+
+from knowledge.embedding_cache import CachedEmbedder, get_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+HASHING_EMBEDDER = "hashing"
+HASHING_DIM = 384
+TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+class Embedder(ABC):
+    """Base class for embedders that map texts to L2-normalized float32 vectors."""
+
+    name: str = ""
+    dim: int = 0
+
+    @abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Returns one row per text."""
+
+
+class HashingEmbedder(Embedder):
+    """
+    A dependency-free embedder based on feature hashing of word unigrams and bigrams.
+
+    It captures lexical rather than semantic similarity, but is deterministic,
+    fast and needs no model download.
+    """
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.name = HASHING_EMBEDDER
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        tokens = TOKEN.findall(text.lower())
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = zlib.crc32(feature.encode("utf-8"))
+                # The low bits pick the dimension, the top bit the sign
+                vectors[row, digest % self.dim] += 1.0 if digest & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """Wraps a sentence-transformers model."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model_name
+        self._model = SentenceTransformer(model_name)
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self._model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return vectors.astype(np.float32, copy=False)
+
+
+_embedders: Dict[str, Embedder] = {}
+_embedders_lock = threading.Lock()
+
+
+def get_embedder(model_name: str, cached: bool = True) -> Embedder:
+    """
+    Returns a shared embedder for the given model name, loading it on first use.
+    The embedder reads through the embedding cache if one is configured, unless
+    `cached` is False.
+    """
+    model_name = model_name or HASHING_EMBEDDER
+    with _embedders_lock:
+        embedder = _embedders.get(model_name)
+        if embedder is None:
+            if model_name == HASHING_EMBEDDER:
+                embedder = HashingEmbedder()
+            else:
+                try:
+                    embedder = SentenceTransformerEmbedder(model_name)
+                except Exception as e:
+                    logger.warning(
+                        f"Embedding model '{model_name}' is unavailable ({e}); "
+                        f"falling back to the '{HASHING_EMBEDDER}' embedder."
+                    )
+                    embedder = _embedders.get(HASHING_EMBEDDER) or HashingEmbedder()
+                    _embedders[HASHING_EMBEDDER] = embedder
+            _embedders[model_name] = embedder
+    cache = get_embedding_cache() if cached else None
+    return CachedEmbedder(embedder, cache) if cache is not None else embedder
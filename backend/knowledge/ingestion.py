@@ -0,0 +1,414 @@
+"""
+Knowledge base ingestion pipeline.
+
+Documents flow through parse -> chunk -> embed -> persist stages connected by
+bounded queues, so memory use stays flat regardless of corpus size:
+
+*   parse workers stream each document's text and cut it into chunks, spilling
+    them to disk until the document has parsed completely,
+*   embed workers turn batches of chunks into vectors,
+*   a single writer appends vectors and chunk records to the KB's vector index.
+
+Each ingestion runs as a background job whose progress can be polled. A job
+first compares the KB's sources and settings with the manifest of its current
+index generation (see knowledge.manifest), so only new, changed or re-configured
+documents are parsed and embedded.
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+import uuid
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+import models as models
+from knowledge.parsing import iter_document_text
+from knowledge.chunking import iter_chunks
+from knowledge.embeddings import get_embedder
+from knowledge.vector_index import VectorIndex, VectorIndexWriter, open_index
+from knowledge.ann_index import parse_vector_store, sync_ivf_index
+from knowledge.lexical_index import sync_lexical_index
+from knowledge.manifest import (
+    IndexPlan, chunk_config, index_path, new_generation, plan_indexing, sources_path, swap_generation, write_manifest,
+)
+
+logger = logging.getLogger(__name__)
+
+PARSE_WORKERS = 4
+EMBED_WORKERS = 2
+EMBED_BATCH_SIZE = 64
+CHUNK_QUEUE_SIZE = 1024  # chunks waiting to be embedded
+WRITE_QUEUE_SIZE = 16  # embedded batches waiting to be written
+COMMIT_INTERVAL = 2.0  # seconds between index commits
+COPY_BATCH_ROWS = 8192  # rows copied per batch when rebuilding
+MAX_CONCURRENT_JOBS = 2
+
+
+class IngestionError(Exception):
+    """Raised when an ingestion job cannot be started."""
+
+
+class IngestionJob:
+    """The state and progress counters of a single ingestion job."""
+
+    def __init__(self, kb: models.KnowledgeBase):
+        self.job_id = str(uuid.uuid4())
+        self.kb = kb
+        self.plan: Optional[IndexPlan] = None
+        self.files: List[str] = []  # paths of the documents to index, known once the job has started
+        self.failed_sources = set()
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.cancelled = False
+        self.done = threading.Event()  # set once the job has finished, failed or been cancelled
+        self.documents_done = 0
+        self.documents_failed = 0
+        self.chunks_written = 0
+        self.bytes_total = 0
+        self.created_at = datetime.utcnow()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def progress(self) -> models.IngestionJobStatus:
+        """Returns a snapshot of the job's progress and throughput."""
+        elapsed = 0.0
+        if self.started is not None:
+            elapsed = (self.finished or time.monotonic()) - self.started
+        return models.IngestionJobStatus(
+            job_id=self.job_id,
+            kb_id=self.kb.id,
+            status=self.status,
+            rebuild=self.plan.rebuild if self.plan else False,
+            documents_total=len(self.files),
+            documents_done=self.documents_done,
+            documents_failed=self.documents_failed,
+            documents_unchanged=len(self.plan.unchanged) if self.plan else 0,
+            documents_removed=len(self.plan.removed) if self.plan else 0,
+            chunks_written=self.chunks_written,
+            bytes_total=self.bytes_total,
+            elapsed_seconds=elapsed,
+            docs_per_second=self.documents_done / elapsed if elapsed else 0.0,
+            chunks_per_second=self.chunks_written / elapsed if elapsed else 0.0,
+            created_at=self.created_at,
+            error=self.error,
+        )
+
+
+def _parse_document(job: IngestionJob, doc_index: int, path: str, chunk_queue: queue.Queue):
+    """
+    Parses one document and queues its chunks, then marks the document as done.
+
+    Chunks are spilled to a temporary file in the KB's directory as they are cut,
+    and only queued once the whole document has parsed. A document that fails part
+    way through therefore leaves no rows in the index, and no document is ever held
+    in memory as a whole.
+    """
+    kb = job.kb
+    source = os.path.basename(path)
+    if job.cancelled:
+        return
+    with tempfile.TemporaryFile("w+", encoding="utf-8", dir=kb.path, prefix=".chunks-") as spill:
+        count = 0
+        try:
+            blocks = iter_document_text(path, kb.parsing_library)
+            for text in iter_chunks(blocks, kb.chunking_strategy, kb.chunk_size, kb.chunk_overlap):
+                spill.write(json.dumps(text) + "\n")
+                count += 1
+        except Exception as e:
+            logger.error(f"Ingestion job {job.job_id}: failed to parse '{source}': {e}")
+            chunk_queue.put(("failed", doc_index, 0))
+            return
+        spill.seek(0)
+        for chunk, line in enumerate(spill):
+            chunk_queue.put(("chunk", doc_index, {"source": source, "chunk": chunk, "text": json.loads(line)}))
+    chunk_queue.put(("end", doc_index, count))
+
+
+def _embed_worker(job: IngestionJob, embedder, chunk_queue: queue.Queue, write_queue: queue.Queue):
+    """Embeds chunks in batches, forwarding document markers to the writer."""
+    stop = False
+    try:
+        while not stop:
+            item = chunk_queue.get()
+            if item is None:
+                break
+            batch: List[Dict[str, Any]] = []
+            doc_indexes: List[int] = []
+            while item is not None:
+                kind, doc_index, payload = item
+                if kind == "chunk":
+                    batch.append(payload)
+                    doc_indexes.append(doc_index)
+                else:
+                    write_queue.put((kind, doc_index, payload))
+                if len(batch) >= EMBED_BATCH_SIZE:
+                    break
+                try:
+                    item = chunk_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+            if batch:
+                vectors = embedder.embed([record["text"] for record in batch])
+                write_queue.put(("batch", doc_indexes, (vectors, batch)))
+    except Exception as e:
+        job.error = f"Embedding failed: {e}"
+        logger.error(f"Ingestion job {job.job_id}: {job.error}")
+        # Keep draining so that the parse workers are never blocked on a full queue
+        while not stop and chunk_queue.get() is not None:
+            pass
+    finally:
+        write_queue.put(None)
+
+
+def sync_search_indexes(kb: models.KnowledgeBase, path: str):
+    """Adds rows new since the last sync to the ANN and lexical indexes the KB's settings call for."""
+    kind, params = parse_vector_store(kb.vector_store)
+    if kind == "ivf":
+        # Trains the ANN index once the KB is large enough
+        sync_ivf_index(path, params.get("nlist"))
+    if kb.retrieval_mode in ("bm25", "hybrid"):
+        sync_lexical_index(path)
+
+
+def _copy_documents(source: VectorIndex, writer: VectorIndexWriter, names: set) -> int:
+    """Copies the rows of the named documents into a new generation without re-embedding them."""
+    copied = 0
+    for start in range(0, source.count, COPY_BATCH_ROWS):
+        rows = range(start, min(start + COPY_BATCH_ROWS, source.count))
+        records = source.get_records(rows)
+        keep = [i for i, record in enumerate(records) if record["source"] in names]
+        if keep:
+            vectors = np.asarray(source._vectors[start:start + len(rows)])[keep]
+            writer.add(vectors, [records[i] for i in keep])
+            copied += len(keep)
+    return copied
+
+
+def run_ingestion(job: IngestionJob):
+    """
+    Runs an ingestion job to completion on the calling thread.
+
+    New documents are appended to the current index generation. If documents
+    changed, were removed or were indexed with other settings, a new generation
+    is built instead: the chunks of unchanged documents are copied over, the
+    affected documents are re-indexed, and the generation is swapped in once it
+    is complete, while searches keep using the previous one.
+    """
+    job.status = "running"
+    job.started = time.monotonic()
+    kb = job.kb
+    embedder = get_embedder(kb.embedding_model)
+    config = chunk_config(kb, embedder.name)
+    current_path = index_path(kb.path)
+    current = open_index(current_path)
+    plan = plan_indexing(kb.path, config, current.count if current else None)
+    job.plan = plan
+    job.files = [os.path.join(sources_path(kb.path), name) for name in plan.to_index]
+    job.bytes_total = sum(plan.documents[name]["size"] for name in plan.to_index)
+    if not plan.to_index and not plan.rebuild:
+        sync_search_indexes(kb, current_path)
+        _finish(job)
+        return
+
+    target = new_generation(kb.path) if plan.rebuild else current_path
+    writer = VectorIndexWriter(target, embedder.dim, embedder.name)
+    if plan.rebuild and current is not None and plan.unchanged:
+        copied = _copy_documents(current, writer, set(plan.unchanged))
+        logger.info(f"Ingestion job {job.job_id}: kept {copied} chunks of {len(plan.unchanged)} unchanged documents.")
+
+    chunk_queue: queue.Queue = queue.Queue(maxsize=CHUNK_QUEUE_SIZE)
+    write_queue: queue.Queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+    embed_threads = [
+        threading.Thread(target=_embed_worker, args=(job, embedder, chunk_queue, write_queue), daemon=True)
+        for _ in range(EMBED_WORKERS)
+    ]
+    for thread in embed_threads:
+        thread.start()
+
+    def parse_all():
+        with ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="kb-parse") as pool:
+            for doc_index, path in enumerate(job.files):
+                pool.submit(_parse_document, job, doc_index, path, chunk_queue)
+        for _ in embed_threads:
+            chunk_queue.put(None)
+
+    parser = threading.Thread(target=parse_all, daemon=True)
+    parser.start()
+
+    # A document is done once its end marker has arrived and all its chunks are written
+    expected: Dict[int, int] = {}
+    written: Dict[int, int] = {}
+
+    def finish_documents(doc_indexes):
+        for doc_index in doc_indexes:
+            if doc_index in expected and written.get(doc_index, 0) >= expected[doc_index]:
+                del expected[doc_index]
+                written.pop(doc_index, None)
+                job.documents_done += 1
+
+    try:
+        finished_workers = 0
+        last_commit = time.monotonic()
+        while finished_workers < len(embed_threads):
+            item = write_queue.get()
+            if item is None:
+                finished_workers += 1
+                continue
+            kind, doc_index, payload = item
+            if job.cancelled and not job.error:
+                job.error = "The job was cancelled."
+            if kind == "batch":
+                if job.error:
+                    # Keep consuming so that the other stages can finish
+                    continue
+                vectors, records = payload
+                try:
+                    writer.add(vectors, records)
+                except Exception as e:
+                    job.error = f"Writing to the index failed: {e}"
+                    logger.error(f"Ingestion job {job.job_id}: {job.error}")
+                    continue
+                job.chunks_written += len(records)
+                for index in doc_index:
+                    written[index] = written.get(index, 0) + 1
+                finish_documents(set(doc_index))
+            elif kind == "end":
+                expected[doc_index] = payload
+                finish_documents([doc_index])
+            elif kind == "failed":
+                job.documents_failed += 1
+                job.failed_sources.add(os.path.basename(job.files[doc_index]))
+            if time.monotonic() - last_commit >= COMMIT_INTERVAL:
+                writer.commit()
+                last_commit = time.monotonic()
+        parser.join()
+        if job.cancelled and not job.error:
+            job.error = "The job was cancelled."
+    finally:
+        writer.close()
+
+    if job.error:
+        if plan.rebuild:
+            # The previous generation keeps being served
+            shutil.rmtree(target, ignore_errors=True)
+    else:
+        sync_search_indexes(kb, target)
+        documents = {
+            name: dict(entry, failed=True) if name in job.failed_sources else entry
+            for name, entry in plan.documents.items()
+        }
+        write_manifest(target, {"rows": writer.count, "config": config, "documents": documents})
+        if plan.rebuild:
+            swap_generation(kb.path, target)
+    _finish(job)
+
+
+def _finish(job: IngestionJob):
+    kb = job.kb
+    job.finished = time.monotonic()
+    job.status = "cancelled" if job.cancelled else "failed" if job.error else "completed"
+    progress = job.progress()
+    logger.info(
+        f"Ingestion job {job.job_id} for KB {kb.id} {job.status}: {job.documents_done} documents, "
+        f"{job.chunks_written} chunks, {progress.docs_per_second:.1f} docs/sec."
+    )
+
+
+class IngestionManager:
+    """
+    Runs ingestion jobs in the background, at most one at a time per knowledge base.
+
+    A job requested while one is running for the same knowledge base is queued
+    behind it; further requests are merged into that queued job, which indexes
+    whatever the sources and settings look like when it starts.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = MAX_CONCURRENT_JOBS):
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrent_jobs, thread_name_prefix="kb-ingest")
+        self._jobs: Dict[str, IngestionJob] = {}
+        self._active: Dict[int, str] = {}  # kb id -> running job id
+        self._queued: Dict[int, IngestionJob] = {}  # kb id -> job waiting for the running one
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, kb: models.KnowledgeBase) -> IngestionJob:
+        """
+        Queues a job that brings a knowledge base's index up to date with its
+        sources directory and settings. Uploaded files must already be stored there.
+        """
+        with self._lock:
+            if self._closed:
+                raise IngestionError("The server is shutting down; no new ingestion jobs are accepted.")
+            if kb.id in self._active:
+                job = self._queued.get(kb.id)
+                if job is None:
+                    job = IngestionJob(kb)
+                    self._jobs[job.job_id] = job
+                    self._queued[kb.id] = job
+                else:
+                    job.kb = kb  # Use the latest settings
+                return job
+            job = IngestionJob(kb)
+            self._jobs[job.job_id] = job
+            self._active[kb.id] = job.job_id
+        self._pool.submit(self._run, job)
+        return job
+
+    def _run(self, job: IngestionJob):
+        try:
+            run_ingestion(job)
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.finished = time.monotonic()
+            logger.error(f"Ingestion job {job.job_id} failed: {e}")
+        finally:
+            with self._lock:
+                self._active.pop(job.kb.id, None)
+                queued = None if self._closed else self._queued.pop(job.kb.id, None)
+                if queued is not None:
+                    self._active[queued.kb.id] = queued.job_id
+            job.done.set()
+            if queued is not None:
+                self._pool.submit(self._run, queued)
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        """Returns a job by id, or None if it is unknown."""
+        return self._jobs.get(job_id)
+
+    def jobs_for(self, kb_id: int) -> List[IngestionJob]:
+        """Returns every known job for a knowledge base, oldest first."""
+        return [job for job in self._jobs.values() if job.kb.id == kb_id]
+
+    def cancel(self, kb_id: int) -> List[IngestionJob]:
+        """
+        Cancels a knowledge base's queued job and asks its running job to stop.
+        Returns the jobs that have not finished yet; wait on their `done` events.
+        """
+        with self._lock:
+            queued = self._queued.pop(kb_id, None)
+            if queued is not None:
+                queued.cancelled = True
+                queued.status = "cancelled"
+                queued.done.set()
+            job = self._jobs.get(self._active.get(kb_id))
+            if job is None:
+                return []
+            job.cancelled = True
+            return [job]
+
+    def shutdown(self):
+        """Stops accepting jobs; running jobs finish in the background."""
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=False)
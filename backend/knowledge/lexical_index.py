@@ -0,0 +1,287 @@
+"""
+BM25 inverted index over the chunks of a knowledge base.
+
+Embeddings handle exact identifiers such as part numbers and error codes poorly,
+so knowledge bases can also be searched lexically. The index lives in
+`<kb path>/lexical` and covers the rows of the vector index next to it:
+
+*   `doclens.i32`: the token count of every indexed row, in row order.
+*   `seg.{n}.terms.json`: a segment's term dictionary, term -> [offset, df].
+*   `seg.{n}.postings.i32`: a segment's (row, term frequency) pairs, grouped by term.
+*   `meta.json`: the indexed row count, total token count and live segments.
+
+Indexing is incremental: a sync tokenizes only the rows added since the previous
+one and writes them as a new segment. Once there are more than MAX_SEGMENTS
+segments they are merged into one. As for the vector index, `meta.json` is the
+commit point.
+"""
+import os
+import re
+import json
+import math
+import time
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from knowledge.vector_index import open_index, read_meta, write_meta, META_FILE
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_DIR = "lexical"
+DOCLENS_FILE = "doclens.i32"
+LEXICAL_INDEX_VERSION = 1
+SYNC_BATCH_ROWS = 8192  # chunk records read per batch
+SEGMENT_POSTINGS = 4_000_000  # postings buffered in memory before a segment is written
+MAX_SEGMENTS = 8
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Words and compound identifiers such as "e1234", "ab-123/x" or "v2.1.0"
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:[-_./:#][^\W_]+)*")
+SEPARATOR_PATTERN = re.compile(r"[-_./:#]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cases and splits text into index terms.
+
+    Compound identifiers are indexed whole and also by their parts, so that
+    "AB-123-X" matches queries for "ab-123-x" as well as "123".
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in SEPARATOR_PATTERN.split(token) if part)
+    return tokens
+
+
+def _write_file(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _segment_files(lex_path: str, name: str) -> Tuple[str, str]:
+    return os.path.join(lex_path, f"{name}.terms.json"), os.path.join(lex_path, f"{name}.postings.i32")
+
+
+def _write_segment(lex_path: str, meta: Dict[str, Any], postings: Dict[str, List[np.ndarray]]) -> Dict[str, Any]:
+    """Writes term -> postings arrays as a new segment and returns its metadata entry."""
+    name = f"seg.{meta['next_segment']}"
+    meta["next_segment"] += 1
+    terms: Dict[str, List[int]] = {}
+    blocks = []
+    offset = 0
+    for term in sorted(postings):
+        pairs = np.concatenate(postings[term]) if len(postings[term]) > 1 else postings[term][0]
+        df = len(pairs)
+        terms[term] = [offset, df]
+        blocks.append(pairs)
+        offset += df
+    terms_path, postings_path = _segment_files(lex_path, name)
+    data = np.concatenate(blocks) if blocks else np.empty((0, 2), dtype=np.int32)
+    _write_file(postings_path, np.ascontiguousarray(data, dtype=np.int32).tobytes())
+    _write_file(terms_path, json.dumps(terms, ensure_ascii=False).encode("utf-8"))
+    return {"name": name, "postings": offset}
+
+
+def _load_segment(lex_path: str, name: str, count: int) -> Tuple[Dict[str, List[int]], np.ndarray]:
+    terms_path, postings_path = _segment_files(lex_path, name)
+    with open(terms_path, "r", encoding="utf-8") as f:
+        terms = json.load(f)
+    if count:
+        postings = np.memmap(postings_path, dtype=np.int32, mode="r", shape=(count, 2))
+    else:
+        postings = np.empty((0, 2), dtype=np.int32)
+    return terms, postings
+
+
+def _merge_segments(lex_path: str, meta: Dict[str, Any]) -> List[str]:
+    """Merges every segment into a new one and returns the names of the replaced segments."""
+    merged: Dict[str, List[np.ndarray]] = defaultdict(list)
+    # Segments cover increasing row ranges, so merging in order keeps postings sorted by row
+    for segment in meta["segments"]:
+        terms, postings = _load_segment(lex_path, segment["name"], segment["postings"])
+        for term, (offset, df) in terms.items():
+            merged[term].append(postings[offset:offset + df])
+    replaced = [segment["name"] for segment in meta["segments"]]
+    meta["segments"] = [_write_segment(lex_path, meta, merged)]
+    return replaced
+
+
+def _remove_segment_files(lex_path: str, names: List[str]):
+    for name in names:
+        for file_path in _segment_files(lex_path, name):
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+
+
+_sync_locks: Dict[str, threading.Lock] = {}
+_sync_locks_lock = threading.Lock()
+
+
+def sync_lexical_index(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Brings the lexical index at `path` up to date with the vector index, indexing
+    only the rows added since the last sync. Returns the index metadata, or None
+    if the knowledge base has no vector index yet.
+    """
+    with _sync_locks_lock:
+        lock = _sync_locks.setdefault(path, threading.Lock())
+    with lock:
+        return _sync_lexical_index(path)
+
+
+def _sync_lexical_index(path: str) -> Optional[Dict[str, Any]]:
+    index = open_index(path)
+    if index is None:
+        return None
+    lex_path = os.path.join(path, LEXICAL_DIR)
+    os.makedirs(lex_path, exist_ok=True)
+    meta = read_meta(lex_path) or {
+        "version": LEXICAL_INDEX_VERSION,
+        "rows": 0,
+        "total_length": 0,
+        "segments": [],
+        "next_segment": 1,
+    }
+    if meta["rows"] >= index.count:
+        return meta
+
+    started = time.monotonic()
+    first_row = meta["rows"]
+    postings: Dict[str, List[np.ndarray]] = defaultdict(list)
+    pending = 0
+    with open(os.path.join(lex_path, DOCLENS_FILE), "ab") as doclens:
+        # Drop lengths written by an interrupted sync
+        doclens.truncate(first_row * 4)
+        for start in range(first_row, index.count, SYNC_BATCH_ROWS):
+            rows = range(start, min(start + SYNC_BATCH_ROWS, index.count))
+            lengths = np.empty(len(rows), dtype=np.int32)
+            batch: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+            for i, (row, record) in enumerate(zip(rows, index.get_records(rows))):
+                counts = Counter(tokenize(record["text"]))
+                lengths[i] = sum(counts.values())
+                for term, tf in counts.items():
+                    batch[term].append((row, tf))
+                pending += len(counts)
+            for term, pairs in batch.items():
+                postings[term].append(np.array(pairs, dtype=np.int32))
+            doclens.write(lengths.tobytes())
+            meta["total_length"] += int(lengths.sum())
+            if pending >= SEGMENT_POSTINGS:
+                meta["segments"].append(_write_segment(lex_path, meta, postings))
+                postings, pending = defaultdict(list), 0
+        if postings:
+            meta["segments"].append(_write_segment(lex_path, meta, postings))
+        doclens.flush()
+        os.fsync(doclens.fileno())
+
+    replaced: List[str] = []
+    if len(meta["segments"]) > MAX_SEGMENTS:
+        replaced = _merge_segments(lex_path, meta)
+    meta["rows"] = index.count
+    write_meta(lex_path, meta)
+    _remove_segment_files(lex_path, replaced)
+    logger.info(
+        f"Indexed rows {first_row}-{index.count} of '{path}' for lexical search "
+        f"({len(meta['segments'])} segments) in {time.monotonic() - started:.2f}s."
+    )
+    return meta
+
+
+class LexicalIndex:
+    """A read-only BM25 view of the committed segments of a lexical index."""
+
+    def __init__(self, lex_path: str, meta: Dict[str, Any]):
+        self.rows = meta["rows"]
+        self.avgdl = meta["total_length"] / self.rows if self.rows else 0.0
+        self.doclens = np.fromfile(os.path.join(lex_path, DOCLENS_FILE), dtype=np.int32, count=self.rows)
+        self.segments = [
+            _load_segment(lex_path, segment["name"], segment["postings"]) for segment in meta["segments"]
+        ]
+
+    def _postings(self, term: str) -> List[np.ndarray]:
+        lists = []
+        for terms, postings in self.segments:
+            entry = terms.get(term)
+            if entry is not None:
+                lists.append(postings[entry[0]:entry[0] + entry[1]])
+        return lists
+
+    def search(self, queries: List[str], k: int, k1: float = BM25_K1, b: float = BM25_B) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the top-k rows by BM25 score for every query, as (scores, rows)
+        arrays sorted best first. Queries with fewer than k matching rows are
+        padded with row -1.
+        """
+        k = min(k, self.rows)
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        if k <= 0:
+            return all_scores, all_rows
+
+        for i, query in enumerate(queries):
+            scores = np.zeros(self.rows, dtype=np.float32)
+            for term in set(tokenize(query)):
+                lists = self._postings(term)
+                df = sum(len(pairs) for pairs in lists)
+                if not df:
+                    continue
+                idf = math.log(1 + (self.rows - df + 0.5) / (df + 0.5))
+                for pairs in lists:
+                    rows = np.asarray(pairs[:, 0])
+                    tf = pairs[:, 1].astype(np.float32)
+                    norm = k1 * (1 - b + b * self.doclens[rows] / self.avgdl)
+                    # A row appears at most once per term list, so plain fancy-index addition is safe
+                    scores[rows] += idf * tf * (k1 + 1) / (tf + norm)
+
+            matched = np.flatnonzero(scores)
+            top = min(k, len(matched))
+            if not top:
+                continue
+            best = matched[np.argpartition(-scores[matched], top - 1)[:top]]
+            best = best[np.argsort(-scores[best], kind="stable")]
+            all_scores[i, :top] = scores[best]
+            all_rows[i, :top] = best
+        return all_scores, all_rows
+
+
+_open_lexical_indexes: Dict[str, Tuple[int, LexicalIndex]] = {}
+_open_lexical_lock = threading.Lock()
+
+
+def open_lexical_index(path: str) -> Optional[LexicalIndex]:
+    """Returns a shared lexical index reader for `path`, or None if it has not been built yet."""
+    lex_path = os.path.join(path, LEXICAL_DIR)
+    try:
+        version = os.stat(os.path.join(lex_path, META_FILE)).st_mtime_ns
+    except (FileNotFoundError, TypeError):
+        return None
+    with _open_lexical_lock:
+        cached = _open_lexical_indexes.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        meta = read_meta(lex_path)
+        try:
+            lexical = LexicalIndex(lex_path, meta)
+        except FileNotFoundError:
+            # A merge replaced these segments meanwhile; the caller falls back to vector search
+            return None
+        _open_lexical_indexes[path] = (version, lexical)
+        return lexical
+
+
+def forget_lexical_index(path: str):
+    """Drops the shared lexical index reader for `path`, e.g. before its files are deleted."""
+    with _open_lexical_lock:
+        _open_lexical_indexes.pop(path, None)
@@ -0,0 +1,247 @@
+"""
+Source manifests and index generations of a knowledge base.
+
+A knowledge base directory holds its uploaded documents in `sources/` and one or
+more index generations. The `CURRENT` file names the generation that is being
+served; a knowledge base without it is served from its own directory (the
+layout used before generations were introduced).
+
+Every generation carries a `manifest.json` recording, per source document, the
+file fingerprint and the configuration (parser, chunking, embedding model) that
+produced its chunks. Comparing the sources and the KB's settings against the
+manifest tells an ingestion job which documents need to be re-chunked and
+re-embedded. Documents that are only added are appended to the current
+generation; any other change builds a new generation, which is swapped in by
+rewriting `CURRENT` once it is complete.
+"""
+import os
+import json
+import uuid
+import shutil
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+from knowledge.vector_index import forget_index
+from knowledge.ann_index import forget_ivf_index
+from knowledge.lexical_index import forget_lexical_index
+
+logger = logging.getLogger(__name__)
+
+SOURCES_DIR = "sources"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+GENERATION_PREFIX = "gen."
+PARTIAL_UPLOAD_SUFFIX = ".partial"  # uploads still being written to the sources directory
+LEGACY_INDEX_ENTRIES = ("meta.json", "vectors.f32", "chunks.jsonl", "chunks.idx", "ivf", "lexical", MANIFEST_FILE)
+
+
+def sources_path(kb_path: str) -> str:
+    """The directory holding a knowledge base's uploaded documents."""
+    return os.path.join(kb_path, SOURCES_DIR)
+
+
+def partial_upload_path(directory: str, name: str) -> str:
+    """A unique temporary path for an upload of `name`, which ingestion jobs ignore until it is renamed."""
+    return os.path.join(directory, f".{name}.{uuid.uuid4().hex}{PARTIAL_UPLOAD_SUFFIX}")
+
+
+def current_generation(kb_path: str) -> Optional[str]:
+    """The name of the generation being served, or None for the legacy layout."""
+    try:
+        with open(os.path.join(kb_path, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def index_path(kb_path: Optional[str]) -> Optional[str]:
+    """The directory of the index generation currently served for a knowledge base."""
+    if not kb_path:
+        return None
+    generation = current_generation(kb_path)
+    return os.path.join(kb_path, generation) if generation else kb_path
+
+
+def index_version(kb_path: Optional[str]) -> Optional[str]:
+    """
+    Identifies the index contents currently served for a knowledge base: changes
+    when a new generation is swapped in and when documents are appended to the
+    current one. None if the knowledge base has no index yet.
+    """
+    path = index_path(kb_path)
+    if not path:
+        return None
+    try:
+        modified = os.stat(os.path.join(path, MANIFEST_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return f"{os.path.basename(path)}:{modified}"
+
+
+def new_generation(kb_path: str) -> str:
+    """Creates an empty directory for the next index generation and returns its path."""
+    current = current_generation(kb_path)
+    number = int(current[len(GENERATION_PREFIX):]) + 1 if current else 1
+    path = os.path.join(kb_path, f"{GENERATION_PREFIX}{number}")
+    # Left over from an interrupted rebuild
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    return path
+
+
+def swap_generation(kb_path: str, generation_path: str):
+    """
+    Atomically makes `generation_path` the served generation. Generations older
+    than the one being replaced are deleted; the replaced one is kept so that
+    searches that are still reading it can finish.
+    """
+    previous = current_generation(kb_path)
+    name = os.path.basename(generation_path)
+    tmp_path = os.path.join(kb_path, f"{CURRENT_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(kb_path, CURRENT_FILE))
+
+    keep = {name, previous}
+    for entry in os.listdir(kb_path):
+        if entry.startswith(GENERATION_PREFIX) and entry not in keep:
+            _forget(os.path.join(kb_path, entry))
+            shutil.rmtree(os.path.join(kb_path, entry), ignore_errors=True)
+    if previous is not None:
+        # The legacy index in the KB directory itself is at least two generations old now
+        _forget(kb_path)
+        for entry in LEGACY_INDEX_ENTRIES:
+            path = os.path.join(kb_path, entry)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+    logger.info(f"Switched '{kb_path}' to index generation '{name}'.")
+
+
+def remove_knowledge_base_files(kb_path: str):
+    """Deletes a knowledge base's directory: its sources, every index generation and CURRENT."""
+    if not os.path.isdir(kb_path):
+        return
+    for entry in os.listdir(kb_path):
+        if entry.startswith(GENERATION_PREFIX):
+            _forget(os.path.join(kb_path, entry))
+    _forget(kb_path)
+    shutil.rmtree(kb_path, ignore_errors=True)
+    logger.info(f"Removed knowledge base files in '{kb_path}'.")
+
+
+def _forget(path: str):
+    forget_index(path)
+    forget_ivf_index(path)
+    forget_lexical_index(path)
+
+
+def read_manifest(path: str) -> Optional[Dict[str, Any]]:
+    """Returns the manifest of the index generation at `path`, or None if it has none."""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_manifest(path: str, manifest: Dict[str, Any]):
+    """Atomically replaces the manifest of the index generation at `path`."""
+    tmp_path = os.path.join(path, f"{MANIFEST_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+
+def chunk_config(kb, embedding_model: str) -> Dict[str, Any]:
+    """The knowledge base settings that determine a document's chunks and vectors."""
+    return {
+        "parsing_library": kb.parsing_library,
+        "chunking_strategy": kb.chunking_strategy,
+        "chunk_size": kb.chunk_size,
+        "chunk_overlap": kb.chunk_overlap,
+        "embedding_model": embedding_model,
+    }
+
+
+def config_hash(config: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def file_fingerprint(path: str, previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Returns the size, modification time and content hash of a file. The hash is
+    reused from `previous` when the size and modification time are unchanged.
+    """
+    stat = os.stat(path)
+    if previous and previous.get("size") == stat.st_size and previous.get("mtime_ns") == stat.st_mtime_ns:
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": previous["sha256"]}
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+
+
+class IndexPlan:
+    """Which source documents an ingestion job has to (re)index, keep or drop."""
+
+    def __init__(self):
+        self.documents: Dict[str, Dict[str, Any]] = {}  # source name -> manifest entry after the job
+        self.unchanged: List[str] = []
+        self.changed: List[str] = []
+        self.added: List[str] = []
+        self.removed: List[str] = []
+        self.rebuild = False
+
+    @property
+    def to_index(self) -> List[str]:
+        """Source names whose documents must be parsed, chunked and embedded."""
+        return self.changed + self.added
+
+
+def plan_indexing(kb_path: str, config: Dict[str, Any], index_count: Optional[int]) -> IndexPlan:
+    """
+    Compares a knowledge base's sources and settings with the manifest of its
+    current generation.
+
+    A new generation is built when a document changed, disappeared or was indexed
+    with other settings, when the manifest does not describe the index (e.g. after
+    an interrupted job), or when there is no index yet (`index_count` is None);
+    otherwise new documents are simply appended.
+    """
+    plan = IndexPlan()
+    manifest = read_manifest(index_path(kb_path)) or {"rows": 0, "documents": {}}
+    previous = manifest["documents"]
+    digest = config_hash(config)
+
+    directory = sources_path(kb_path)
+    names = sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+    for name in names:
+        path = os.path.join(directory, name)
+        if not os.path.isfile(path) or (name.startswith(".") and name.endswith(PARTIAL_UPLOAD_SUFFIX)):
+            continue
+        fingerprint = file_fingerprint(path, previous.get(name))
+        entry = dict(fingerprint, config=digest)
+        plan.documents[name] = entry
+        old = previous.get(name)
+        if old is None:
+            plan.added.append(name)
+        elif old.get("sha256") == entry["sha256"] and old.get("config") == digest:
+            if old.get("failed"):
+                entry["failed"] = True  # Not retried until the file or the settings change
+            plan.unchanged.append(name)
+        else:
+            plan.changed.append(name)
+    plan.removed = [name for name in previous if name not in plan.documents]
+    if index_count is None:
+        plan.rebuild = bool(plan.to_index)
+    else:
+        plan.rebuild = bool(plan.changed or plan.removed) or manifest["rows"] != index_count
+    return plan
@@ -0,0 +1,101 @@
+"""
+Streaming document parsers.
+
+Every parser yields a document's text in bounded blocks, so arbitrarily large
+files can be ingested without loading them into memory.
+"""
+import os
+from html.parser import HTMLParser
+from typing import Iterator, List
+
+BLOCK_SIZE = 1 << 20  # characters per block
+
+TEXT_EXTENSIONS = {".txt", ".md", ".markdown", ".csv", ".tsv", ".json", ".jsonl", ".log", ".rst", ".xml", ".yaml", ".yml", ".py"}
+HTML_EXTENSIONS = {".html", ".htm"}
+PDF_EXTENSIONS = {".pdf"}
+
+
+class ParsingError(Exception):
+    """Raised when a document cannot be parsed."""
+
+
+class _HTMLTextExtractor(HTMLParser):
+    """Collects the visible text of an HTML document fed to it incrementally."""
+
+    SKIPPED_TAGS = {"script", "style", "noscript"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIPPED_TAGS:
+            self._skip_depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIPPED_TAGS and self._skip_depth:
+            self._skip_depth -= 1
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self.parts.append(data)
+
+    def drain(self) -> str:
+        text = " ".join(part.strip() for part in self.parts if part.strip())
+        self.parts = []
+        return text
+
+
+def iter_text_file(path: str, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+    """Yields a plain text file in blocks of at most `block_size` characters."""
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            yield block
+
+
+def iter_html_file(path: str, block_size: int = BLOCK_SIZE) -> Iterator[str]:
+    """Yields the visible text of an HTML file, parsing it incrementally."""
+    extractor = _HTMLTextExtractor()
+    for block in iter_text_file(path, block_size):
+        extractor.feed(block)
+        text = extractor.drain()
+        if text:
+            yield text + " "
+    extractor.close()
+    text = extractor.drain()
+    if text:
+        yield text
+
+
+def iter_pdf_file(path: str) -> Iterator[str]:
+    """Yields the text of a PDF one page at a time."""
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise ParsingError("PDF parsing requires the 'pypdf' package to be installed.") from e
+    reader = PdfReader(path)
+    for page in reader.pages:
+        text = page.extract_text() or ""
+        if text:
+            yield text + "\n"
+
+
+def iter_document_text(path: str, parsing_library: str = "") -> Iterator[str]:
+    """
+    Yields the text of a document in blocks, choosing a parser from its extension.
+
+    `parsing_library` is the knowledge base's configured parser; PDFs are always
+    read with pypdf, which also covers the "PyPDF" setting.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in PDF_EXTENSIONS:
+        return iter_pdf_file(path)
+    if extension in HTML_EXTENSIONS:
+        return iter_html_file(path)
+    if extension in TEXT_EXTENSIONS or not extension:
+        return iter_text_file(path)
+    raise ParsingError(f"Unsupported file type '{extension}'.")
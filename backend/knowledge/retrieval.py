@@ -0,0 +1,201 @@
+"""
+Retrieval of knowledge base chunks for chat replies and the search endpoint.
+
+Each knowledge base picks a `retrieval_mode`:
+
+*   "vector" (the default) ranks chunks by embedding similarity,
+*   "bm25" ranks them lexically, which suits part numbers and error codes,
+*   "hybrid" fuses both rankings with reciprocal rank fusion.
+
+KnowledgeSearcher fans a query out to several knowledge bases at once and merges
+their results into a single ranking.
+"""
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import models as models
+from knowledge.embeddings import get_embedder
+from knowledge.vector_index import open_index
+from knowledge.ann_index import parse_vector_store, open_ivf_index, DEFAULT_NPROBE
+from knowledge.lexical_index import open_lexical_index
+from knowledge.manifest import index_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 3
+RETRIEVAL_MODES = ("vector", "bm25", "hybrid")
+LEXICAL_MODES = ("bm25", "hybrid")
+RRF_K = 60  # rank offset of reciprocal rank fusion
+HYBRID_CANDIDATES = 50  # candidates taken from each ranking before fusion
+DEFAULT_MERGED_TOP_K = 5
+DEFAULT_KB_SEARCH_BUDGET = 2.0  # seconds a knowledge base may take before its results are dropped
+DEFAULT_SEARCH_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def _vector_search(kb, index, queries: List[str], k: int, nprobe: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+    embedder = get_embedder(index.embedding_model)
+    vectors = embedder.embed(queries)
+    kind, params = parse_vector_store(kb.vector_store)
+    ivf = open_ivf_index(index.path, index) if kind == "ivf" else None
+    if ivf is not None:
+        return ivf.search(vectors, k, nprobe or params.get("nprobe", DEFAULT_NPROBE))
+    return index.search(vectors, k)
+
+
+def reciprocal_rank_fusion(rankings: List[np.ndarray], k: int, rrf_k: int = RRF_K) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fuses several best-first row rankings of one query into a single top-k.
+
+    A row scores sum(1 / (rrf_k + rank)) over the rankings it appears in, so rows
+    ranked well by several retrievers rise to the top. Rows of -1 are ignored.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(int(row) for row in ranking if row >= 0):
+            fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:k]
+    return (
+        np.array([score for _, score in best], dtype=np.float32),
+        np.array([row for row, _ in best], dtype=np.int64),
+    )
+
+
+def search_knowledge_base(
+    kb,
+    queries: List[str],
+    top_k: int = DEFAULT_TOP_K,
+    nprobe: Optional[int] = None,
+    retrieval_mode: Optional[str] = None,
+) -> List[List[models.RetrievedChunk]]:
+    """
+    Returns the top-k chunks of a knowledge base for each query, best first.
+
+    Queries are embedded with the model the index was built with and scored in a
+    single batched pass. Knowledge bases whose `vector_store` is "ivf" are searched
+    approximately once their IVF index has been trained, probing `nprobe` lists
+    (the KB's setting by default). `retrieval_mode` overrides the KB's mode; until
+    a KB's lexical index has been built, lexical modes fall back to vector search.
+    A knowledge base without an index yields no results.
+    """
+    path = index_path(kb.path)
+    index = open_index(path) if path else None
+    if index is None or index.count == 0:
+        return [[] for _ in queries]
+
+    mode = retrieval_mode or kb.retrieval_mode or "vector"
+    lexical = open_lexical_index(path) if mode in LEXICAL_MODES else None
+    if lexical is None:
+        scores, rows = _vector_search(kb, index, queries, top_k, nprobe)
+    elif mode == "bm25":
+        scores, rows = lexical.search(queries, top_k)
+    else:
+        depth = max(top_k, HYBRID_CANDIDATES)
+        _, vector_rows = _vector_search(kb, index, queries, depth, nprobe)
+        _, lexical_rows = lexical.search(queries, depth)
+        fused = [reciprocal_rank_fusion([v, l], top_k) for v, l in zip(vector_rows, lexical_rows)]
+        scores, rows = [s for s, _ in fused], [r for _, r in fused]
+
+    results = []
+    for query_scores, query_rows in zip(scores, rows):
+        found = query_rows >= 0
+        query_scores, query_rows = query_scores[found], query_rows[found]
+        records = index.get_records(query_rows)
+        results.append([
+            models.RetrievedChunk(
+                kb_id=kb.id,
+                kb_name=kb.kb_name,
+                source=record["source"],
+                chunk=record["chunk"],
+                text=record["text"],
+                score=float(score),
+            )
+            for score, record in zip(query_scores, records)
+        ])
+    return results
+
+
+def merge_results(kbs: Sequence[models.KnowledgeBase], results: List[List[models.RetrievedChunk]], top_k: int) -> List[models.RetrievedChunk]:
+    """
+    Merges per-KB rankings into one deduplicated top-k, best first.
+
+    Cosine scores are comparable across knowledge bases that are all searched by
+    vector with the same embedding model, so those are ranked by score. Any other
+    mix (BM25 and fused scores depend on each KB's corpus) is merged by reciprocal
+    rank. Chunks with identical text, e.g. a document uploaded to several KBs,
+    are only kept once.
+    """
+    comparable = (
+        all((kb.retrieval_mode or "vector") == "vector" for kb in kbs)
+        and len({kb.embedding_model for kb in kbs}) <= 1
+    )
+    candidates = []
+    for chunks in results:
+        for rank, chunk in enumerate(chunks):
+            candidates.append((chunk.score if comparable else 1.0 / (RRF_K + rank + 1), chunk))
+    candidates.sort(key=lambda candidate: -candidate[0])
+
+    merged, seen = [], set()
+    for _, chunk in candidates:
+        digest = hashlib.sha1(" ".join(chunk.text.split()).encode("utf-8")).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        merged.append(chunk)
+        if len(merged) == top_k:
+            break
+    return merged
+
+
+class KnowledgeSearcher:
+    """
+    Searches several knowledge bases concurrently on a dedicated thread pool.
+
+    Each knowledge base gets a latency budget; results that are not ready when it
+    runs out are left out of the merged ranking (the search itself finishes in the
+    background), so one slow or very large KB cannot hold up a reply.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_SEARCH_WORKERS, budget: float = DEFAULT_KB_SEARCH_BUDGET):
+        self.budget = budget
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="kb-search")
+
+    async def search(
+        self, kbs: Sequence[models.KnowledgeBase], query: str, top_k: int = DEFAULT_MERGED_TOP_K
+    ) -> Tuple[List[models.RetrievedChunk], List[models.KnowledgeBase]]:
+        """Returns the merged top-k chunks for `query` and the knowledge bases that ran out of time."""
+        if not kbs:
+            return [], []
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        futures = [loop.run_in_executor(self._pool, search_knowledge_base, kb, [query], top_k) for kb in kbs]
+        done, _ = await asyncio.wait(futures, timeout=self.budget)
+
+        answered, results, timed_out = [], [], []
+        for kb, future in zip(kbs, futures):
+            if future not in done:
+                timed_out.append(kb)
+                # Retrieve the eventual exception so it is not reported as unhandled
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            elif future.exception() is not None:
+                logger.error(f"Searching knowledge base '{kb.kb_name}' failed: {future.exception()}")
+            else:
+                answered.append(kb)
+                results.append(future.result()[0])
+        if timed_out:
+            logger.warning(
+                f"Knowledge bases {[kb.kb_name for kb in timed_out]} exceeded the {self.budget}s search budget."
+            )
+        merged = merge_results(answered, results, top_k)
+        logger.info(f"Searched {len(kbs)} knowledge bases in {time.monotonic() - started:.3f}s.")
+        return merged, timed_out
+
+    def shutdown(self):
+        """Stops accepting searches; running searches finish in the background."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,241 @@
+"""
+On-disk vector index for a knowledge base.
+
+An index directory holds:
+
+*   `vectors.f32`: the chunk embeddings as a contiguous row-major float32 matrix.
+*   `chunks.jsonl`: one JSON record (text and metadata) per chunk, in row order.
+*   `chunks.idx`: an int64 (offset, length) pair per chunk into `chunks.jsonl`.
+*   `meta.json`: the dimension, embedding model and committed row count.
+
+Rows are only ever appended. `meta.json` is rewritten atomically on commit and
+is the commit point: bytes past the committed row count are ignored by
+readers and truncated by the next writer.
+
+Readers memory-map the vector matrix and the chunk offsets, so opening an index
+costs a few system calls regardless of its size, and only the pages touched by a
+search are read from disk.
+"""
+import os
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+META_FILE = "meta.json"
+VECTORS_FILE = "vectors.f32"
+CHUNKS_FILE = "chunks.jsonl"
+CHUNK_INDEX_FILE = "chunks.idx"
+INDEX_VERSION = 1
+SEARCH_BLOCK_ROWS = 65536  # rows scored per matrix multiplication
+
+
+class VectorIndexError(Exception):
+    """Raised when an index cannot be opened or written."""
+
+
+def read_meta(path: str) -> Optional[Dict[str, Any]]:
+    """Returns an index's metadata, or None if no index exists at `path`."""
+    meta_path = os.path.join(path, META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_meta(path: str, meta: Dict[str, Any]):
+    """Atomically replaces an index's metadata."""
+    tmp_path = os.path.join(path, f"{META_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+
+class VectorIndexWriter:
+    """Appends embedded chunks to the index at `path`, creating it if needed."""
+
+    def __init__(self, path: str, dim: int, embedding_model: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        meta = read_meta(path)
+        if meta is None:
+            meta = {"version": INDEX_VERSION, "dim": dim, "embedding_model": embedding_model, "count": 0}
+        elif meta["dim"] != dim or meta["embedding_model"] != embedding_model:
+            raise VectorIndexError(
+                f"Index at '{path}' was built with '{meta['embedding_model']}' ({meta['dim']} dimensions), "
+                f"not '{embedding_model}' ({dim} dimensions)."
+            )
+        self.meta = meta
+        self.dim = dim
+
+        self._vectors = open(os.path.join(path, VECTORS_FILE), "ab")
+        self._chunks = open(os.path.join(path, CHUNKS_FILE), "ab")
+        self._chunk_index = open(os.path.join(path, CHUNK_INDEX_FILE), "ab")
+        self._truncate_uncommitted()
+        self.written = self.meta["count"]
+
+    @property
+    def count(self) -> int:
+        """The number of committed rows."""
+        return self.meta["count"]
+
+    def _truncate_uncommitted(self):
+        """Drops rows written after the last commit, e.g. by a crashed ingestion."""
+        count = self.count
+        self._vectors.truncate(count * self.dim * 4)
+        self._chunk_index.truncate(count * 16)
+        chunks_end = 0
+        if count:
+            entries = np.fromfile(os.path.join(self.path, CHUNK_INDEX_FILE), dtype=np.int64, count=count * 2)
+            chunks_end = int(entries[-2] + entries[-1])
+        self._chunks.truncate(chunks_end)
+        self._chunks_offset = chunks_end
+
+    def add(self, vectors: np.ndarray, records: List[Dict[str, Any]]):
+        """Appends a batch of vectors and their chunk records. They become visible on commit."""
+        if len(vectors) != len(records):
+            raise VectorIndexError("Every vector needs exactly one chunk record.")
+        if not records:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if vectors.shape[1] != self.dim:
+            raise VectorIndexError(f"Expected {self.dim}-dimensional vectors, got {vectors.shape[1]}.")
+
+        entries = np.empty((len(records), 2), dtype=np.int64)
+        payload = bytearray()
+        for row, record in enumerate(records):
+            line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+            entries[row] = (self._chunks_offset + len(payload), len(line))
+            payload += line
+
+        self._vectors.write(vectors.tobytes())
+        self._chunks.write(payload)
+        self._chunk_index.write(entries.tobytes())
+        self._chunks_offset += len(payload)
+        self.written += len(records)
+
+    def commit(self):
+        """Makes every row written so far durable and visible to readers."""
+        if self.written == self.count:
+            return
+        for f in (self._vectors, self._chunks, self._chunk_index):
+            f.flush()
+            os.fsync(f.fileno())
+        self.meta["count"] = self.written
+        write_meta(self.path, self.meta)
+
+    def close(self):
+        """Commits outstanding rows and closes the index files."""
+        try:
+            self.commit()
+        finally:
+            for f in (self._vectors, self._chunks, self._chunk_index):
+                f.close()
+
+
+class VectorIndex:
+    """A read-only, memory-mapped view of the committed rows of an index."""
+
+    def __init__(self, path: str):
+        meta = read_meta(path)
+        if meta is None:
+            raise VectorIndexError(f"No index found at '{path}'.")
+        self.path = path
+        self.meta = meta
+        self.dim = meta["dim"]
+        self.count = meta["count"]
+        self.embedding_model = meta["embedding_model"]
+        if self.count:
+            self._vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+            self._entries = np.memmap(os.path.join(path, CHUNK_INDEX_FILE), dtype=np.int64, mode="r", shape=(self.count, 2))
+        else:
+            self._vectors = np.empty((0, self.dim), dtype=np.float32)
+            self._entries = np.empty((0, 2), dtype=np.int64)
+        self._chunks_fd = os.open(os.path.join(path, CHUNKS_FILE), os.O_RDONLY) if self.count else None
+
+    def search(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the top-k rows by dot product (cosine similarity for normalized
+        vectors) for every query, as (scores, rows) arrays of shape (queries, k)
+        sorted best first.
+
+        All queries are scored together, one block of rows at a time, so a batch
+        of queries costs a single pass over the matrix.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, self.count)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        if k <= 0:
+            return best_scores, best_rows
+
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = self._vectors[start:start + SEARCH_BLOCK_ROWS]
+            scores = queries @ block.T
+            if scores.shape[1] > k:
+                candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+                scores = np.take_along_axis(scores, candidates, axis=1)
+            else:
+                candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, candidates + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def get_records(self, rows) -> List[Dict[str, Any]]:
+        """Returns the chunk records for the given rows."""
+        records = []
+        for row in rows:
+            offset, length = self._entries[int(row)]
+            line = os.pread(self._chunks_fd, int(length), int(offset))
+            records.append(json.loads(line))
+        return records
+
+    def close(self):
+        if self._chunks_fd is not None:
+            os.close(self._chunks_fd)
+            self._chunks_fd = None
+
+    def __del__(self):
+        self.close()
+
+
+_open_indexes: Dict[str, Tuple[int, VectorIndex]] = {}
+_open_indexes_lock = threading.Lock()
+
+
+def open_index(path: str) -> Optional[VectorIndex]:
+    """
+    Returns a shared reader for the index at `path`, or None if none exists yet.
+
+    Readers are reused until the index's metadata changes, i.e. until new rows
+    are committed.
+    """
+    try:
+        version = os.stat(os.path.join(path, META_FILE)).st_mtime_ns
+    except (FileNotFoundError, TypeError):
+        return None
+    with _open_indexes_lock:
+        cached = _open_indexes.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        index = VectorIndex(path)
+        _open_indexes[path] = (version, index)
+        return index
+
+
+def forget_index(path: str):
+    """Drops the shared reader for `path`, e.g. before its files are deleted."""
+    with _open_indexes_lock:
+        _open_indexes.pop(path, None)
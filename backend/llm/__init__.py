@@ -0,0 +1,5 @@
+"""
+LLM provider subsystem: pooled, rate-limited streaming clients for the model
+providers configured in ModelProviderSetting, and a local mock provider for
+offline load tests.
+"""
@@ -0,0 +1,297 @@
+"""
+Async streaming clients for LLM providers.
+
+There is one client per provider, shared by all requests. Each client owns a
+pooled `httpx.AsyncClient`, so requests reuse open (TLS) connections instead of
+opening one per request. A semaphore caps the number of in-flight requests per
+provider, so a burst of chats queues here rather than tripping the provider's
+rate limits.
+
+The per-request `timeout` (seconds to connect and between streamed chunks) and
+`max_retries` come from the request, i.e. from ChatRequest and the user's
+ModelProviderSetting. Connection errors, timeouts, 429s and 5xx responses are
+retried with exponential backoff and full jitter, honouring `Retry-After`, but
+only until the first token has been streamed: after that a retry would repeat
+text the user has already seen.
+"""
+import os
+import json
+import time
+import hashlib
+import random
+import asyncio
+import logging
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+import models as models
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROVIDER_CONCURRENCY = 64  # in-flight requests per provider
+RETRY_BASE_DELAY = 0.5  # seconds
+RETRY_MAX_DELAY = 8.0  # seconds
+RETRYABLE_STATUS = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+MOCK_PROVIDER_URL = os.environ.get("MOCK_PROVIDER_URL", "http://127.0.0.1:8100/v1")
+
+# provider name -> endpoint and limits; keys match ChatRequest.provider and ModelProviderSetting.provider
+PROVIDERS = {
+    "OpenAI": {"api": "openai", "base_url": os.environ.get("OPENAI_BASE_URL", "https://api.openai.com/v1"), "max_concurrency": 64},
+    "Gemini": {"api": "gemini", "base_url": os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"), "max_concurrency": 64},
+    # OpenAI-compatible server from llm/mock_server.py; needs no API key
+    "Mock": {"api": "openai", "base_url": MOCK_PROVIDER_URL, "max_concurrency": 256, "requires_api_key": False},
+}
+
+
+class ProviderError(Exception):
+    """Raised when a provider request fails after its retries, or cannot be retried."""
+
+    def __init__(self, provider: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+
+
+class _RetryableError(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Exponential backoff with full jitter, or the server's Retry-After if that is longer."""
+    delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    try:
+        return min(RETRY_MAX_DELAY, float(response.headers.get("retry-after", "")))
+    except ValueError:
+        return None
+
+
+class ProviderClient(ABC):
+    """Streams completions from one provider over a shared connection pool."""
+
+    def __init__(self, provider: str, base_url: str, max_concurrency: int = DEFAULT_PROVIDER_CONCURRENCY, requires_api_key: bool = True):
+        self.provider = provider
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.requires_api_key = requires_api_key
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=httpx.Timeout(60.0),
+        )
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.first_token_seconds = 0.0
+        self.first_tokens = 0
+
+    @abstractmethod
+    def build_request(self, request: models.CompletionRequest) -> httpx.Request:
+        """Returns the provider's streaming HTTP request for a completion."""
+
+    @abstractmethod
+    def parse_event(self, data: str) -> Optional[str]:
+        """Returns the text delta carried by one SSE `data:` payload, if any."""
+
+    async def stream(self, request: models.CompletionRequest) -> AsyncIterator[str]:
+        """Yields the completion's text deltas as the provider streams them."""
+        if self.requires_api_key and not request.api_key:
+            raise ProviderError(self.provider, "No API key is configured for this provider.")
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        self.requests += 1
+        started = time.perf_counter()
+        streamed = False
+        try:
+            for attempt in range(request.max_retries + 1):
+                try:
+                    async for delta in self._attempt(request):
+                        if not streamed:
+                            streamed = True
+                            self.first_tokens += 1
+                            self.first_token_seconds += time.perf_counter() - started
+                        yield delta
+                    return
+                except _RetryableError as e:
+                    if streamed or attempt == request.max_retries:
+                        raise ProviderError(self.provider, f"{e} (after {attempt + 1} attempts)")
+                    delay = backoff_delay(attempt, e.retry_after)
+                    self.retries += 1
+                    logger.warning(f"{self.provider}: {e}; retrying in {delay:.2f}s ({attempt + 1}/{request.max_retries}).")
+                    await asyncio.sleep(delay)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def _attempt(self, request: models.CompletionRequest) -> AsyncIterator[str]:
+        timeout = httpx.Timeout(request.timeout, connect=min(request.timeout, 10.0))
+        http_request = self.build_request(request)
+        http_request.extensions["timeout"] = timeout.as_dict()
+        try:
+            response = await self._http.send(http_request, stream=True)
+        except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+            raise _RetryableError(f"{type(e).__name__}: {e}")
+        try:
+            if response.status_code in RETRYABLE_STATUS:
+                raise _RetryableError(f"HTTP {response.status_code}", _retry_after(response))
+            if response.status_code >= 400:
+                body = (await response.aread()).decode("utf-8", "replace")[:500]
+                raise ProviderError(self.provider, f"HTTP {response.status_code}: {body}", response.status_code)
+            try:
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    try:
+                        delta = self.parse_event(line[5:].strip())
+                    except (ValueError, AttributeError, IndexError) as e:
+                        raise ProviderError(self.provider, f"Malformed stream event: {e}")
+                    if delta:
+                        yield delta
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as e:
+                raise _RetryableError(f"Stream interrupted: {type(e).__name__}: {e}")
+        finally:
+            await response.aclose()
+
+    async def complete(self, request: models.CompletionRequest) -> str:
+        """Returns the full completion."""
+        return "".join([delta async for delta in self.stream(request)])
+
+    async def close(self):
+        await self._http.aclose()
+
+    def stats(self) -> models.ProviderClientStats:
+        return models.ProviderClientStats(
+            base_url=self.base_url,
+            max_concurrency=self.max_concurrency,
+            waiting=self.waiting,
+            in_flight=self.in_flight,
+            requests=self.requests,
+            retries=self.retries,
+            failures=self.failures,
+            average_first_token_ms=1000 * self.first_token_seconds / self.first_tokens if self.first_tokens else 0.0,
+        )
+
+
+class OpenAIClient(ProviderClient):
+    """Chat Completions API, also spoken by the mock provider and many self-hosted servers."""
+
+    def build_request(self, request: models.CompletionRequest) -> httpx.Request:
+        headers = {"Authorization": f"Bearer {request.api_key}"} if request.api_key else {}
+        return self._http.build_request("POST", f"{self.base_url}/chat/completions", headers=headers, json={
+            "model": request.model,
+            "messages": [message.model_dump() for message in request.messages],
+            "temperature": request.temperature,
+            "max_tokens": request.max_tokens,
+            "stream": True,
+        })
+
+    def parse_event(self, data: str) -> Optional[str]:
+        if data == "[DONE]":
+            return None
+        choices = json.loads(data).get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content")
+
+
+class GeminiClient(ProviderClient):
+    """Gemini `streamGenerateContent` API."""
+
+    def build_request(self, request: models.CompletionRequest) -> httpx.Request:
+        system = [message.content for message in request.messages if message.role == "system"]
+        body = {
+            "contents": [
+                {"role": "model" if message.role == "assistant" else "user", "parts": [{"text": message.content}]}
+                for message in request.messages if message.role != "system"
+            ],
+            "generationConfig": {"temperature": request.temperature, "maxOutputTokens": request.max_tokens},
+        }
+        if system:
+            body["systemInstruction"] = {"parts": [{"text": "\n\n".join(system)}]}
+        return self._http.build_request(
+            "POST",
+            f"{self.base_url}/models/{request.model}:streamGenerateContent",
+            params={"alt": "sse"},
+            headers={"x-goog-api-key": request.api_key or ""},
+            json=body,
+        )
+
+    def parse_event(self, data: str) -> Optional[str]:
+        candidates = json.loads(data).get("candidates") or [{}]
+        parts = (candidates[0].get("content") or {}).get("parts") or []
+        return "".join(part.get("text", "") for part in parts)
+
+
+CLIENT_TYPES = {"openai": OpenAIClient, "gemini": GeminiClient}
+
+
+def completion_key(request: models.CompletionRequest) -> str:
+    """Identifies a completion request, API key included, for coalescing identical concurrent requests."""
+    return hashlib.sha256(request.model_dump_json().encode("utf-8")).hexdigest()
+
+
+class ProviderClients:
+    """
+    Creates one client per provider on first use and closes them all on shutdown.
+
+    Identical concurrent completion requests (same provider, model, messages,
+    settings and API key) share one provider call and all receive its stream.
+    """
+
+    def __init__(self, providers: Optional[Dict[str, dict]] = None):
+        self.providers = dict(PROVIDERS if providers is None else providers)
+        self._clients: Dict[str, ProviderClient] = {}
+        self.coalescer = SingleFlight()
+
+    def is_supported(self, provider: str) -> bool:
+        return provider in self.providers
+
+    def requires_api_key(self, provider: str) -> bool:
+        return self.providers.get(provider, {}).get("requires_api_key", True)
+
+    def get(self, provider: str) -> ProviderClient:
+        """Returns the shared client for a provider."""
+        client = self._clients.get(provider)
+        if client is None:
+            config = self.providers.get(provider)
+            if config is None:
+                raise ProviderError(provider, "Unknown provider.")
+            client = CLIENT_TYPES[config["api"]](
+                provider,
+                config["base_url"],
+                max_concurrency=config.get("max_concurrency", DEFAULT_PROVIDER_CONCURRENCY),
+                requires_api_key=config.get("requires_api_key", True),
+            )
+            self._clients[provider] = client
+        return client
+
+    def stream(self, request: models.CompletionRequest) -> AsyncIterator[str]:
+        client = self.get(request.provider)
+        return self.coalescer.stream(completion_key(request), lambda: client.stream(request))
+
+    async def close(self):
+        for client in self._clients.values():
+            await client.close()
+        self._clients.clear()
+
+    def stats(self) -> models.ProviderStats:
+        return models.ProviderStats(
+            providers={name: client.stats() for name, client in self._clients.items()},
+            coalescing=self.coalescer.stats(),
+        )
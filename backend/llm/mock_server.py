@@ -0,0 +1,109 @@
+"""
+A local, OpenAI-compatible mock model provider for offline development and load tests.
+
+Serves `POST /v1/chat/completions`, streamed or not. The reply is built from the
+last user message and streamed word by word, after a configurable time to
+first token and with a configurable delay between tokens. A fraction of
+requests can fail with 503 (and a Retry-After header) to exercise retries:
+
+    python -m llm.mock_server --port 8100 --first-token-ms 200 --token-ms 20 --error-rate 0.05
+
+Point the "Mock" provider at it with MOCK_PROVIDER_URL (default
+http://127.0.0.1:8100/v1).
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Any, Dict, List
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULTS = {"first_token_ms": 200.0, "token_ms": 20.0, "tokens": 40, "error_rate": 0.0}
+
+
+def mock_reply(messages: List[Dict[str, Any]], tokens: int) -> List[str]:
+    """Returns the reply's tokens: an acknowledgement of the last user message, padded to `tokens` words."""
+    prompt = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    words = f"This is a mock reply to: {' '.join(prompt.split()[:20])}.".split()
+    filler = "The quick brown fox jumps over the lazy dog.".split()
+    while len(words) < tokens:
+        words.append(filler[len(words) % len(filler)])
+    return [word + " " for word in words[:tokens]]
+
+
+def create_app(first_token_ms: float, token_ms: float, tokens: int, error_rate: float) -> FastAPI:
+    app = FastAPI(title="Mock LLM provider")
+    app.state.requests = 0
+    app.state.errors = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if random.random() < error_rate:
+            app.state.errors += 1
+            return JSONResponse({"error": {"message": "Mock overload"}}, status_code=503, headers={"Retry-After": "0.05"})
+        reply = mock_reply(body.get("messages", []), min(tokens, int(body.get("max_tokens") or tokens)))
+        completion_id = f"chatcmpl-mock-{app.state.requests}"
+        model = body.get("model", "mock")
+
+        if not body.get("stream"):
+            await asyncio.sleep((first_token_ms + token_ms * (len(reply) - 1)) / 1000)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(reply)}, "finish_reason": "stop"}],
+            }
+
+        async def events():
+            await asyncio.sleep(first_token_ms / 1000)
+            for i, token in enumerate(reply):
+                if i:
+                    await asyncio.sleep(token_ms / 1000)
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests, "errors": app.state.errors}
+
+    return app
+
+
+app = create_app(**DEFAULTS)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--first-token-ms", type=float, default=DEFAULTS["first_token_ms"])
+    parser.add_argument("--token-ms", type=float, default=DEFAULTS["token_ms"])
+    parser.add_argument("--tokens", type=int, default=DEFAULTS["tokens"])
+    parser.add_argument("--error-rate", type=float, default=DEFAULTS["error_rate"])
+    args = parser.parse_args()
+    uvicorn.run(
+        create_app(args.first_token_ms, args.token_ms, args.tokens, args.error_rate),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
+
+
+if __name__ == "__main__":
+    main()
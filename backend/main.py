@@ -3,25 +3,46 @@ Refactored main FastAPI application for the MCP server.
 """
 import os
 import re
+import json
 import uuid
 import time
+import shutil
 import logging
+from contextlib import AsyncExitStack
 from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional, Any
+from typing import Dict, List, Tuple, Optional, Any, AsyncIterator, Iterator
 
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import StreamingResponse
 from mcp.server.fastmcp import FastMCP
-from sqlalchemy import or_
+from sqlalchemy import select, or_, and_
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 import sql_models as sql_models
 import models as models
-from database import SessionLocal, engine, Base
-from database import VECTOR_STORE_DIR
-from tools import add_tools
-from agents import select_agent, get_agents_list, AgentDetail
-from security import verify_password, get_password_hash
+from database import SessionLocal, AsyncSessionLocal, engine, async_engine, Base
+from database import VECTOR_STORE_DIR, TOOL_CODE_CACHE_DIR, EMBEDDING_CACHE_PATH
+from tools import ToolRegistry, ToolCodeCache, ToolRegistrationError
+from tool_executor import ToolExecutor
+from tool_cache import ToolResultCache, canonicalize_args
+from tool_sandbox import ToolSandbox
+from knowledge.ingestion import IngestionManager, IngestionError
+from knowledge.embedding_cache import EmbeddingCache, set_embedding_cache
+from knowledge.retrieval import search_knowledge_base, KnowledgeSearcher
+from knowledge.manifest import sources_path, index_version, remove_knowledge_base_files, partial_upload_path
+from agent_loop import AgentLoop, plan_tool_calls
+from agents import select_agent, get_agents_list, router as agent_router, AgentDetail
+from memory import ConversationMemory
+from metadata_cache import MetadataCache
+from response_cache import ResponseCache
+from single_flight import SingleFlight
+from message_journal import MessageJournal, JournalClosedError
+from llm.clients import ProviderClients, ProviderError
+from security import verify_password_async, get_password_hash_async, create_access_token, verify_access_token, InvalidTokenError, password_executor, AUTH_DEV_FIRST_USER
 
 # Create all tables (This is now handled by Alembic migrations)
 Base.metadata.create_all(bind=engine)
@@ -44,12 +65,70 @@ def get_db():
     finally:
         db.close()
 
+# Dependency for `async def` handlers, whose queries must not block the event loop
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+# Dependency resolving the user from the request's access token without a database query
+async def get_current_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> models.CurrentUser:
+    if credentials is not None:
+        try:
+            return verify_access_token(credentials.credentials)
+        except InvalidTokenError as e:
+            raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+    if not AUTH_DEV_FIRST_USER:
+        raise HTTPException(status_code=401, detail="Not authenticated.", headers={"WWW-Authenticate": "Bearer"})
+    # Development only: requests without a token act as the first user
+    async with AsyncSessionLocal() as db:
+        user = (await db.execute(select(sql_models.user_registry).limit(1))).scalars().first()
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated and no users found in the database. Please sign up a user first.", headers={"WWW-Authenticate": "Bearer"})
+    return models.CurrentUser(id=str(user.id), username=user.username)
+
 # 1. Create the MCP Server instance and add tools
 mcp_server = FastMCP(
     name="AdvancedChatServer",
     instructions="A server with tools for calculation, web search, and getting the current time.",
 )
 
+# Sync tools run on the executor's worker pool so they never block the event loop
+tool_executor = ToolExecutor()
+# Results of deterministic tools are reused across calls with the same arguments
+tool_cache = ToolResultCache()
+# Identical concurrent calls of built-in and cacheable tools share one execution
+tool_flight = SingleFlight()
+# Custom tool code runs in warm worker processes rather than the API process
+tool_sandbox = ToolSandbox()
+# Custom tools are added, replaced and removed individually as they change
+tool_registry = ToolRegistry(
+    mcp_server,
+    executor=tool_executor,
+    cache=tool_cache,
+    code_cache=ToolCodeCache(TOOL_CODE_CACHE_DIR),
+    sandbox=tool_sandbox,
+)
+
+# Chunks and queries shared between knowledge bases are only embedded once per model
+embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH)
+set_embedding_cache(embedding_cache)
+# Knowledge base documents are ingested by background jobs
+ingestion_manager = IngestionManager()
+# Chat queries against several knowledge bases search them concurrently
+knowledge_searcher = KnowledgeSearcher()
+# Agents see a window of recent messages plus a rolling summary of older ones
+conversation_memory = ConversationMemory()
+# Chat messages from concurrent sessions are committed together in batches
+message_journal = MessageJournal(async_engine, durability="flush")
+# Sessions, tools, knowledge bases, prompts and database connections are read far more often than written
+metadata_cache = MetadataCache()
+# One pooled, rate-limited HTTP client per model provider, shared by all chats
+provider_clients = ProviderClients()
+# Replies to repeated questions are reused instead of running the agent again
+response_cache = ResponseCache(tool_cacheable=tool_registry.is_cacheable)
+
 # 2. Create the FastAPI application
 app = FastAPI(
     title="Advanced MCP Server with Custom Endpoints",
@@ -59,12 +138,35 @@ app = FastAPI(
 
 @app.on_event("startup")
 def startup_event():
+    tool_sandbox.start()
+    message_journal.start()
     db = SessionLocal()
     custom_tools = db.query(sql_models.CustomTool).all()
-    custom_tools_dict = {tool.id: {"name": tool.name, "description": tool.description, "code": tool.code} for tool in custom_tools}
-    add_tools(mcp_server, custom_tools_dict)
+    custom_tools_dict = {tool.id: {"name": tool.name, "description": tool.description, "code": tool.code, "cacheable": tool.cacheable} for tool in custom_tools}
+    tool_registry.add_default_tools()
+    tool_registry.load(custom_tools_dict)
     db.close()
 
+# The MCP endpoint's session manager runs for the lifetime of the app
+mcp_lifespan = AsyncExitStack()
+
+@app.on_event("startup")
+async def start_mcp_session_manager():
+    await mcp_lifespan.enter_async_context(mcp_server.session_manager.run())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await mcp_lifespan.aclose()
+    tool_sandbox.stop()
+    tool_executor.shutdown()
+    ingestion_manager.shutdown()
+    knowledge_searcher.shutdown()
+    embedding_cache.close()
+    password_executor.shutdown(wait=False, cancel_futures=True)
+    await provider_clients.close()
+    await message_journal.close()
+    await async_engine.dispose()
+
 # 3. Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -76,166 +178,423 @@ app.add_middleware(
 )
 
 # 4. Mount the MCP server's ASGI app
-# A compliant MCP client would connect to this endpoint (e.g., http://localhost:8000/mcp)
+# A compliant MCP client would connect to this endpoint (e.g., http://localhost:8000/mcp/mcp)
 app.mount("/mcp", mcp_server.streamable_http_app())
 
-def get_session_history(session_id: str, db: Session) -> List[sql_models.ChatMessage]:
-    """Retrieves a session history or raises HTTPException if not found or expired."""
-    session = db.query(sql_models.ChatSession).filter(sql_models.ChatSession.session_id == session_id).first()
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 500
+HISTORY_COLUMNS = (
+    sql_models.ChatMessage.id,
+    sql_models.ChatMessage.role,
+    sql_models.ChatMessage.content,
+    sql_models.ChatMessage.agent_used,
+    sql_models.ChatMessage.tool_calls,
+    sql_models.ChatMessage.timestamp,
+)
+
+async def get_session_history(
+    session_id: str,
+    db: AsyncSession,
+    limit: int = HISTORY_PAGE_SIZE,
+    newest_first: bool = False,
+    before: Optional[Tuple[datetime, Optional[int]]] = None,
+    after: Optional[Tuple[datetime, Optional[int]]] = None,
+) -> Tuple[List[models.HistoryMessage], bool]:
+    """
+    Returns one page of a session's history and whether more messages follow it.
+
+    Messages are ordered by (timestamp, id), and `before`/`after` bound the page
+    by that key (a key without an id bounds by timestamp alone), so each page is a range scan of the (session_id, timestamp)
+    index no matter how long the session is. Raises HTTPException if the
+    session does not exist.
+    """
+    session = (await db.execute(
+        select(sql_models.ChatSession.id).where(sql_models.ChatSession.session_id == session_id)
+    )).first()
     if not session:
         raise HTTPException(status_code=404, detail=f"Session '{session_id}' not found.")
 
     # Optional: Add session expiration logic here if needed
     # For example, check session.created_at
 
-    return session.messages
-
-def add_message_to_history(session_id: str, user_id: str, message: models.Message, db: Session):
-    """Adds a message to a session's history in the database."""
+    message = sql_models.ChatMessage
+    query = select(*HISTORY_COLUMNS).where(message.session_id == session_id)
+    if before is not None:
+        timestamp, message_id = before
+        if message_id is None:
+            query = query.where(message.timestamp < timestamp)
+        else:
+            query = query.where(or_(message.timestamp < timestamp, and_(message.timestamp == timestamp, message.id < message_id)))
+    if after is not None:
+        timestamp, message_id = after
+        if message_id is None:
+            query = query.where(message.timestamp > timestamp)
+        else:
+            query = query.where(or_(message.timestamp > timestamp, and_(message.timestamp == timestamp, message.id > message_id)))
+    if newest_first:
+        query = query.order_by(message.timestamp.desc(), message.id.desc())
+    else:
+        query = query.order_by(message.timestamp.asc(), message.id.asc())
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    return [models.HistoryMessage.model_validate(row) for row in rows[:limit]], len(rows) > limit
+
+async def history_cursor(session_id: str, message_id: Optional[int], timestamp: Optional[datetime], db: AsyncSession) -> Optional[Tuple[datetime, Optional[int]]]:
+    """Turns a message id or a timestamp into a (timestamp, id) pagination key."""
+    if message_id is not None:
+        row = (await db.execute(
+            select(sql_models.ChatMessage.timestamp, sql_models.ChatMessage.id).where(
+                sql_models.ChatMessage.id == message_id, sql_models.ChatMessage.session_id == session_id
+            )
+        )).first()
+        if row is None:
+            raise HTTPException(status_code=400, detail=f"Message {message_id} is not part of session '{session_id}'.")
+        return row.timestamp, row.id
+    if timestamp is not None:
+        return timestamp, None
+    return None
+
+async def add_message_to_history(session_id: str, user_id: str, message: models.Message):
+    """Adds a message to a session's history through the message journal."""
     # In a real app, user_id would come from an auth token
-    db_message = sql_models.ChatMessage(**message.model_dump(), session_id=session_id, user_id=user_id)
-    db.add(db_message)
-    db.commit()
+    try:
+        await message_journal.append(session_id, user_id, message)
+    except JournalClosedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
 # --- Mock Agent and Tool-Calling Logic ---
 
-def run_agent_logic(agent: models.AgentDetail, message: str, selected_kbs: List[str], db: Session) -> Tuple[str, List[models.ToolCall]]:
+def agent_event(event: str, **data: Any) -> models.ChatStreamEvent:
+    """Builds a single agent event for the streaming chat endpoint."""
+    return models.ChatStreamEvent(event=event, data=data)
+
+def reply_events(reply: str) -> Iterator[models.ChatStreamEvent]:
+    """Splits a reply into word-sized deltas, preserving the original whitespace."""
+    for delta in re.findall(r'\S+\s*|\s+', reply):
+        yield agent_event("reply_delta", delta=delta)
+
+async def completion_settings(request: models.ChatRequest, user_id: str, db: AsyncSession) -> Optional[models.CompletionRequest]:
     """
-    Simulates the agent's logic to generate a reply and decide on tool calls.
+    Returns the model call for a chat request, with the API key from the user's
+    ModelProviderSetting, or None if the provider is unknown or has no key.
     """
-    if selected_kbs:
-        logger.info(f"Selected Knowledge Bases: {selected_kbs}")
-        response_parts = []
-        for kb_id in selected_kbs:
-            kb = db.query(sql_models.KnowledgeBase).filter(sql_models.KnowledgeBase.id == kb_id).first()
-            if kb:
-                response_parts.append(f"In knowledge base '{kb.kb_name}', I found the following information about '{message}': ...")
-        if response_parts:
-            return "\n".join(response_parts), []
+    if not provider_clients.is_supported(request.provider):
+        return None
+    api_key = None
+    if provider_clients.requires_api_key(request.provider):
+        async def load_api_key() -> Optional[str]:
+            return (await db.execute(
+                select(sql_models.ModelProviderSetting.api_key).where(
+                    sql_models.ModelProviderSetting.provider == request.provider,
+                    sql_models.ModelProviderSetting.user_id == user_id,
+                )
+            )).scalars().first() or None
+
+        api_key = await metadata_cache.aload("model_settings", (request.provider, user_id), load_api_key)
+        if not api_key:
+            return None
+    return models.CompletionRequest(
+        provider=request.provider,
+        model=request.model,
+        temperature=request.temperature,
+        max_tokens=request.max_tokens,
+        timeout=request.timeout,
+        max_retries=request.max_retries,
+        api_key=api_key,
+    )
+
+async def compose_reply(
+    agent: models.AgentDetail,
+    message: str,
+    draft: str,
+    context: Optional[models.ConversationContext],
+    llm: Optional[models.CompletionRequest],
+    grounding: Optional[str] = None,
+) -> AsyncIterator[models.ChatStreamEvent]:
+    """
+    Streams the agent's reply. With a model configured, the model writes it from the
+    conversation memory and the tool or knowledge base results in `grounding`;
+    otherwise, or if the provider fails before sending anything, `draft` is sent.
+    """
+    if llm is None:
+        for event in reply_events(draft):
+            yield event
+        return
+    system = agent.system_prompt
+    if context is not None and context.summary:
+        system += f"\n\nSummary of the earlier conversation:\n{context.summary}"
+    if grounding:
+        system += f"\n\nUse this information to answer:\n{grounding}"
+    messages = [models.LLMMessage(role="system", content=system)]
+    if context is not None:
+        messages.extend(models.LLMMessage(role=m.role, content=m.content) for m in context.recent if m.role in ("user", "assistant"))
+    messages.append(models.LLMMessage(role="user", content=message))
+
+    streamed = False
+    try:
+        async for delta in provider_clients.stream(llm.model_copy(update={"messages": messages})):
+            streamed = True
+            yield agent_event("reply_delta", delta=delta)
+    except ProviderError as e:
+        logger.warning(f"Agent '{agent.name}': model call failed: {e}")
+        yield agent_event("model_error", detail=str(e))
+        if streamed:
+            yield agent_event("reply_delta", delta="\n(The model's reply was interrupted.)")
         else:
-            return f"I could not find any information about '{message}' in the selected knowledge bases.", []
-
-
-    tool_calls = []
-
-    # A map to connect agent names to their primary tool
-    agent_tool_map = {
-        "MathWhiz": "calculator",
-        "WebResearcher": "web_search",
-        "Generalist": "current_time",
-    }
-
-    if agent.name == "MathWhiz":
-        match = re.search(r'(\d+\.?\d*)\s*([\+\-\*\/])\s*(\d+\.?\d*)', message)
-        if match:
-            a, op_symbol, b = match.groups()
-            op_map = {"+": "add", "-": "subtract", "*": "multiply", "/": "divide"}
-            op = op_map.get(op_symbol)
-            if op:
-                tool_name = "calculator"
-                args = {"a": float(a), "b": float(b), "op": op}
-                # This is a default tool, so we can call it directly
-                result = mcp_server._tool_manager.call_tool_by_name(tool_name, args)
-                tool_calls.append(models.ToolCall(tool=tool_name, args=args, result=str(result)))
-                return f"I've calculated that for you. {result}", tool_calls
-        return "I can help with math. Please provide a simple expression like '123 + 456'.", []
-
-    elif agent.name == "WebResearcher":
-        tool_name = "web_search"
-        args = {"query": message}
-        result = mcp_server._tool_manager.call_tool_by_name(tool_name, args)
-        tool_calls.append(models.ToolCall(tool=tool_name, args=args, result=str(result)))
-        return f"Based on my web search: {result}", tool_calls
+            for event in reply_events(draft):
+                yield event
 
-    elif agent.name == "Generalist":
-        if "time" in message.lower():
-            tool_name = "current_time"
-            args = {}
-            result = mcp_server._tool_manager.call_tool_by_name(tool_name, args)
-            tool_calls.append(models.ToolCall(tool=tool_name, args=args, result=str(result)))
-            return f"You asked about the time. {result}", tool_calls
+async def call_tool(tool_name: str, args: Dict[str, Any]) -> models.ToolCall:
+    """
+    Invokes a registered MCP tool and records the call, including any failure.
+    Concurrent identical calls of idempotent tools share one invocation.
+    """
+    if tool_registry.is_idempotent(tool_name):
+        return await tool_flight.do((tool_name, canonicalize_args(args)), lambda: invoke_tool(tool_name, args))
+    return await invoke_tool(tool_name, args)
 
-        return f"As the Generalist, I can tell you: '{message}' is an interesting topic!", []
+async def invoke_tool(tool_name: str, args: Dict[str, Any]) -> models.ToolCall:
+    """Invokes a tool once; see call_tool."""
+    try:
+        result = await mcp_server._tool_manager.call_tool(tool_name, args)
+    except Exception as e:
+        # FastMCP wraps tool failures, so report the underlying error (e.g. a ToolTimeoutError)
+        error = e.__cause__ or e
+        logger.error(f"Tool '{tool_name}' failed: {error}")
+        result = f"Error: {error}"
+    return models.ToolCall(tool=tool_name, args=args, result=str(result))
+
+# Agent turns run their planned tool calls through call_tool, independent ones in parallel
+agent_loop = AgentLoop(call_tool)
+
+# How the agent's built-in reply introduces each tool's result
+TOOL_REPLY_PREFIXES = {
+    "calculator": "I've calculated that for you.",
+    "web_search": "Based on my web search:",
+    "current_time": "You asked about the time.",
+}
+
+def tool_reply(tool_calls: List[models.ToolCall]) -> str:
+    """Builds the agent's built-in reply from the results of its tool calls."""
+    lines = [f"{TOOL_REPLY_PREFIXES.get(call.tool, f'The {call.tool} tool returned:')} {call.result}" for call in tool_calls]
+    if len(lines) == 1:
+        return lines[0]
+    return "\n".join(["Here is what I found:"] + [f"- {line}" for line in lines])
+
+async def get_knowledge_bases(kb_ids: List[int], db: AsyncSession) -> List[models.KnowledgeBase]:
+    """Returns the existing knowledge bases among `kb_ids`, reading only the ones missing from the metadata cache."""
+    kbs, missing = {}, []
+    for kb_id in dict.fromkeys(kb_ids):
+        found, kb = metadata_cache.get("knowledge_bases", kb_id)
+        if found:
+            kbs[kb_id] = kb
+        else:
+            missing.append(kb_id)
+    if missing:
+        generation = metadata_cache.generation("knowledge_bases")
+        db_kbs = (await db.execute(select(sql_models.KnowledgeBase).where(sql_models.KnowledgeBase.id.in_(missing)))).scalars().all()
+        for db_kb in db_kbs:
+            kbs[db_kb.id] = models.KnowledgeBase.model_validate(db_kb)
+            metadata_cache.put("knowledge_bases", db_kb.id, kbs[db_kb.id], generation)
+    return [kbs[kb_id] for kb_id in dict.fromkeys(kb_ids) if kb_id in kbs]
+
+async def response_cache_scope(
+    agent: models.AgentDetail,
+    selected_kbs: List[str],
+    llm: Optional[models.CompletionRequest],
+    user_id: str,
+    context: Optional[models.ConversationContext],
+    db: AsyncSession,
+) -> Optional[Tuple]:
+    """
+    Returns what a cached reply to a message depends on besides the message: the
+    agent, the model and the knowledge bases searched, down to their index contents.
 
-    return "I'm not sure how to respond to that.", []
+    Replies written without a model are shared by all users. A model's reply is
+    only shared with the same user, whose settings and API key produced it, and is
+    not cached at all (None) once it is written from the session's conversation memory.
+    """
+    if llm is not None and context is not None and (context.summary or context.recent):
+        return None
+    kb_ids = [int(kb_id) for kb_id in selected_kbs if str(kb_id).isdigit()]
+    kbs = await get_knowledge_bases(kb_ids, db) if kb_ids else []
+    model = (user_id, llm.provider, llm.model, llm.temperature, llm.max_tokens) if llm is not None else None
+    return agent.name, model, tuple((kb.id, kb.retrieval_mode, index_version(kb.path)) for kb in kbs)
+
+async def stream_agent_logic(
+    agent: models.AgentDetail,
+    message: str,
+    selected_kbs: List[str],
+    db: AsyncSession,
+    context: Optional[models.ConversationContext] = None,
+    llm: Optional[models.CompletionRequest] = None,
+) -> AsyncIterator[models.ChatStreamEvent]:
+    """
+    Simulates the agent's logic, yielding tool-call and reply events as they happen.
+    The agent's tool calls are planned from the message and run by `agent_loop`,
+    independent calls in parallel. `context` is the conversation memory the message was sent in. With `llm`, the
+    reply is written by that model from the tool or knowledge base results, and a
+    `model_error` event precedes the fallback reply if the model call fails.
+    """
+    if selected_kbs:
+        logger.info(f"Selected Knowledge Bases: {selected_kbs}")
+        kb_ids = [int(kb_id) for kb_id in selected_kbs if str(kb_id).isdigit()]
+        kbs = await get_knowledge_bases(kb_ids, db)
+        chunks, timed_out = await knowledge_searcher.search(kbs, message)
+        citations = None
+        if chunks:
+            citations = "\n".join(f"- [{chunk.kb_name}: {chunk.source}#{chunk.chunk}] {chunk.text}" for chunk in chunks)
+            reply = f"In the selected knowledge bases, I found the following information about '{message}':\n{citations}"
+        else:
+            reply = f"I could not find any information about '{message}' in the selected knowledge bases."
+        if timed_out:
+            names = ", ".join(f"'{kb.kb_name}'" for kb in timed_out)
+            reply += f"\n(Skipped knowledge bases that did not respond in time: {names}.)"
+        async for event in compose_reply(agent, message, reply, context, llm, citations):
+            yield event
+        return
+
+    plan = plan_tool_calls(agent, message)
+    results: List[Optional[models.ToolCall]] = []
+    async for event in agent_loop.run(plan, results):
+        yield event
+    tool_calls = [result for result in results if result is not None]
+
+    grounding = None
+    if tool_calls:
+        reply = tool_reply(tool_calls)
+        grounding = "\n".join(f"Result of the {call.tool} tool: {call.result}" for call in tool_calls)
+    elif agent.name == "MathWhiz":
+        reply = "I can help with math. Please provide a simple expression like '123 + 456'."
+    elif agent.name == "Generalist":
+        reply = f"As the Generalist, I can tell you: '{message}' is an interesting topic!"
+    else:
+        reply = "I'm not sure how to respond to that."
+
+    async for event in compose_reply(agent, message, reply, context, llm, grounding):
+        yield event
+
+async def run_agent_logic(
+    agent: models.AgentDetail,
+    message: str,
+    selected_kbs: List[str],
+    db: AsyncSession,
+    context: Optional[models.ConversationContext] = None,
+    llm: Optional[models.CompletionRequest] = None,
+) -> Tuple[str, List[models.ToolCall], bool]:
+    """
+    Runs the agent's logic to completion and returns the reply, the tool calls made
+    and whether the model call failed, i.e. the reply is a fallback.
+    """
+    reply_parts, tool_calls, model_failed = [], [], False
+    async for event in stream_agent_logic(agent, message, selected_kbs, db, context, llm):
+        if event.event == "reply_delta":
+            reply_parts.append(event.data["delta"])
+        elif event.event == "tool_call_finished":
+            tool_calls.append(models.ToolCall(**event.data))
+        elif event.event == "model_error":
+            model_failed = True
+    return "".join(reply_parts), tool_calls, model_failed
 
 
 # --- Custom FastAPI Endpoints ---
 
 @app.post("/signup", tags=["Authentication"])
-async def register_user(user: models.user_signup, db: Session = Depends(get_db)):
+async def register_user(user: models.user_signup, db: AsyncSession = Depends(get_async_db)):
     """Registers a new user."""
-    db_user = db.query(sql_models.user_registry).filter(sql_models.user_registry.username == user.username.lower()).first()
+    db_user = (await db.execute(
+        select(sql_models.user_registry).where(sql_models.user_registry.username == user.username.lower())
+    )).scalars().first()
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await get_password_hash_async(user.password)
     db_user = sql_models.user_registry(name = user.name, username=user.username.lower(), email=user.email.lower(), password=hashed_password)
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
     return {"message": "User registered successfully"}
 
 @app.post("/login", tags=["Authentication"])
-async def login(user: models.user_login, db: Session = Depends(get_db)):
+async def login(user: models.user_login, db: AsyncSession = Depends(get_async_db)):
     """Logs in a user."""
-    db_user = db.query(sql_models.user_registry).filter(
-        or_(sql_models.user_registry.username == user.login_identifier.lower(), sql_models.user_registry.email == user.login_identifier.lower())
-    ).first()
+    db_user = (await db.execute(
+        select(sql_models.user_registry).where(
+            or_(sql_models.user_registry.username == user.login_identifier.lower(), sql_models.user_registry.email == user.login_identifier.lower())
+        )
+    )).scalars().first()
     if not db_user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    if not verify_password(user.password, db_user.password):
+    if not await verify_password_async(user.password, db_user.password):
         raise HTTPException(status_code=401, detail="Incorrect username or password")
-    # In a real app, you would generate a JWT token here.
-    # For now, we'll use the user's ID as a simple token.
-    access_token = str(db_user.id)
-    return {"message": "Login successful", "access_token": access_token, "user_id": access_token}
+    access_token, expires_in = create_access_token(str(db_user.id), db_user.username)
+    return {"message": "Login successful", "access_token": access_token, "token_type": "bearer", "expires_in": expires_in, "user_id": str(db_user.id)}
 
 
 @app.post("/new-session", response_model=models.NewSessionResponse, tags=["Session Management"])
-async def new_session(db: Session = Depends(get_db)):
-    """Creates a new chat session."""
+async def new_session(user: models.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Creates a new chat session for the current user."""
     session_id = str(uuid.uuid4())
-    # In a real app, user_id would come from an auth token.
-    # For now, we'll use a placeholder or the first user.
-    user = db.query(sql_models.user_registry).first()
-    if not user:
-        # To make this work without a user, we can create a placeholder if none exist
-        # This is not ideal for production but good for development.
-        raise HTTPException(status_code=500, detail="No users found in the database. Please sign up a user first.")
     new_db_session = sql_models.ChatSession(user_id=user.id, session_id=session_id, title="New Chat")
     db.add(new_db_session)
-    db.commit()
-    db.refresh(new_db_session)
+    await db.commit()
     logger.info(f"User {user.username} started a new session: {session_id}")
     return models.NewSessionResponse(session_id=session_id, created_at=new_db_session.created_at)
 
 @app.get("/sessions", response_model=List[models.ChatSessionInfo], tags=["Session Management"])
-async def get_sessions(db: Session = Depends(get_db)):
+async def get_sessions(user: models.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """Retrieves all chat sessions for the current user."""
-    # In a real app, user_id would come from an auth token.
-    # For now, we'll use a placeholder for the first user.
-    user = db.query(sql_models.user_registry).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="No users found in the database.")
-
-    sessions = db.query(sql_models.ChatSession).filter(sql_models.ChatSession.user_id == user.id).order_by(sql_models.ChatSession.created_at.desc()).all()
+    sessions = (await db.execute(
+        select(sql_models.ChatSession).where(sql_models.ChatSession.user_id == user.id).order_by(sql_models.ChatSession.created_at.desc())
+    )).scalars().all()
     return sessions
 
-@app.post("/chat", response_model=models.ChatResponse, tags=["Chat"])
-async def chat(request: models.ChatRequest, db: Session = Depends(get_db)):
-    """Handles a user message and returns an agent's reply."""
-    # Ensure session exists
-    session = db.query(sql_models.ChatSession).filter(sql_models.ChatSession.session_id == request.session_id and sql_models.ChatSession.user_id == request.user_id).first()
+async def get_chat_session(session_id: str, db: AsyncSession) -> models.ChatSessionRecord:
+    """Retrieves a chat session, from the metadata cache if possible, or raises HTTPException if not found."""
+    async def load_session() -> Optional[models.ChatSessionRecord]:
+        session = (await db.execute(
+            select(sql_models.ChatSession).where(sql_models.ChatSession.session_id == session_id)
+        )).scalars().first()
+        return models.ChatSessionRecord.model_validate(session) if session else None
+
+    session = await metadata_cache.aload("sessions", session_id, load_session)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+async def get_own_chat_session(session_id: str, user: models.CurrentUser, db: AsyncSession) -> models.ChatSessionRecord:
+    """Retrieves a chat session of the current user; another user's session is reported as not found."""
+    session = await get_chat_session(session_id, db)
+    if str(session.user_id) != user.id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+async def update_conversation_memory(session: models.ChatSessionRecord, db: AsyncSession):
+    """Folds old messages into the session's summary and refreshes the cached session if its summary moved."""
+    updated = await conversation_memory.update(session, db)
+    if updated is not None:
+        metadata_cache.put("sessions", session.session_id, updated)
+
+@app.post("/chat", response_model=models.ChatResponse, tags=["Chat"])
+async def chat(request: models.ChatRequest, user: models.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """Handles a user message and returns an agent's reply."""
+    # Ensure the session exists and belongs to the user, whose model settings and API key are used
+    session = await get_own_chat_session(request.session_id, user, db)
+    context = await conversation_memory.load(session, db)
+    llm = await completion_settings(request, session.user_id, db)
 
     # 1. Add user message to history
     user_message = models.Message(role="user", content=request.message)
-    add_message_to_history(request.session_id, session.user_id, user_message, db)
+    await add_message_to_history(request.session_id, session.user_id, user_message)
 
-    # 2. Select agent and run logic
+    # 2. Select agent and run logic, unless the reply to this question is cached
     agent = select_agent(request.message, request.agent)
-    reply_content, tool_calls = run_agent_logic(agent, request.message, request.selected_kbs, db)
+    scope = await response_cache_scope(agent, request.selected_kbs, llm, session.user_id, context, db)
+    cached = await response_cache.get_async(scope, request.message) if scope is not None else None
+    if cached is not None:
+        reply_content, tool_calls, cache_match = cached
+    else:
+        reply_content, tool_calls, model_failed = await run_agent_logic(agent, request.message, request.selected_kbs, db, context, llm)
+        cache_match = None
+        if scope is not None and not model_failed:
+            await response_cache.set_async(scope, request.message, reply_content, tool_calls)
 
     # 3. Add assistant reply to history
     assistant_message = models.Message(
@@ -244,54 +603,248 @@ async def chat(request: models.ChatRequest, db: Session = Depends(get_db)):
         agent_used=agent.name,
         tool_calls=tool_calls,
     )
-    add_message_to_history(request.session_id, session.user_id, assistant_message, db)
+    await add_message_to_history(request.session_id, session.user_id, assistant_message)
+    await update_conversation_memory(session, db)
 
-    logger.info(f"Session {request.session_id}: Agent '{agent.name}' replied.")
+    logger.info(f"Session {request.session_id}: Agent '{agent.name}' replied{' from the response cache' if cached else ''}.")
 
     return models.ChatResponse(
         reply=reply_content,
         agent_used=agent.name,
         tool_calls=tool_calls,
-        timestamp=assistant_message.timestamp
+        timestamp=assistant_message.timestamp,
+        cached=cached is not None,
+        cache_match=cache_match,
+    )
+
+@app.get("/chat/cache/stats", response_model=models.ResponseCacheStats, tags=["Chat"])
+async def get_response_cache_stats():
+    """Returns the size and exact/semantic hit counters of the chat response cache."""
+    return response_cache.stats()
+
+@app.get("/chat/journal/stats", response_model=models.MessageJournalStats, tags=["Chat"])
+async def get_message_journal_stats():
+    """Returns the chat message journal's durability mode, queue length and batch counters."""
+    return message_journal.stats()
+
+def format_sse(event: models.ChatStreamEvent) -> str:
+    """Serializes an agent event as a Server-Sent Events frame."""
+    return f"event: {event.event}\ndata: {json.dumps(event.data, default=str)}\n\n"
+
+@app.post("/chat/stream", tags=["Chat"])
+async def chat_stream(request: models.ChatRequest, user: models.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Handles a user message and streams the agent's progress as Server-Sent Events.
+
+    Emits `agent_selected`, `tool_call_started`, `tool_call_finished` and `reply_delta`
+    events as they happen, followed by a final `done` event carrying the `ChatResponse`.
+    A cached reply is streamed as `reply_delta` events right after `agent_selected`.
+    The assistant message is persisted once, after the reply has been fully generated.
+    """
+    session = await get_own_chat_session(request.session_id, user, db)
+    user_id = session.user_id
+    context = await conversation_memory.load(session, db)
+    llm = await completion_settings(request, user_id, db)
+
+    user_message = models.Message(role="user", content=request.message)
+    await add_message_to_history(request.session_id, user_id, user_message)
+
+    agent = select_agent(request.message, request.agent)
+    scope = await response_cache_scope(agent, request.selected_kbs, llm, user_id, context, db)
+    cached = await response_cache.get_async(scope, request.message) if scope is not None else None
+
+    async def event_stream() -> AsyncIterator[str]:
+        # The request-scoped session may already be closed once the response starts
+        # streaming, so the generator works with its own session.
+        stream_db = AsyncSessionLocal()
+        try:
+            yield format_sse(agent_event("agent_selected", agent=agent.name))
+
+            if cached is not None:
+                reply, tool_calls, cache_match = cached
+                for event in reply_events(reply):
+                    yield format_sse(event)
+                reply_parts = [reply]
+            else:
+                reply_parts, tool_calls, cache_match, model_failed = [], [], None, False
+                async for event in stream_agent_logic(agent, request.message, request.selected_kbs, stream_db, context, llm):
+                    if event.event == "reply_delta":
+                        reply_parts.append(event.data["delta"])
+                    elif event.event == "tool_call_finished":
+                        tool_calls.append(models.ToolCall(**event.data))
+                    elif event.event == "model_error":
+                        model_failed = True
+                    yield format_sse(event)
+                if scope is not None and not model_failed:
+                    await response_cache.set_async(scope, request.message, "".join(reply_parts), tool_calls)
+
+            assistant_message = models.Message(
+                role="assistant",
+                content="".join(reply_parts),
+                agent_used=agent.name,
+                tool_calls=tool_calls,
+            )
+            await add_message_to_history(request.session_id, user_id, assistant_message)
+            await update_conversation_memory(await get_chat_session(request.session_id, stream_db), stream_db)
+            logger.info(f"Session {request.session_id}: Agent '{agent.name}' streamed a reply.")
+
+            response = models.ChatResponse(
+                reply=assistant_message.content,
+                agent_used=agent.name,
+                tool_calls=tool_calls,
+                timestamp=assistant_message.timestamp,
+                cached=cached is not None,
+                cache_match=cache_match,
+            )
+            yield format_sse(agent_event("done", **response.model_dump(mode="json")))
+        except Exception as e:
+            logger.error(f"Session {request.session_id}: Streaming chat failed: {e}")
+            yield format_sse(agent_event("error", detail=str(e)))
+        finally:
+            await stream_db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 @app.get("/history/{session_id}", response_model=models.HistoryResponse, tags=["Session Management"])
-async def get_history(session_id: str, db: Session = Depends(get_db)):
-    """Retrieves the full chat history for a session."""
-    history = get_session_history(session_id, db)
-    return models.HistoryResponse(session_id=session_id, history=history)
+async def get_history(
+    session_id: str,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=MAX_HISTORY_PAGE_SIZE),
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+    before_timestamp: Optional[datetime] = None,
+    after_timestamp: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Retrieves a page of the chat history for a session.
+
+    `order=desc` returns the newest messages first; pass `next_cursor` as `before`
+    to load older pages. With the default `order=asc`, pass it as `after`.
+    """
+    before_key = await history_cursor(session_id, before, before_timestamp, db)
+    after_key = await history_cursor(session_id, after, after_timestamp, db)
+    history, has_more = await get_session_history(session_id, db, limit, order == "desc", before_key, after_key)
+    next_cursor = history[-1].id if has_more else None
+    return models.HistoryResponse(session_id=session_id, history=history, has_more=has_more, next_cursor=next_cursor)
+
+@app.get("/history/{session_id}/memory", response_model=models.ConversationContext, tags=["Session Management"])
+async def get_memory(session_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Returns the conversation memory agents see for a session: its rolling summary and most recent messages."""
+    session = await get_chat_session(session_id, db)
+    return await conversation_memory.load(session, db)
 
 @app.get("/agents", response_model=models.AgentsListResponse, tags=["Discovery"])
 async def list_agents():
     """Lists all available agents."""
     return models.AgentsListResponse(agents=get_agents_list())
 
+@app.post("/agents/route", response_model=models.AgentRouteResponse, tags=["Discovery"])
+def route_messages(request: models.AgentRouteRequest):
+    """Routes a batch of messages to agents without running them, e.g. to analyse how traffic would be routed."""
+    started = time.perf_counter()
+    try:
+        results = agent_router.classify(request.messages, request.mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    counts: Dict[str, int] = {}
+    for result in results:
+        counts[result.agent] = counts.get(result.agent, 0) + 1
+    return models.AgentRouteResponse(
+        mode=request.mode or agent_router.mode,
+        results=results,
+        counts=counts,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
+
 @app.get("/tools", response_model=models.ToolsListResponse, tags=["Discovery"])
-async def list_tools(db: Session = Depends(get_db)):
+async def list_tools():
     """Lists all available tools and their schemas."""
-    # TODO: This needs to be reimplemented to load tools from DB
-    tools = await mcp_server.list_tools()
-    tools_list = [
-        models.ToolDetail(
-            tool_name=tool.name,
-            description=tool.description or "",
-            schema=tool.inputSchema,
-        )
-        for tool in tools
-    ]
-    return models.ToolsListResponse(tools=tools_list)
+    async def load_tools() -> models.ToolsListResponse:
+        tools = await mcp_server.list_tools()
+        tools_list = [
+            models.ToolDetail(
+                tool_name=tool.name,
+                description=tool.description or "",
+                schema=tool.inputSchema,
+            )
+            for tool in tools
+        ]
+        return models.ToolsListResponse(tools=tools_list)
+
+    return await metadata_cache.aload("tools", "list", load_tools)
+
+@app.get("/tools/executor/stats", response_model=models.ToolExecutorStats, tags=["Tools Hub"])
+async def get_tool_executor_stats():
+    """Returns queue depth, concurrency and timeout counters for tool execution."""
+    return tool_executor.stats()
+
+@app.get("/tools/cache/stats", response_model=models.ToolCacheStats, tags=["Tools Hub"])
+async def get_tool_cache_stats():
+    """Returns the size and hit/miss counters of the tool result cache."""
+    return tool_cache.stats()
+
+@app.get("/tools/coalescing/stats", response_model=models.SingleFlightStats, tags=["Tools Hub"])
+async def get_tool_coalescing_stats():
+    """Returns how many tool calls shared an identical call that was already running."""
+    return tool_flight.stats()
+
+@app.get("/tools/sandbox/stats", response_model=models.ToolSandboxStats, tags=["Tools Hub"])
+async def get_tool_sandbox_stats():
+    """Returns worker and call counters for the custom tool sandbox."""
+    return tool_sandbox.stats()
+
+@app.get("/cache/metadata/stats", response_model=models.MetadataCacheStats, tags=["Discovery"])
+async def get_metadata_cache_stats():
+    """Returns the size and hit/miss counters of the session, tool, knowledge base, prompt and database connection cache."""
+    return metadata_cache.stats()
+
+def commit_custom_tool(db: Session, tool_id: int, previous: Optional[Tuple[str, str, bool]]):
+    """
+    Commits a custom tool change that is already live in the registry. If the commit
+    fails, the tool's previous registration (name, code, cacheable) is put back, or the
+    tool is removed if it had none, so the registry never runs code the database lacks.
+    """
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        try:
+            if previous is None:
+                tool_registry.remove(tool_id)
+            else:
+                tool_registry.upsert(tool_id, *previous)
+        except ToolRegistrationError as e:
+            tool_registry.remove(tool_id)
+            logger.error(f"Could not restore custom tool {tool_id} after a failed commit: {e}")
+        raise
 
 @app.post("/tools/create", response_model=models.CustomTool, tags=["Tools Hub"])
 def create_custom_tool(tool: models.CustomToolCreate, db: Session = Depends(get_db)):
     db_tool = sql_models.CustomTool(**tool.model_dump())
     db.add(db_tool)
-    db.commit()
+    db.flush()
+    try:
+        tool_registry.upsert(db_tool.id, db_tool.name, db_tool.code, db_tool.cacheable)
+    except ToolRegistrationError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    commit_custom_tool(db, db_tool.id, None)
     db.refresh(db_tool)
+    metadata_cache.invalidate("tools")
     return db_tool
 
 @app.get("/tools/{tool_id}", response_model=models.CustomTool, tags=["Tools Hub"])
 def get_custom_tool(tool_id: int, db: Session = Depends(get_db)):
-    db_tool = db.query(sql_models.CustomTool).filter(sql_models.CustomTool.id == tool_id).first()
+    def load_tool() -> Optional[models.CustomTool]:
+        db_tool = db.query(sql_models.CustomTool).filter(sql_models.CustomTool.id == tool_id).first()
+        return models.CustomTool.model_validate(db_tool) if db_tool else None
+
+    db_tool = metadata_cache.load("tools", tool_id, load_tool)
     if db_tool is None:
         raise HTTPException(status_code=404, detail="Custom tool not found")
     return db_tool
@@ -301,11 +854,24 @@ def update_custom_tool(tool_id: int, tool: models.CustomToolCreate, db: Session
     db_tool = db.query(sql_models.CustomTool).filter(sql_models.CustomTool.id == tool_id).first()
     if db_tool is None:
         raise HTTPException(status_code=404, detail="Custom tool not found")
+    previous_name = db_tool.name
+    previous = (db_tool.name, db_tool.code, db_tool.cacheable) if tool_registry.is_registered(tool_id) else None
     for var, value in vars(tool).items():
         setattr(db_tool, var, value) if value else None
+    if "cacheable" in tool.model_fields_set:
+        db_tool.cacheable = tool.cacheable
+    try:
+        # Replacing the live tool also invalidates its cached results
+        tool_registry.upsert(db_tool.id, db_tool.name, db_tool.code, db_tool.cacheable)
+    except ToolRegistrationError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
     db.add(db_tool)
-    db.commit()
+    commit_custom_tool(db, tool_id, previous)
     db.refresh(db_tool)
+    metadata_cache.invalidate("tools")
+    response_cache.invalidate_tool(previous_name)
+    response_cache.invalidate_tool(db_tool.name)
     return db_tool
 
 @app.delete("/tools/{tool_id}", tags=["Tools Hub"])
@@ -315,25 +881,43 @@ def delete_custom_tool(tool_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Custom tool not found")
     db.delete(db_tool)
     db.commit()
+    tool_registry.remove(tool_id)
+    metadata_cache.invalidate("tools")
+    response_cache.invalidate_tool(db_tool.name)
     return {"message": f"Custom tool {tool_id} deleted successfully"}
 
 
+KB_DELETE_JOB_TIMEOUT = 30.0  # seconds to wait for a deleted knowledge base's ingestion job to stop
+
 @app.post("/kb/create", response_model=models.KnowledgeBase, tags=["Knowledge Base"])
 def create_knowledge_base(kb: models.KnowledgeBaseCreate, db: Session = Depends(get_db)):
     db_kb = sql_models.KnowledgeBase(**kb.model_dump())
     db.add(db_kb)
     db.commit()
     db.refresh(db_kb)
+    metadata_cache.invalidate("knowledge_bases")
     return db_kb
 
+@app.get("/kb/embedding-cache/stats", response_model=models.EmbeddingCacheStats, tags=["Knowledge Base"])
+async def get_embedding_cache_stats():
+    """Returns the embedding cache's size and hit rate, i.e. how many embeddings were reused instead of recomputed."""
+    return embedding_cache.stats()
+
 @app.get("/kb/list", response_model=List[models.KnowledgeBase], tags=["Knowledge Base"])
 def list_knowledge_bases(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    kbs = db.query(sql_models.KnowledgeBase).offset(skip).limit(limit).all()
-    return kbs
+    def load_page() -> List[models.KnowledgeBase]:
+        rows = db.query(sql_models.KnowledgeBase).offset(skip).limit(limit).all()
+        return [models.KnowledgeBase.model_validate(row) for row in rows]
+
+    return metadata_cache.load("knowledge_bases", ("list", skip, limit), load_page)
 
 @app.get("/kb/{kb_id}", response_model=models.KnowledgeBase, tags=["Knowledge Base"])
 def get_knowledge_base(kb_id: int, db: Session = Depends(get_db)):
-    db_kb = db.query(sql_models.KnowledgeBase).filter(sql_models.KnowledgeBase.id == kb_id).first()
+    def load_row() -> Optional[models.KnowledgeBase]:
+        db_kb = db.query(sql_models.KnowledgeBase).filter(sql_models.KnowledgeBase.id == kb_id).first()
+        return models.KnowledgeBase.model_validate(db_kb) if db_kb else None
+
+    db_kb = metadata_cache.load("knowledge_bases", kb_id, load_row)
     if db_kb is None:
         raise HTTPException(status_code=404, detail="Knowledge Base not found")
     return db_kb
@@ -348,6 +932,10 @@ def update_knowledge_base(kb_id: int, kb: models.KnowledgeBaseCreate, db: Sessio
     db.add(db_kb)
     db.commit()
     db.refresh(db_kb)
+    metadata_cache.invalidate("knowledge_bases")
+    if db_kb.path:
+        # Re-chunks and re-embeds only the documents that the new settings affect
+        submit_ingestion(db_kb)
     return db_kb
 
 @app.delete("/kb/{kb_id}", tags=["Knowledge Base"])
@@ -355,27 +943,135 @@ def delete_knowledge_base(kb_id: int, db: Session = Depends(get_db)):
     db_kb = db.query(sql_models.KnowledgeBase).filter(sql_models.KnowledgeBase.id == kb_id).first()
     if db_kb is None:
         raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    # A running ingestion job would keep writing into the directory removed below
+    for job in ingestion_manager.cancel(kb_id):
+        if not job.done.wait(KB_DELETE_JOB_TIMEOUT):
+            raise HTTPException(status_code=409, detail=f"Ingestion job {job.job_id} is still stopping; try again shortly.")
+    kb_path = db_kb.path
     db.delete(db_kb)
     db.commit()
+    metadata_cache.invalidate("knowledge_bases")
+    if kb_path:
+        remove_knowledge_base_files(kb_path)
     return {"message": f"Knowledge Base {kb_id} deleted successfully"}
 
 
+def get_kb_path(db_kb: sql_models.KnowledgeBase) -> str:
+    """Returns the directory holding a knowledge base's sources and index, assigning one if needed."""
+    if not db_kb.path:
+        db_kb.path = os.path.join(VECTOR_STORE_DIR, f"kb_{db_kb.id}")
+    os.makedirs(db_kb.path, exist_ok=True)
+    return db_kb.path
+
+def submit_ingestion(db_kb: sql_models.KnowledgeBase) -> models.IngestionJobStatus:
+    """Starts (or queues) a job that brings a knowledge base's index up to date with its sources and settings."""
+    try:
+        job = ingestion_manager.submit(models.KnowledgeBase.model_validate(db_kb))
+    except IngestionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return job.progress()
+
+def save_upload(upload: UploadFile, directory: str) -> str:
+    """
+    Streams an uploaded file to disk without reading it into memory. The file is
+    written under a temporary name and then renamed into place, so a job reading
+    the source it replaces keeps seeing the complete old file.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(upload.filename)
+    path = os.path.join(directory, name)
+    tmp_path = partial_upload_path(directory, name)
+    try:
+        with open(tmp_path, "wb") as f:
+            shutil.copyfileobj(upload.file, f, length=1 << 20)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+@app.post("/kb/{kb_id}/ingest", response_model=models.IngestionJobStatus, tags=["Knowledge Base"])
+async def ingest_documents(kb_id: int, files: List[UploadFile] = File(...), db: AsyncSession = Depends(get_async_db)):
+    """Uploads documents to a knowledge base and starts a background job that parses, chunks, embeds and indexes them."""
+    db_kb = await db.get(sql_models.KnowledgeBase, kb_id)
+    if db_kb is None:
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+
+    allowed = {ext.lower() for ext in (db_kb.allowed_file_types or [])}
+    for upload in files:
+        if not upload.filename or os.path.basename(upload.filename) in ("", ".", ".."):
+            raise HTTPException(status_code=400, detail="Every uploaded file needs a file name.")
+        extension = os.path.splitext(upload.filename)[1].lower()
+        if allowed and extension not in allowed:
+            raise HTTPException(status_code=400, detail=f"File type '{extension}' is not allowed for this knowledge base.")
+
+    kb_path = get_kb_path(db_kb)
+    await db.commit()
+    await db.refresh(db_kb)
+    metadata_cache.invalidate("knowledge_bases")
+
+    sources_dir = sources_path(kb_path)
+    for upload in files:
+        await run_in_threadpool(save_upload, upload, sources_dir)
+    return submit_ingestion(db_kb)
+
+@app.post("/kb/{kb_id}/reindex", response_model=models.IngestionJobStatus, tags=["Knowledge Base"])
+def reindex_knowledge_base(kb_id: int, db: Session = Depends(get_db)):
+    """Starts a job that re-indexes the documents of a knowledge base whose source files or settings changed."""
+    db_kb = db.query(sql_models.KnowledgeBase).filter(sql_models.KnowledgeBase.id == kb_id).first()
+    if db_kb is None:
+        raise HTTPException(status_code=404, detail="Knowledge Base not found")
+    get_kb_path(db_kb)
+    db.commit()
+    db.refresh(db_kb)
+    metadata_cache.invalidate("knowledge_bases")
+    return submit_ingestion(db_kb)
+
+@app.post("/kb/{kb_id}/search", response_model=models.KnowledgeBaseSearchResponse, tags=["Knowledge Base"])
+def search_knowledge_base_endpoint(kb_id: int, request: models.KnowledgeBaseSearchRequest, db: Session = Depends(get_db)):
+    """Returns the top-k chunks for each query in a batch, scored in a single pass over the index."""
+    db_kb = get_knowledge_base(kb_id, db)
+    return models.KnowledgeBaseSearchResponse(results=search_knowledge_base(db_kb, request.queries, request.top_k, request.nprobe, request.retrieval_mode))
+
+@app.get("/kb/{kb_id}/ingest", response_model=List[models.IngestionJobStatus], tags=["Knowledge Base"])
+def list_ingestion_jobs(kb_id: int):
+    """Lists the ingestion jobs of a knowledge base since the server started."""
+    return [job.progress() for job in ingestion_manager.jobs_for(kb_id)]
+
+@app.get("/kb/{kb_id}/ingest/{job_id}", response_model=models.IngestionJobStatus, tags=["Knowledge Base"])
+def get_ingestion_job(kb_id: int, job_id: str):
+    """Returns the progress and throughput of an ingestion job."""
+    job = ingestion_manager.get(job_id)
+    if job is None or job.kb.id != kb_id:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job.progress()
+
+
 @app.post("/databases/create", response_model=models.DatabaseConnection, tags=["Database Hub"])
 def create_database_connection(db_conn: models.DatabaseConnectionCreate, db: Session = Depends(get_db)):
     db_db_conn = sql_models.DatabaseConnection(**db_conn.model_dump())
     db.add(db_db_conn)
     db.commit()
     db.refresh(db_db_conn)
+    metadata_cache.invalidate("databases")
     return db_db_conn
 
 @app.get("/databases/list", response_model=List[models.DatabaseConnection], tags=["Database Hub"])
 def list_database_connections(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    db_conns = db.query(sql_models.DatabaseConnection).offset(skip).limit(limit).all()
-    return db_conns
+    def load_page() -> List[models.DatabaseConnection]:
+        rows = db.query(sql_models.DatabaseConnection).offset(skip).limit(limit).all()
+        return [models.DatabaseConnection.model_validate(row) for row in rows]
+
+    return metadata_cache.load("databases", ("list", skip, limit), load_page)
 
 @app.get("/databases/{db_id}", response_model=models.DatabaseConnection, tags=["Database Hub"])
 def get_database_connection(db_id: int, db: Session = Depends(get_db)):
-    db_db_conn = db.query(sql_models.DatabaseConnection).filter(sql_models.DatabaseConnection.id == db_id).first()
+    def load_row() -> Optional[models.DatabaseConnection]:
+        db_db_conn = db.query(sql_models.DatabaseConnection).filter(sql_models.DatabaseConnection.id == db_id).first()
+        return models.DatabaseConnection.model_validate(db_db_conn) if db_db_conn else None
+
+    db_db_conn = metadata_cache.load("databases", db_id, load_row)
     if db_db_conn is None:
         raise HTTPException(status_code=404, detail="Database connection not found")
     return db_db_conn
@@ -390,6 +1086,7 @@ def update_database_connection(db_id: int, db_conn: models.DatabaseConnectionCre
     db.add(db_db_conn)
     db.commit()
     db.refresh(db_db_conn)
+    metadata_cache.invalidate("databases")
     return db_db_conn
 
 @app.delete("/databases/{db_id}", tags=["Database Hub"])
@@ -399,6 +1096,7 @@ def delete_database_connection(db_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Database connection not found")
     db.delete(db_db_conn)
     db.commit()
+    metadata_cache.invalidate("databases")
     return {"message": f"Database connection {db_id} deleted successfully"}
 
 
@@ -408,16 +1106,24 @@ def create_prompt(prompt: models.PromptCreate, db: Session = Depends(get_db)):
     db.add(db_prompt)
     db.commit()
     db.refresh(db_prompt)
+    metadata_cache.invalidate("prompts")
     return db_prompt
 
 @app.get("/prompts/list", response_model=List[models.Prompt], tags=["Prompt Hub"])
 def list_prompts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    prompts = db.query(sql_models.Prompt).offset(skip).limit(limit).all()
-    return prompts
+    def load_page() -> List[models.Prompt]:
+        rows = db.query(sql_models.Prompt).offset(skip).limit(limit).all()
+        return [models.Prompt.model_validate(row) for row in rows]
+
+    return metadata_cache.load("prompts", ("list", skip, limit), load_page)
 
 @app.get("/prompts/{prompt_id}", response_model=models.Prompt, tags=["Prompt Hub"])
 def get_prompt(prompt_id: int, db: Session = Depends(get_db)):
-    db_prompt = db.query(sql_models.Prompt).filter(sql_models.Prompt.id == prompt_id).first()
+    def load_row() -> Optional[models.Prompt]:
+        db_prompt = db.query(sql_models.Prompt).filter(sql_models.Prompt.id == prompt_id).first()
+        return models.Prompt.model_validate(db_prompt) if db_prompt else None
+
+    db_prompt = metadata_cache.load("prompts", prompt_id, load_row)
     if db_prompt is None:
         raise HTTPException(status_code=404, detail="Prompt not found")
     return db_prompt
@@ -432,6 +1138,7 @@ def update_prompt(prompt_id: int, prompt: models.PromptCreate, db: Session = Dep
     db.add(db_prompt)
     db.commit()
     db.refresh(db_prompt)
+    metadata_cache.invalidate("prompts")
     return db_prompt
 
 @app.delete("/prompts/{prompt_id}", tags=["Prompt Hub"])
@@ -441,6 +1148,7 @@ def delete_prompt(prompt_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Prompt not found")
     db.delete(db_prompt)
     db.commit()
+    metadata_cache.invalidate("prompts")
     return {"message": f"Prompt {prompt_id} deleted successfully"}
 
 @app.put("/settings/model", response_model=models.ModelProviderSetting, tags=["Settings"])
@@ -465,6 +1173,7 @@ def save_model_provider_setting(setting: models.ModelProviderSettingCreate, db:
         db.add(db_setting)
     db.commit()
     db.refresh(db_setting)
+    metadata_cache.invalidate("model_settings", (setting.provider, setting.user_id))
     return db_setting
 
 @app.get("/settings/model", response_model=List[models.ModelProviderSetting], tags=["Settings"])
@@ -476,3 +1185,8 @@ def get_model_provider_settings(db: Session = Depends(get_db)):
     for s in db_settings:
         response_settings.append(models.ModelProviderSetting.from_orm(s))
     return response_settings
+
+@app.get("/settings/providers/stats", response_model=models.ProviderStats, tags=["Settings"])
+async def get_provider_stats():
+    """Returns the concurrency, retry and time-to-first-token counters of each model provider client."""
+    return provider_clients.stats()
@@ -0,0 +1,168 @@
+"""
+Bounded conversation memory for chat sessions.
+
+Agents see a session through a window of its most recent messages plus a
+rolling summary of everything older. The summary is stored on the
+`ChatSession` and is extended incrementally: after each turn, only the messages
+that have just dropped out of the window are folded into it. Loading and
+updating the memory therefore read O(window) rows, however long the session is.
+
+The default summarizer is extractive: each folded message becomes a one-line
+note, and once the summary outgrows its budget the oldest notes are condensed
+into a list of earlier topics.
+"""
+import re
+import logging
+from collections import Counter
+from typing import Callable, List, Optional
+
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import sql_models as sql_models
+import models as models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WINDOW = 20  # messages, i.e. ten user/assistant turns
+MAX_SUMMARY_CHARS = 2000
+MAX_NOTE_CHARS = 160
+MAX_TOPICS = 30
+TOPICS_PREFIX = "Earlier topics: "
+
+MEMORY_COLUMNS = (
+    sql_models.ChatMessage.id,
+    sql_models.ChatMessage.role,
+    sql_models.ChatMessage.content,
+    sql_models.ChatMessage.agent_used,
+    sql_models.ChatMessage.tool_calls,
+    sql_models.ChatMessage.timestamp,
+)
+
+WORD_PATTERN = re.compile(r"[^\W\d_][\w'-]{3,}")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+STOPWORDS = frozenset(
+    "about above after again against also because been before being below between both could does doing "
+    "down during each from further have having here into just more most other over same should some such "
+    "than that their them then there these they this those through under until very were what when where "
+    "which while will with would your yours please thanks thank tell know like want need".split()
+)
+
+Summarizer = Callable[[Optional[str], List[models.HistoryMessage]], str]
+
+
+def _note(message: models.HistoryMessage) -> str:
+    speaker = message.agent_used or message.role
+    if message.tool_calls:
+        speaker += f" ({', '.join(call.tool for call in message.tool_calls)})"
+    text = " ".join(message.content.split())
+    text = SENTENCE_END.split(text, 1)[0]
+    if len(text) > MAX_NOTE_CHARS:
+        text = text[:MAX_NOTE_CHARS - 3].rstrip() + "..."
+    return f"- {speaker}: {text}"
+
+
+def _topics(lines: List[str]) -> List[str]:
+    counts = Counter(
+        word for line in lines for word in (w.lower() for w in WORD_PATTERN.findall(line.split(": ", 1)[-1]))
+        if word not in STOPWORDS
+    )
+    return [word for word, _ in counts.most_common()]
+
+
+def extractive_summary(summary: Optional[str], messages: List[models.HistoryMessage]) -> str:
+    """
+    Extends `summary` with one note per message. If the result exceeds
+    MAX_SUMMARY_CHARS, the oldest notes are replaced by their most frequent words.
+    """
+    lines = (summary or "").splitlines()
+    topics: List[str] = []
+    if lines and lines[0].startswith(TOPICS_PREFIX):
+        topics = lines.pop(0)[len(TOPICS_PREFIX):].split(", ")
+    lines.extend(_note(message) for message in messages)
+
+    def size() -> int:
+        return sum(len(line) + 1 for line in lines) + len(TOPICS_PREFIX) + sum(len(t) + 2 for t in topics)
+
+    if size() > MAX_SUMMARY_CHARS:
+        # Condense the older half of the notes at a time, so the topic list is not rebuilt on every turn
+        condensed = lines[:max(1, len(lines) // 2)]
+        del lines[:len(condensed)]
+        topics = list(dict.fromkeys(_topics(condensed) + topics))[:MAX_TOPICS]
+        while lines and size() > MAX_SUMMARY_CHARS:
+            lines.pop(0)
+    if topics:
+        lines.insert(0, TOPICS_PREFIX + ", ".join(topics))
+    return "\n".join(lines)
+
+
+class ConversationMemory:
+    """Loads and maintains the window and rolling summary of chat sessions."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW, summarizer: Summarizer = extractive_summary):
+        self.window = window
+        self.summarizer = summarizer
+
+    async def load(self, session: models.ChatSessionRecord, db: AsyncSession) -> models.ConversationContext:
+        """Returns the session's summary and its `window` most recent messages, oldest first."""
+        message = sql_models.ChatMessage
+        result = await db.execute(
+            select(*MEMORY_COLUMNS)
+            .where(message.session_id == session.session_id)
+            .order_by(message.timestamp.desc(), message.id.desc())
+            .limit(self.window)
+        )
+        rows = result.all()
+        return models.ConversationContext(
+            session_id=session.session_id,
+            summary=session.summary,
+            summarized_messages=session.summarized_messages or 0,
+            recent=[models.HistoryMessage.model_validate(row) for row in reversed(rows)],
+        )
+
+    async def update(self, session: models.ChatSessionRecord, db: AsyncSession) -> Optional[models.ChatSessionRecord]:
+        """
+        Folds the messages that have dropped out of the window into the session's
+        summary. Returns the session as now stored if its summary moved, whether
+        by this call or by a concurrent request that updated it first (its update
+        then covers these messages), or None if nothing had to be folded.
+        """
+        message = sql_models.ChatMessage
+        query = select(*MEMORY_COLUMNS).where(message.session_id == session.session_id)
+        through_at, through_id = session.summarized_through_at, session.summarized_through_id
+        if through_id is not None:
+            query = query.where(or_(
+                message.timestamp > through_at,
+                and_(message.timestamp == through_at, message.id > through_id),
+            ))
+        # Every unsummarized message is within a turn or two of the window, unless the window was shrunk
+        rows = (await db.execute(query.order_by(message.timestamp.desc(), message.id.desc()))).all()
+        if len(rows) <= self.window:
+            return None
+        folded = [models.HistoryMessage.model_validate(row) for row in reversed(rows[self.window:])]
+        values = dict(
+            summary=self.summarizer(session.summary, folded),
+            summarized_messages=(session.summarized_messages or 0) + len(folded),
+            summarized_through_id=folded[-1].id,
+            summarized_through_at=folded[-1].timestamp,
+        )
+
+        chat_session = sql_models.ChatSession
+        # Compare-and-set on the summarized position, so concurrent turns cannot fold the same messages twice
+        result = await db.execute(
+            update(chat_session)
+            .where(
+                chat_session.id == session.id,
+                chat_session.summarized_through_id.is_(None) if through_id is None else chat_session.summarized_through_id == through_id,
+            )
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if result.rowcount:
+            logger.info(f"Session {session.session_id}: Folded {len(folded)} messages into the conversation summary.")
+            return session.model_copy(update=values)
+        stored = (await db.execute(
+            select(chat_session).where(chat_session.id == session.id).execution_options(populate_existing=True)
+        )).scalars().first()
+        return models.ChatSessionRecord.model_validate(stored) if stored else None
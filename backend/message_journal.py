@@ -0,0 +1,166 @@
+"""
+Group-commit write path for chat messages.
+
+Chat handlers append messages to a journal instead of committing each one on its
+own. A background task collects the queued messages and inserts them in a
+single transaction as soon as `max_batch` messages are queued or `flush_interval`
+has passed since the first one, so concurrent sessions share commits (and, on
+SQLite, fsyncs) instead of queueing for the database's single writer. A message
+the database rejects only fails itself, not the rest of its batch.
+
+Durability is chosen per journal:
+
+*   "flush": `append` returns once the message's batch has been committed.
+    A reply is never acknowledged before its messages are stored.
+*   "immediate": `append` returns as soon as the message is queued. Writes are
+    faster to acknowledge, but messages still queued when the process dies are
+    lost, and a history read right after a turn may not include it yet.
+
+`close` stops accepting messages and drains the queue.
+"""
+import time
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import sql_models as sql_models
+import models as models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.005  # seconds a batch waits for more messages
+DEFAULT_MAX_BATCH = 500  # messages per transaction
+DURABILITY_MODES = ("flush", "immediate")
+
+
+class JournalClosedError(Exception):
+    """Raised when a message is appended to a journal that has been closed."""
+
+
+class MessageJournal:
+    """Queues chat message inserts and commits them in batches from a background task."""
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        durability: str = "flush",
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_batch: int = DEFAULT_MAX_BATCH,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability '{durability}', expected one of {DURABILITY_MODES}.")
+        self.engine = engine
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # (row, future resolved once the row is committed)
+        self._pending: List[Tuple[dict, Optional[asyncio.Future]]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._full: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        self.messages_written = 0
+        self.messages_failed = 0
+        self.batches = 0
+        self.flush_seconds = 0.0
+
+    def start(self):
+        """Starts the flush task on the running event loop."""
+        if self._task is None:
+            self._closed = False
+            self._wakeup, self._full = asyncio.Event(), asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def append(self, session_id: str, user_id: str, message: models.Message):
+        """Queues a message for insertion; with "flush" durability, waits until it is committed."""
+        if self._closed or self._task is None:
+            raise JournalClosedError("The message journal is not accepting messages.")
+        row = dict(message.model_dump(mode="json"), timestamp=message.timestamp, session_id=session_id, user_id=user_id)
+        future = asyncio.get_running_loop().create_future() if self.durability == "flush" else None
+        self._pending.append((row, future))
+        self._wakeup.set()
+        if len(self._pending) >= self.max_batch:
+            self._full.set()
+        if future is not None:
+            await future
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            if not self._pending:
+                if self._closed:
+                    return
+                self._wakeup.clear()
+                continue
+            if len(self._pending) < self.max_batch and not self._closed:
+                # Give concurrent handlers a moment to add their messages to this batch
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            if len(self._pending) < self.max_batch:
+                self._full.clear()
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[Tuple[dict, Optional[asyncio.Future]]]):
+        """
+        Inserts a batch in one transaction. If a row is rejected, the batch is
+        retried in halves, so only the offending rows fail and the other sessions'
+        messages are still written.
+        """
+        started = time.perf_counter()
+        try:
+            async with self.engine.begin() as conn:
+                await conn.execute(insert(sql_models.ChatMessage), [row for row, _ in batch])
+        except Exception as e:
+            if len(batch) > 1 and not isinstance(e, (OperationalError, InterfaceError)):
+                # Rejected rows are found by bisection; connection-level errors would fail every half too
+                middle = len(batch) // 2
+                await self._flush(batch[:middle])
+                await self._flush(batch[middle:])
+                return
+            self.messages_failed += len(batch)
+            if len(batch) == 1:
+                logger.error(f"Failed to write a chat message of session {batch[0][0].get('session_id')}: {e}")
+            else:
+                logger.error(f"Failed to write a batch of {len(batch)} chat messages: {e}")
+            for _, future in batch:
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+        self.flush_seconds += time.perf_counter() - started
+        self.batches += 1
+        self.messages_written += len(batch)
+        for _, future in batch:
+            if future is not None and not future.done():
+                future.set_result(None)
+
+    async def close(self):
+        """Stops accepting messages and waits until every queued message has been written."""
+        self._closed = True
+        if self._task is None:
+            return
+        self._wakeup.set()
+        self._full.set()
+        await self._task
+        self._task = None
+        logger.info(f"Message journal drained: {self.messages_written} messages in {self.batches} batches.")
+
+    def stats(self) -> models.MessageJournalStats:
+        """Returns the journal's queue length and batch counters."""
+        return models.MessageJournalStats(
+            durability=self.durability,
+            flush_interval=self.flush_interval,
+            max_batch=self.max_batch,
+            pending=len(self._pending),
+            messages_written=self.messages_written,
+            messages_failed=self.messages_failed,
+            batches=self.batches,
+            average_batch_size=self.messages_written / self.batches if self.batches else 0.0,
+            average_flush_ms=1000 * self.flush_seconds / self.batches if self.batches else 0.0,
+        )
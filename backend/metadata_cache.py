@@ -0,0 +1,186 @@
+"""
+Read-through cache for rarely written metadata: chat sessions, tools, knowledge
+bases, prompts and database connections.
+
+Entries are grouped into namespaces, each with its own TTL, and evicted in
+least-recently-used order once the cache is full. The endpoints that write a
+namespace invalidate it explicitly, so the TTL only bounds how long another
+worker process may serve a stale copy.
+
+A lookup that misses runs its loader outside the lock. If the namespace is
+invalidated while the loader runs, the loaded value is returned but not stored,
+so a read that raced with a write cannot put the old row back into the cache.
+"""
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import models as models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 10000  # entries, across all namespaces
+DEFAULT_CACHE_TTL = 300.0  # seconds
+DEFAULT_NAMESPACE_TTLS = {
+    # Sessions are invalidated by this process whenever their summary moves; the
+    # shorter TTL bounds staleness when another worker moved it
+    "sessions": 60.0,
+    "tools": 300.0,
+    "knowledge_bases": 300.0,
+    "prompts": 300.0,
+    "databases": 300.0,
+}
+
+
+class _NamespaceCounters:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.generation = 0
+
+
+class MetadataCache:
+    """An LRU cache of metadata lookups with per-namespace TTLs, explicit invalidation and hit/miss counters."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_CACHE_SIZE,
+        default_ttl: float = DEFAULT_CACHE_TTL,
+        ttls: Optional[Dict[str, float]] = None,
+    ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = dict(DEFAULT_NAMESPACE_TTLS if ttls is None else ttls)
+        # (namespace, key) -> (expires at, value)
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._namespaces: Dict[str, _NamespaceCounters] = {}
+        # Sync endpoints run on the thread pool, so lookups can come from several threads
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _counters(self, namespace: str) -> _NamespaceCounters:
+        counters = self._namespaces.get(namespace)
+        if counters is None:
+            counters = self._namespaces[namespace] = _NamespaceCounters()
+        return counters
+
+    def get(self, namespace: str, key: Hashable) -> Tuple[bool, Any]:
+        """Looks up a cached value, returning (found, value)."""
+        with self._lock:
+            return self._get(namespace, key)
+
+    def _get(self, namespace: str, key: Hashable) -> Tuple[bool, Any]:
+        counters = self._counters(namespace)
+        entry = self._entries.get((namespace, key))
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end((namespace, key))
+                counters.hits += 1
+                return True, value
+            del self._entries[(namespace, key)]
+            self.expirations += 1
+        counters.misses += 1
+        return False, None
+
+    def put(self, namespace: str, key: Hashable, value: Any, generation: Optional[int] = None):
+        """
+        Stores a value, evicting the least recently used entries if the cache is full.
+        If `generation` is given and the namespace was invalidated since, nothing is stored.
+        """
+        with self._lock:
+            if generation is not None and generation != self._counters(namespace).generation:
+                return
+            self._entries[(namespace, key)] = (time.monotonic() + self.ttls.get(namespace, self.default_ttl), value)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, namespace: str) -> int:
+        """Returns the namespace's invalidation count, to pass to `put` for values read from the database afterwards."""
+        with self._lock:
+            return self._counters(namespace).generation
+
+    def _lookup(self, namespace: str, key: Hashable) -> Tuple[bool, Any, int]:
+        with self._lock:
+            found, value = self._get(namespace, key)
+            return found, value, self._counters(namespace).generation
+
+    def load(self, namespace: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Returns the cached value, or calls `loader` and caches its result. None results are not cached."""
+        found, value, generation = self._lookup(namespace, key)
+        if found:
+            return value
+        value = loader()
+        if value is not None:
+            self.put(namespace, key, value, generation)
+        return value
+
+    async def aload(self, namespace: str, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Like `load`, for a coroutine loader."""
+        found, value, generation = self._lookup(namespace, key)
+        if found:
+            return value
+        value = await loader()
+        if value is not None:
+            self.put(namespace, key, value, generation)
+        return value
+
+    def invalidate(self, namespace: str, key: Optional[Hashable] = None) -> int:
+        """Drops one key, or with no key the whole namespace, and returns how many entries were removed."""
+        with self._lock:
+            counters = self._counters(namespace)
+            counters.generation += 1
+            counters.invalidations += 1
+            if key is not None:
+                removed = 1 if self._entries.pop((namespace, key), None) is not None else 0
+            else:
+                keys = [entry_key for entry_key in self._entries if entry_key[0] == namespace]
+                for entry_key in keys:
+                    del self._entries[entry_key]
+                removed = len(keys)
+        if removed:
+            logger.info(f"Invalidated {removed} cached {namespace} entries.")
+        return removed
+
+    def clear(self):
+        """Drops every cached value."""
+        with self._lock:
+            self._entries.clear()
+            for counters in self._namespaces.values():
+                counters.generation += 1
+
+    def stats(self) -> models.MetadataCacheStats:
+        """Returns the cache's size and hit/miss counters, overall and per namespace."""
+        with self._lock:
+            sizes: Dict[str, int] = {}
+            for namespace, _ in self._entries:
+                sizes[namespace] = sizes.get(namespace, 0) + 1
+            namespaces = {
+                namespace: models.MetadataCacheNamespaceStats(
+                    size=sizes.get(namespace, 0),
+                    ttl=self.ttls.get(namespace, self.default_ttl),
+                    hits=counters.hits,
+                    misses=counters.misses,
+                    hit_rate=counters.hits / (counters.hits + counters.misses) if counters.hits + counters.misses else 0.0,
+                    invalidations=counters.invalidations,
+                )
+                for namespace, counters in self._namespaces.items()
+            }
+            hits = sum(counters.hits for counters in self._namespaces.values())
+            misses = sum(counters.misses for counters in self._namespaces.values())
+            return models.MetadataCacheStats(
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                hits=hits,
+                misses=misses,
+                hit_rate=hits / (hits + misses) if hits + misses else 0.0,
+                evictions=self.evictions,
+                expirations=self.expirations,
+                namespaces=namespaces,
+            )
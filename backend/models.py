@@ -19,6 +19,11 @@ class user_login(BaseModel):
     login_identifier: str
     password: str
 
+class CurrentUser(BaseModel):
+    """The user a request is made on behalf of, as carried by its access token."""
+    id: str
+    username: str
+
 class ToolCall(BaseModel):
     """Model for a tool call made by an agent."""
     tool: str
@@ -52,6 +57,20 @@ class ChatSessionInfo(BaseModel):
     title: str
     description: Optional[str] = None
 
+class ChatSessionRecord(BaseModel):
+    """A chat session as served from the metadata cache, including its conversation memory position."""
+    id: int
+    session_id: str
+    user_id: str
+    title: Optional[str] = None
+    summary: Optional[str] = None
+    summarized_messages: int = 0
+    summarized_through_id: Optional[int] = None
+    summarized_through_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
 class ChatRequest(BaseModel):
     """Request model for the /chat endpoint."""
     session_id: str
@@ -63,6 +82,7 @@ class ChatRequest(BaseModel):
     max_tokens: int
     max_retries: int
     selected_kbs: List[str] = []
+    agent: Optional[str] = None # Explicitly requested agent, otherwise routed by message
 
 class ChatResponse(BaseModel):
     """Response model for the /chat endpoint."""
@@ -70,11 +90,53 @@ class ChatResponse(BaseModel):
     agent_used: str
     tool_calls: List[ToolCall] = []
     timestamp: datetime
+    cached: bool = False # True if the reply was served from the response cache
+    cache_match: Optional[str] = None # "exact" or "semantic" for cached replies
+
+class PlannedToolCall(BaseModel):
+    """A tool call planned for an agent turn."""
+    tool: str
+    args: Dict[str, Any] = {}
+    depends_on: Optional[int] = None # Index of the planned call whose result this call needs
+    input_arg: Optional[str] = None # Argument filled with the number in that result
+
+class ChatStreamEvent(BaseModel):
+    """A single event emitted by the /chat/stream endpoint."""
+    event: str  # "agent_selected", "tool_call_started", "tool_call_finished", "reply_delta", "model_error", "done" or "error"
+    data: Dict[str, Any] = {}
+
+class HistoryMessage(Message):
+    """A stored message, with the id used as a pagination cursor."""
+    id: int
+
+    class Config:
+        from_attributes = True
 
 class HistoryResponse(BaseModel):
-    """Response model for the /history/{session_id} endpoint."""
+    """Response model for the /history/{session_id} endpoint: one page of messages in the requested order."""
+    session_id: str
+    history: List[HistoryMessage]
+    has_more: bool = False
+    next_cursor: Optional[int] = None # Message id to pass as `before` (newest-first) or `after` (oldest-first) for the next page
+
+class ConversationContext(BaseModel):
+    """The memory an agent answers in: a rolling summary of older messages plus the most recent ones."""
     session_id: str
-    history: List[Message]
+    summary: Optional[str] = None
+    summarized_messages: int = 0 # Number of messages covered by the summary
+    recent: List[HistoryMessage] = []
+
+class MessageJournalStats(BaseModel):
+    """Queue length and batch counters of the chat message journal."""
+    durability: str # "flush" (acknowledged once committed) or "immediate" (acknowledged once queued)
+    flush_interval: float
+    max_batch: int
+    pending: int
+    messages_written: int
+    messages_failed: int
+    batches: int
+    average_batch_size: float
+    average_flush_ms: float
 
 # --- Agent and Tool Discovery Models ---
 
@@ -83,11 +145,33 @@ class AgentDetail(BaseModel):
     name: str
     description: str
     system_prompt: str
+    triggers: List[str] = [] # Words or phrases that route a message to this agent
+    examples: List[str] = [] # Typical messages, used by semantic routing
+    tools: List[str] = [] # Tools the agent may call, planned from the message by agent_loop.py
 
 class AgentsListResponse(BaseModel):
     """Response model for listing available agents."""
     agents: List[AgentDetail]
 
+class AgentRouteRequest(BaseModel):
+    """Request model for routing a batch of messages."""
+    messages: List[str] = Field(..., max_length=10000)
+    mode: Optional[str] = None # "rules", "semantic" or "hybrid"; defaults to the router's mode
+
+class AgentRouteResult(BaseModel):
+    """The agent chosen for one message and how it was chosen."""
+    agent: str
+    method: str # "rule", "semantic" or "default"
+    trigger: Optional[str] = None # The trigger phrase that matched, for "rule"
+    score: Optional[float] = None # Similarity to the closest agent's examples, in semantic and hybrid modes
+
+class AgentRouteResponse(BaseModel):
+    """Response model for routing a batch of messages."""
+    mode: str
+    results: List[AgentRouteResult]
+    counts: Dict[str, int] # Messages routed to each agent
+    elapsed_ms: float
+
 class ToolDetail(BaseModel):
     """Model for describing a tool."""
     tool_name: str
@@ -98,6 +182,87 @@ class ToolsListResponse(BaseModel):
     """Response model for listing available tools."""
     tools: List[ToolDetail]
 
+class ToolExecutionStats(BaseModel):
+    """Limits and counters for a single tool in the tool executor."""
+    timeout: float
+    max_concurrency: int
+    waiting: int # Calls waiting for a concurrency slot
+    running: int
+    completed: int
+    failed: int
+    timed_out: int
+
+class ToolExecutorStats(BaseModel):
+    """Response model for the tool executor statistics endpoint."""
+    max_workers: int
+    pool_queued: int # Sync calls submitted to the worker pool but not started yet
+    tools: Dict[str, ToolExecutionStats]
+
+class ToolCacheStats(BaseModel):
+    """Response model for the tool result cache statistics endpoint."""
+    size: int
+    max_entries: int
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    expirations: int
+
+class SingleFlightStats(BaseModel):
+    """Counters of identical concurrent calls that shared one execution."""
+    in_flight: int
+    calls: int
+    executions: int # Calls that actually ran
+    coalesced: int # Calls that waited for an identical call already running
+    coalesced_rate: float
+
+class ResponseCacheStats(BaseModel):
+    """Response model for the chat response cache statistics endpoint."""
+    size: int
+    max_entries: int
+    ttl: float
+    similarity_threshold: Optional[float] = None # None when semantic lookups are disabled
+    exact_hits: int
+    semantic_hits: int
+    misses: int
+    hit_rate: float
+    stores: int
+    uncacheable: int # Replies not stored because they used a non-cacheable or failed tool
+    evictions: int
+    expirations: int
+
+class MetadataCacheNamespaceStats(BaseModel):
+    """Size and hit/miss counters of one namespace of the metadata cache."""
+    size: int
+    ttl: float
+    hits: int
+    misses: int
+    hit_rate: float
+    invalidations: int
+
+class MetadataCacheStats(BaseModel):
+    """Response model for the metadata cache statistics endpoint."""
+    size: int
+    max_entries: int
+    hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+    expirations: int
+    namespaces: Dict[str, MetadataCacheNamespaceStats]
+
+class ToolSandboxStats(BaseModel):
+    """Response model for the custom tool sandbox statistics endpoint."""
+    workers: int
+    idle_workers: int
+    calls: int
+    recycled: int # Workers replaced after reaching max_calls_per_worker
+    killed: int # Workers killed because a call timed out
+    crashed: int
+    max_calls_per_worker: int
+    cpu_seconds_per_call: Optional[int] = None
+    memory_limit_mb: Optional[int] = None
+
 # --- Knowledge Base Models ---
 
 class KnowledgeBaseBase(BaseModel):
@@ -111,6 +276,7 @@ class KnowledgeBaseBase(BaseModel):
     chunk_size: int
     chunk_overlap: int
     metadata_strategy: str
+    retrieval_mode: str = "vector" # "vector", "bm25" or "hybrid"
 
 class KnowledgeBaseCreate(KnowledgeBaseBase):
     pass
@@ -122,12 +288,66 @@ class KnowledgeBase(KnowledgeBaseBase):
     class Config:
         from_attributes = True
 
+class IngestionJobStatus(BaseModel):
+    """Progress of a knowledge base ingestion job."""
+    job_id: str
+    kb_id: int
+    status: str # "queued", "running", "completed", "failed" or "cancelled"
+    rebuild: bool = False # True if the job builds a new index generation rather than appending
+    documents_total: int # Documents to parse, chunk and embed
+    documents_done: int
+    documents_failed: int
+    documents_unchanged: int = 0 # Documents whose existing chunks are kept
+    documents_removed: int = 0 # Documents whose chunks are dropped because their source was deleted
+    chunks_written: int
+    bytes_total: int
+    elapsed_seconds: float
+    docs_per_second: float
+    chunks_per_second: float
+    created_at: datetime
+    error: Optional[str] = None
+
+class RetrievedChunk(BaseModel):
+    """A knowledge base chunk returned by retrieval."""
+    kb_id: int
+    kb_name: str
+    source: str
+    chunk: int
+    text: str
+    score: float
+
+class KnowledgeBaseSearchRequest(BaseModel):
+    """Request model for searching a knowledge base with a batch of queries."""
+    queries: List[str]
+    top_k: int = 5
+    nprobe: Optional[int] = None # IVF lists to probe; defaults to the KB's vector_store setting
+    retrieval_mode: Optional[str] = None # Overrides the KB's retrieval_mode
+
+class KnowledgeBaseSearchResponse(BaseModel):
+    """Response model with the top-k chunks for each query, in query order."""
+    results: List[List[RetrievedChunk]]
+
+class EmbeddingCacheStats(BaseModel):
+    """Size and hit/miss counters of the embedding cache."""
+    memory_entries: int
+    memory_bytes: int
+    max_memory_bytes: int
+    disk_entries: int
+    disk_bytes: int
+    max_disk_bytes: int
+    memory_hits: int
+    disk_hits: int
+    misses: int
+    hit_rate: float
+    evictions: int
+
 # --- Custom Tool Models ---
 
 class CustomToolBase(BaseModel):
     name: str
     description: str
     code: str
+    cacheable: bool = False # Only deterministic tools should opt in to result caching
 
 class CustomToolCreate(CustomToolBase):
     pass
@@ -192,3 +412,35 @@ class ModelProviderSetting(ModelProviderSettingBase):
 
     class Config:
         from_attributes = True
+
+class LLMMessage(BaseModel):
+    """A message sent to a model provider."""
+    role: str # "system", "user" or "assistant"
+    content: str
+
+class CompletionRequest(BaseModel):
+    """A streamed completion request to a model provider, with the limits it runs under."""
+    provider: str
+    model: str
+    messages: List[LLMMessage] = []
+    temperature: float = 0.5
+    max_tokens: int = 1024
+    timeout: float = 120 # Seconds to connect and between streamed chunks
+    max_retries: int = 2
+    api_key: Optional[str] = None
+
+class ProviderClientStats(BaseModel):
+    """Connection pool and request counters of one model provider client."""
+    base_url: str
+    max_concurrency: int
+    waiting: int # Requests queued for a concurrency slot
+    in_flight: int
+    requests: int
+    retries: int
+    failures: int
+    average_first_token_ms: float
+
+class ProviderStats(BaseModel):
+    """Response model for the model provider statistics endpoint."""
+    providers: Dict[str, ProviderClientStats]
+    coalescing: SingleFlightStats # Identical concurrent completions that shared one provider call
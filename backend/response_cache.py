@@ -0,0 +1,246 @@
+"""
+Reply cache for repeated chat questions.
+
+Replies are cached per scope, i.e. per agent, model and the versions of the
+selected knowledge bases, under the normalized message: case, Unicode form,
+runs of whitespace and trailing punctuation do not matter. A lookup tries the
+exact normalized message first and then, if a similarity threshold is set, the
+most similar cached message of the same scope by embedding cosine similarity.
+A similar message only matches if it mentions the same numbers, so "12 + 30"
+never answers "12 + 31".
+
+Entries expire after a TTL and are evicted in least-recently-used order once
+the cache is full. Replies that used a tool whose results must not be reused
+(e.g. the current time) are never stored.
+"""
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import models as models
+from knowledge.embeddings import get_embedder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "2048"))  # entries
+DEFAULT_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "600"))  # seconds
+# Minimum cosine similarity of a semantic match; unset disables semantic lookups
+SIMILARITY_THRESHOLD = os.environ.get("RESPONSE_CACHE_SIMILARITY")
+EMBEDDING_MODEL = os.environ.get("RESPONSE_CACHE_EMBEDDING_MODEL", "hashing")
+
+TRAILING_PUNCTUATION = re.compile(r"[\s?!.,;:]+$")
+WHITESPACE = re.compile(r"\s+")
+NUMBER = re.compile(r"\d+(?:\.\d+)?")
+
+
+def normalize_message(message: str) -> str:
+    """Returns the form of a message that cache keys are built from."""
+    text = unicodedata.normalize("NFKC", message).casefold()
+    return TRAILING_PUNCTUATION.sub("", WHITESPACE.sub(" ", text).strip())
+
+
+class _Entry:
+    __slots__ = ("expires_at", "reply", "tool_calls", "tools", "numbers", "vector")
+
+    def __init__(self, expires_at: float, reply: str, tool_calls: List[models.ToolCall], numbers: Tuple[str, ...], vector: Optional[np.ndarray]):
+        self.expires_at = expires_at
+        self.reply = reply
+        self.tool_calls = tool_calls
+        self.tools = frozenset(call.tool for call in tool_calls)
+        self.numbers = numbers
+        self.vector = vector
+
+
+class _ScopeIndex:
+    """The embeddings of one scope's cached messages, stacked into a matrix on demand."""
+
+    def __init__(self):
+        self.messages: Dict[str, None] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._keys: List[str] = []
+
+    def add(self, message: str):
+        self.messages[message] = None
+        self._matrix = None
+
+    def remove(self, message: str):
+        self.messages.pop(message, None)
+        self._matrix = None
+
+    def matrix(self, entries: Dict[Tuple[Hashable, str], _Entry], scope: Hashable) -> Tuple[List[str], np.ndarray]:
+        if self._matrix is None:
+            self._keys = list(self.messages)
+            self._matrix = np.stack([entries[(scope, message)].vector for message in self._keys])
+        return self._keys, self._matrix
+
+
+class ResponseCache:
+    """An LRU cache of chat replies with exact and, optionally, semantic lookups."""
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_CACHE_SIZE,
+        default_ttl: float = DEFAULT_CACHE_TTL,
+        similarity_threshold: Optional[float] = float(SIMILARITY_THRESHOLD) if SIMILARITY_THRESHOLD else None,
+        embedding_model: str = EMBEDDING_MODEL,
+        tool_cacheable: Optional[Callable[[str], bool]] = None,
+    ):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model = embedding_model
+        self.tool_cacheable = tool_cacheable or (lambda tool_name: True)
+        # (scope, normalized message) -> entry
+        self._entries: "OrderedDict[Tuple[Hashable, str], _Entry]" = OrderedDict()
+        self._scopes: Dict[Hashable, _ScopeIndex] = {}
+        # Lookups run on the event loop, tool invalidations on the threadpool
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.uncacheable = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.similarity_threshold is not None
+
+    def _embed(self, message: str) -> np.ndarray:
+        # Chat messages stay out of the knowledge base embedding cache
+        return get_embedder(self.embedding_model, cached=False).embed([message])[0]
+
+    def _live(self, key: Tuple[Hashable, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            self.expirations += 1
+            return None
+        return entry
+
+    def _remove(self, key: Tuple[Hashable, str]):
+        del self._entries[key]
+        index = self._scopes.get(key[0])
+        if index is not None:
+            index.remove(key[1])
+            if not index.messages:
+                del self._scopes[key[0]]
+
+    def get(self, scope: Hashable, message: str) -> Optional[Tuple[str, List[models.ToolCall], str]]:
+        """Looks up a cached reply, returning (reply, tool calls, "exact" or "semantic") or None."""
+        normalized = normalize_message(message)
+        key = (scope, normalized)
+        with self._lock:
+            entry = self._live(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry.reply, entry.tool_calls, "exact"
+            semantic = self.semantic and scope in self._scopes
+        if not semantic:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        vector = self._embed(normalized)
+        numbers = tuple(NUMBER.findall(normalized))
+        with self._lock:
+            index = self._scopes.get(scope)
+            if index is not None:
+                keys, matrix = index.matrix(self._entries, scope)
+                scores = matrix @ vector
+                for row in np.argsort(-scores):
+                    if scores[row] < self.similarity_threshold:
+                        break
+                    key = (scope, keys[row])
+                    entry = self._live(key)
+                    if entry is not None and entry.numbers == numbers:
+                        self._entries.move_to_end(key)
+                        self.semantic_hits += 1
+                        return entry.reply, entry.tool_calls, "semantic"
+            self.misses += 1
+            return None
+
+    async def get_async(self, scope: Hashable, message: str) -> Optional[Tuple[str, List[models.ToolCall], str]]:
+        """Like get, but embeds the message off the event loop when semantic lookups are on."""
+        if not self.semantic:
+            return self.get(scope, message)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, scope, message)
+
+    def cacheable(self, tool_calls: Sequence[models.ToolCall]) -> bool:
+        """Whether a reply built from these tool calls may be reused: every tool is cacheable and none failed."""
+        return all(self.tool_cacheable(call.tool) and not call.result.startswith("Error:") for call in tool_calls)
+
+    def set(self, scope: Hashable, message: str, reply: str, tool_calls: Sequence[models.ToolCall], ttl: Optional[float] = None) -> bool:
+        """
+        Stores a reply, evicting the least recently used entries if the cache is full.
+        Returns False, storing nothing, if the reply is not cacheable.
+        """
+        if not self.cacheable(tool_calls):
+            with self._lock:
+                self.uncacheable += 1
+            return False
+        normalized = normalize_message(message)
+        key = (scope, normalized)
+        vector = self._embed(normalized) if self.semantic else None
+        entry = _Entry(time.monotonic() + (ttl or self.default_ttl), reply, list(tool_calls), tuple(NUMBER.findall(normalized)), vector)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            if vector is not None:
+                self._scopes.setdefault(scope, _ScopeIndex()).add(normalized)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    async def set_async(self, scope: Hashable, message: str, reply: str, tool_calls: Sequence[models.ToolCall], ttl: Optional[float] = None) -> bool:
+        """Like set, but embeds the message off the event loop when semantic lookups are on."""
+        if not self.semantic:
+            return self.set(scope, message, reply, tool_calls, ttl)
+        return await asyncio.get_running_loop().run_in_executor(None, self.set, scope, message, reply, tool_calls, ttl)
+
+    def invalidate_tool(self, tool_name: str) -> int:
+        """Drops every cached reply that used a tool and returns how many were removed."""
+        with self._lock:
+            keys = [key for key, entry in self._entries.items() if tool_name in entry.tools]
+            for key in keys:
+                self._remove(key)
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached replies that used tool '{tool_name}'.")
+        return len(keys)
+
+    def clear(self):
+        """Drops every cached reply."""
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> models.ResponseCacheStats:
+        hits = self.exact_hits + self.semantic_hits
+        lookups = hits + self.misses
+        return models.ResponseCacheStats(
+            size=len(self._entries),
+            max_entries=self.max_entries,
+            ttl=self.default_ttl,
+            similarity_threshold=self.similarity_threshold,
+            exact_hits=self.exact_hits,
+            semantic_hits=self.semantic_hits,
+            misses=self.misses,
+            hit_rate=hits / lookups if lookups else 0.0,
+            stores=self.stores,
+            uncacheable=self.uncacheable,
+            evictions=self.evictions,
+            expirations=self.expirations,
+        )
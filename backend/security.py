@@ -1,11 +1,131 @@
+"""
+Password hashing and access tokens.
+
+bcrypt is slow on purpose, so the async endpoints hash and verify passwords on a
+small dedicated thread pool (bcrypt releases the GIL) instead of the event loop.
+The pool size caps how many hashes run at once; a burst of logins queues there
+rather than delaying chat requests.
+
+Access tokens are HS256 JWTs signed with AUTH_SECRET_KEY. They carry the user's
+id and username, so resolving the current user needs no database query. Verified
+tokens are kept in a small LRU cache until they expire.
+"""
+import os
+import hmac
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple
+
 from passlib.context import CryptContext
 
+import models as models
+
+logger = logging.getLogger(__name__)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+ACCESS_TOKEN_TTL = int(os.environ.get("ACCESS_TOKEN_TTL", str(24 * 3600)))  # seconds
+TOKEN_CACHE_SIZE = 10000  # verified tokens
+# Development only: requests without a token act as the first registered user
+AUTH_DEV_FIRST_USER = os.environ.get("AUTH_DEV_FIRST_USER") == "1"
+
+AUTH_SECRET_KEY = os.environ.get("AUTH_SECRET_KEY")
+if not AUTH_SECRET_KEY:
+    # Tokens then only verify in this process and stop working after a restart
+    AUTH_SECRET_KEY = secrets.token_urlsafe(32)
+    logger.warning("AUTH_SECRET_KEY is not set; using a random key for this process.")
+
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
\ No newline at end of file
+    return pwd_context.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifies a password on the password hashing pool."""
+    return await asyncio.get_running_loop().run_in_executor(password_executor, verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Hashes a password on the password hashing pool."""
+    return await asyncio.get_running_loop().run_in_executor(password_executor, get_password_hash, password)
+
+
+class InvalidTokenError(Exception):
+    """Raised when an access token is malformed, has a bad signature or has expired."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+_TOKEN_HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+
+def _sign(signing_input: str) -> str:
+    return _b64encode(hmac.new(AUTH_SECRET_KEY.encode(), signing_input.encode("utf-8"), hashlib.sha256).digest())
+
+
+def create_access_token(user_id: str, username: str, ttl: int = ACCESS_TOKEN_TTL) -> Tuple[str, int]:
+    """Returns a signed access token for a user and its lifetime in seconds."""
+    now = int(time.time())
+    claims = {"sub": str(user_id), "username": username, "iat": now, "exp": now + ttl}
+    signing_input = f"{_TOKEN_HEADER}.{_b64encode(json.dumps(claims, separators=(',', ':')).encode())}"
+    return f"{signing_input}.{_sign(signing_input)}", ttl
+
+
+# token -> (expires at, user); verification is cheap, but this also skips decoding the claims
+_verified_tokens: "OrderedDict[str, Tuple[float, models.CurrentUser]]" = OrderedDict()
+_verified_lock = threading.Lock()
+
+
+def verify_access_token(token: str) -> models.CurrentUser:
+    """Returns the user an access token was issued to, or raises InvalidTokenError."""
+    now = time.time()
+    with _verified_lock:
+        entry = _verified_tokens.get(token)
+        if entry is not None:
+            if entry[0] > now:
+                _verified_tokens.move_to_end(token)
+                return entry[1]
+            del _verified_tokens[token]
+
+    try:
+        header, payload, signature = token.split(".")
+    except ValueError:
+        raise InvalidTokenError("Malformed access token.")
+    # Compared as bytes: compare_digest rejects str with non-ASCII characters
+    if header != _TOKEN_HEADER or not hmac.compare_digest(signature.encode("utf-8"), _sign(f"{header}.{payload}").encode("ascii")):
+        raise InvalidTokenError("Invalid access token signature.")
+    try:
+        claims = json.loads(_b64decode(payload))
+        user = models.CurrentUser(id=claims["sub"], username=claims["username"])
+        expires_at = float(claims["exp"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidTokenError("Malformed access token.")
+    if expires_at <= now:
+        raise InvalidTokenError("Access token has expired.")
+
+    with _verified_lock:
+        _verified_tokens[token] = (expires_at, user)
+        while len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return user
@@ -0,0 +1,118 @@
+"""
+Request coalescing ("single flight") for identical in-flight calls.
+
+While a call with a given key is running, further calls with the same key do
+not start their own execution: they wait for the running one and all receive
+its result (or its exception). Nothing is kept once the call finishes, so this
+is not a cache; it only collapses bursts of identical concurrent calls.
+
+Streams are coalesced the same way. The first caller starts the upstream
+stream in a task that buffers its items; every caller, including the first,
+replays the buffer and then follows it as new items arrive. The upstream keeps
+running while at least one caller is still reading, so a disconnecting client
+does not cut the stream short for the others.
+"""
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import models as models
+
+
+class _SharedStream:
+    """The buffered items of one upstream stream and the callers following it."""
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.readers = 0
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls and streams that share a key."""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _SharedStream] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Returns `await fn()`, sharing the execution with concurrent calls for the same key."""
+        self.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            # The execution runs in its own task, so a cancelled caller does not cancel it for the others
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self.executions += 1
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Retrieve the exception so it is not reported as unhandled if every caller went away
+        task.cancelled() or task.exception()
+
+    async def stream(self, key: Hashable, fn: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Yields the items of `fn()`, sharing the upstream stream with concurrent callers for the same key."""
+        self.calls += 1
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = _SharedStream()
+            self._streams[key] = shared
+            self.executions += 1
+            shared.task = asyncio.create_task(self._produce(key, shared, fn))
+        else:
+            self.coalesced += 1
+
+        shared.readers += 1
+        position = 0
+        try:
+            while True:
+                while position < len(shared.items):
+                    position += 1
+                    yield shared.items[position - 1]
+                if shared.done:
+                    if shared.error is not None:
+                        raise shared.error
+                    return
+                shared.changed.clear()
+                await shared.changed.wait()
+        finally:
+            shared.readers -= 1
+            if shared.readers == 0 and not shared.done:
+                # No one is reading any more; later callers start a new stream
+                if self._streams.get(key) is shared:
+                    del self._streams[key]
+                shared.task.cancel()
+
+    async def _produce(self, key: Hashable, shared: _SharedStream, fn: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for item in fn():
+                shared.items.append(item)
+                shared.changed.set()
+        except asyncio.CancelledError:
+            shared.error = asyncio.CancelledError()
+        except Exception as e:
+            shared.error = e
+        finally:
+            shared.done = True
+            shared.changed.set()
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+
+    def stats(self) -> models.SingleFlightStats:
+        return models.SingleFlightStats(
+            in_flight=len(self._calls) + len(self._streams),
+            calls=self.calls,
+            executions=self.executions,
+            coalesced=self.coalesced,
+            coalesced_rate=self.coalesced / self.calls if self.calls else 0.0,
+        )
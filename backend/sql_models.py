@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, JSON, ForeignKey, DateTime, Uuid, CHAR
+from sqlalchemy import Column, Integer, Float, String, Text, JSON, ForeignKey, DateTime, Uuid, CHAR, Boolean, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -30,6 +30,7 @@ class KnowledgeBase(Base):
     chunk_size = Column(Integer)
     chunk_overlap = Column(Integer)
     metadata_strategy = Column(String)
+    retrieval_mode = Column(String, nullable=False, default="vector")
     path = Column(String) # Path to the persisted vector store
 
 class CustomTool(Base):
@@ -41,6 +42,7 @@ class CustomTool(Base):
     name = Column(String, index=True)
     description = Column(Text)
     code = Column(Text)
+    cacheable = Column(Boolean, nullable=False, default=False)
 
 class DatabaseConnection(Base):
     __tablename__ = "database_connections"
@@ -74,6 +76,11 @@ class ChatSession(Base):
     title = Column(String)
     description = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Rolling summary of the messages older than the conversation memory window
+    summary = Column(Text, nullable=True)
+    summarized_messages = Column(Integer, nullable=False, default=0)
+    summarized_through_id = Column(Integer, nullable=True)
+    summarized_through_at = Column(DateTime, nullable=True)
     messages = relationship("ChatMessage", back_populates="session")
 
 class ChatMessage(Base):
@@ -91,6 +98,9 @@ class ChatMessage(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
     session = relationship("ChatSession", back_populates="messages")
 
+    # Serves keyset-paginated history queries in both directions
+    __table_args__ = (Index("ix_chat_messages_session_id_timestamp", "session_id", "timestamp"),)
+
 class ModelProviderSetting(Base):
     __tablename__ = "model_provider_settings"
 
@@ -101,7 +111,7 @@ class ModelProviderSetting(Base):
     provider = Column(String, nullable=False)
     api_key = Column(String, nullable=False)
     model = Column(String, nullable=False)
-    temperature = Column(Integer, nullable=False, default=0.5)
+    temperature = Column(Float, nullable=False, default=0.5)
     max_tokens = Column(Integer, nullable=False, default=1024)
     timeout = Column(Integer, nullable=False, default=120)
     max_retries = Column(Integer, nullable=False, default=2)
@@ -0,0 +1,111 @@
+"""
+Result cache for deterministic tool calls.
+
+Entries are keyed by the tool name and its canonicalized arguments, expire
+after a per-tool TTL and are evicted in least-recently-used order once the
+cache is full. Only tools that opt in are ever cached.
+"""
+import json
+import time
+import functools
+import inspect
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import models as models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 4096  # entries
+DEFAULT_CACHE_TTL = 300.0  # seconds
+
+
+def canonicalize_args(args: Dict[str, Any]) -> str:
+    """Returns a stable string form of tool arguments, independent of key order."""
+    return json.dumps(args, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class ToolResultCache:
+    """An LRU cache of tool results with per-entry expiry and hit/miss counters."""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE, default_ttl: float = DEFAULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        # (tool name, canonical args) -> (expires at, result)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, tool_name: str, args: Dict[str, Any]) -> Tuple[bool, Any]:
+        """Looks up a cached result, returning (found, result)."""
+        key = (tool_name, canonicalize_args(args))
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, result = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, result
+            del self._entries[key]
+            self.expirations += 1
+        self.misses += 1
+        return False, None
+
+    def set(self, tool_name: str, args: Dict[str, Any], result: Any, ttl: Optional[float] = None):
+        """Stores a result, evicting the least recently used entries if the cache is full."""
+        key = (tool_name, canonicalize_args(args))
+        self._entries[key] = (time.monotonic() + (ttl or self.default_ttl), result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, tool_name: str) -> int:
+        """Drops every cached result for a tool and returns how many were removed."""
+        keys = [key for key in self._entries if key[0] == tool_name]
+        for key in keys:
+            del self._entries[key]
+        if keys:
+            logger.info(f"Invalidated {len(keys)} cached results for tool '{tool_name}'.")
+        return len(keys)
+
+    def clear(self):
+        """Drops every cached result."""
+        self._entries.clear()
+
+    def wrap(self, fn: Callable[..., Any], tool_name: str, ttl: Optional[float] = None) -> Callable[..., Any]:
+        """
+        Wraps a tool function so that its results are served from the cache.
+
+        Like ToolExecutor.wrap, the wrapper keeps the original signature so it can be
+        registered with FastMCP directly.
+        """
+
+        @functools.wraps(fn)
+        async def wrapper(**kwargs: Any) -> Any:
+            found, result = self.get(tool_name, kwargs)
+            if found:
+                return result
+            result = fn(**kwargs)
+            if inspect.isawaitable(result):
+                result = await result
+            self.set(tool_name, kwargs, result, ttl)
+            return result
+
+        return wrapper
+
+    def stats(self) -> models.ToolCacheStats:
+        """Returns the cache's size and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return models.ToolCacheStats(
+            size=len(self._entries),
+            max_entries=self.max_entries,
+            hits=self.hits,
+            misses=self.misses,
+            hit_rate=self.hits / lookups if lookups else 0.0,
+            evictions=self.evictions,
+            expirations=self.expirations,
+        )
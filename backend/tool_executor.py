@@ -0,0 +1,188 @@
+"""
+Non-blocking execution engine for MCP tools.
+
+Synchronous tools are dispatched to a bounded thread pool so they never block
+the event loop, while asynchronous tools are awaited natively. Every tool is
+subject to a timeout and a concurrency cap, and the executor keeps per-tool
+counters that can be exposed for monitoring.
+"""
+import os
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import models as models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOOL_TIMEOUT = 30.0  # seconds
+DEFAULT_TOOL_CONCURRENCY = 8  # concurrent calls per tool
+DEFAULT_TOOL_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+class ToolTimeoutError(Exception):
+    """Raised when a tool call does not finish within its timeout."""
+
+    def __init__(self, tool_name: str, timeout: float):
+        super().__init__(f"Tool '{tool_name}' timed out after {timeout} seconds.")
+        self.tool_name = tool_name
+        self.timeout = timeout
+
+
+class _ToolState:
+    """Limits and counters for a single tool."""
+
+    def __init__(self, timeout: float, max_concurrency: int):
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+
+class ToolExecutor:
+    """
+    Runs tool functions off the event loop with per-tool timeouts and concurrency caps.
+
+    Note that a timed-out synchronous tool cannot be interrupted: its worker thread
+    keeps running until the function returns, and its concurrency slot is only
+    released at that point so a misbehaving tool cannot exceed its cap.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_TOOL_WORKERS,
+        default_timeout: float = DEFAULT_TOOL_TIMEOUT,
+        default_max_concurrency: int = DEFAULT_TOOL_CONCURRENCY,
+    ):
+        self.max_workers = max_workers
+        self.default_timeout = default_timeout
+        self.default_max_concurrency = default_max_concurrency
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool-worker")
+        self._tools: Dict[str, _ToolState] = {}
+        # Calls submitted to the pool that have not started running yet
+        self._pool_queued = 0
+        self._pool_lock = threading.Lock()
+
+    def configure_tool(self, tool_name: str, timeout: Optional[float] = None, max_concurrency: Optional[int] = None):
+        """Sets the timeout and concurrency cap for a tool, falling back to the executor defaults."""
+        state = self._tools.get(tool_name)
+        timeout = timeout or self.default_timeout
+        max_concurrency = max_concurrency or self.default_max_concurrency
+        if state is not None and state.running == 0 and state.waiting == 0:
+            state.timeout = timeout
+            if state.max_concurrency != max_concurrency:
+                state.max_concurrency = max_concurrency
+                state.semaphore = asyncio.Semaphore(max_concurrency)
+        elif state is not None:
+            # Calls are in flight; only the timeout can be changed safely
+            state.timeout = timeout
+        else:
+            self._tools[tool_name] = _ToolState(timeout, max_concurrency)
+
+    def _state(self, tool_name: str) -> _ToolState:
+        if tool_name not in self._tools:
+            self.configure_tool(tool_name)
+        return self._tools[tool_name]
+
+    def _invoke_sync(self, fn: Callable[..., Any], kwargs: Dict[str, Any]) -> Any:
+        with self._pool_lock:
+            self._pool_queued -= 1
+        return fn(**kwargs)
+
+    async def run(self, tool_name: str, fn: Callable[..., Any], kwargs: Dict[str, Any]) -> Any:
+        """Runs a tool function with its configured limits and returns its result."""
+        state = self._state(tool_name)
+        semaphore = state.semaphore
+
+        state.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            state.waiting -= 1
+        state.running += 1
+
+        release_now = True
+        try:
+            if inspect.iscoroutinefunction(fn):
+                result = await asyncio.wait_for(fn(**kwargs), state.timeout)
+            else:
+                loop = asyncio.get_running_loop()
+                with self._pool_lock:
+                    self._pool_queued += 1
+                try:
+                    future = loop.run_in_executor(self._pool, functools.partial(self._invoke_sync, fn, kwargs))
+                except RuntimeError:
+                    with self._pool_lock:
+                        self._pool_queued -= 1
+                    raise
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(future), state.timeout)
+                except asyncio.TimeoutError:
+                    # Keep the slot until the worker thread actually finishes
+                    release_now = False
+                    future.add_done_callback(lambda _: self._finish(state, semaphore))
+                    raise
+        except asyncio.TimeoutError:
+            state.timed_out += 1
+            logger.warning(f"Tool '{tool_name}' timed out after {state.timeout} seconds.")
+            raise ToolTimeoutError(tool_name, state.timeout) from None
+        except Exception:
+            state.failed += 1
+            raise
+        else:
+            state.completed += 1
+            return result
+        finally:
+            if release_now:
+                self._finish(state, semaphore)
+
+    @staticmethod
+    def _finish(state: _ToolState, semaphore: asyncio.Semaphore):
+        state.running -= 1
+        semaphore.release()
+
+    def wrap(self, fn: Callable[..., Any], tool_name: Optional[str] = None) -> Callable[..., Any]:
+        """
+        Wraps a tool function in an async function that runs it through the executor.
+
+        The wrapper keeps the original signature and docstring, so it can be registered
+        with FastMCP in place of the original function.
+        """
+        tool_name = tool_name or fn.__name__
+
+        @functools.wraps(fn)
+        async def wrapper(**kwargs: Any) -> Any:
+            return await self.run(tool_name, fn, kwargs)
+
+        return wrapper
+
+    def stats(self) -> models.ToolExecutorStats:
+        """Returns queue-depth and outcome counters for the executor and every tool."""
+        return models.ToolExecutorStats(
+            max_workers=self.max_workers,
+            pool_queued=self._pool_queued,
+            tools={
+                name: models.ToolExecutionStats(
+                    timeout=state.timeout,
+                    max_concurrency=state.max_concurrency,
+                    waiting=state.waiting,
+                    running=state.running,
+                    completed=state.completed,
+                    failed=state.failed,
+                    timed_out=state.timed_out,
+                )
+                for name, state in self._tools.items()
+            },
+        )
+
+    def shutdown(self):
+        """Stops accepting work and releases the worker threads."""
+        self._pool.shutdown(wait=False, cancel_futures=True)
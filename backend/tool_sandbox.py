@@ -0,0 +1,454 @@
+"""
+Process-pool sandbox for executing user-defined custom tools.
+
+Custom tool code runs in a pool of pre-started worker processes instead of the
+API process, so CPU-heavy or leaking tools neither compete with request handling
+for the GIL nor grow the API worker's memory. Each worker runs under CPU-time and
+address-space limits and is recycled after a fixed number of calls. Arguments and
+results travel over a dedicated pipe per worker, and a tool's source is only sent
+to a worker the first time that worker runs it.
+"""
+import os
+import ast
+import math
+import time
+import signal
+import typing
+import asyncio
+import builtins
+import inspect
+import logging
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import CodeType
+from typing import Any, Dict, List, Literal, Optional, Set, Tuple
+
+try:
+    import resource
+except ImportError:  # Not available on Windows; limits are then not enforced
+    resource = None
+
+import models as models
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SANDBOX_WORKERS = max(2, os.cpu_count() or 1)
+DEFAULT_MAX_CALLS_PER_WORKER = 1000
+DEFAULT_CPU_SECONDS_PER_CALL = 10
+DEFAULT_MEMORY_LIMIT_MB = 512
+
+# Names made available to custom tool code without an explicit import
+TOOL_NAMESPACE = {
+    "time": time,
+    "datetime": datetime,
+    "Literal": Literal,
+    "Dict": Dict,
+    "Any": Any,
+    "Optional": Optional,
+}
+
+
+class ToolSandboxError(Exception):
+    """Raised when a custom tool fails or its worker process dies."""
+
+
+class CpuLimitExceeded(Exception):
+    """Raised inside a worker when a call exceeds its CPU-time limit."""
+
+
+def load_tool_function(compiled: CodeType, tool_id: Any, name: str):
+    """
+    Executes compiled custom tool code in a fresh namespace and returns the tool function.
+
+    A function named after the tool is preferred, otherwise the last function
+    defined by the code is used. Raises ValueError if the code defines no function.
+    """
+    # DANGER: Using exec is a security risk if the code is not trusted.
+    # Running it in a sandbox worker limits its resources, but it can still
+    # do anything the server's user can do.
+    module_name = f"custom_tool_{tool_id}"
+    scope = dict(TOOL_NAMESPACE, __name__=module_name)
+    exec(compiled, scope)
+
+    functions = [
+        value for value in scope.values()
+        if inspect.isfunction(value) and value.__module__ == module_name
+    ]
+    if not functions:
+        raise ValueError(f"Custom tool '{name}' does not define a function.")
+    return next((func for func in functions if func.__name__ == name), functions[-1])
+
+
+# Names an annotation may use when a tool's signature is read without running its code
+ANNOTATION_NAMESPACE = {
+    **{name: getattr(builtins, name) for name in ("int", "float", "str", "bool", "bytes", "list", "dict", "tuple", "set", "frozenset", "object")},
+    **{name: getattr(typing, name) for name in typing.__all__ if name[0].isupper()},
+    **TOOL_NAMESPACE,
+}
+
+
+class _UnresolvedAnnotation(Exception):
+    pass
+
+
+def _resolve_annotation(node: ast.expr) -> Any:
+    """Evaluates an annotation made of known type names, subscripts, `|` unions and constants."""
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in ANNOTATION_NAMESPACE:
+        return ANNOTATION_NAMESPACE[node.id]
+    if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == "typing" and hasattr(typing, node.attr):
+        return getattr(typing, node.attr)
+    if isinstance(node, ast.Subscript):
+        value = _resolve_annotation(node.value)
+        if isinstance(node.slice, ast.Tuple):
+            return value[tuple(_resolve_annotation(element) for element in node.slice.elts)]
+        return value[_resolve_annotation(node.slice)]
+    if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+        return typing.Union[_resolve_annotation(node.left), _resolve_annotation(node.right)]
+    if isinstance(node, ast.List):
+        return [_resolve_annotation(element) for element in node.elts]
+    raise _UnresolvedAnnotation(ast.unparse(node))
+
+
+def _annotation(node: Optional[ast.expr], name: str) -> Any:
+    if node is None:
+        return inspect.Parameter.empty
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        try:
+            node = ast.parse(node.value, mode="eval").body
+        except SyntaxError:
+            return Any
+    try:
+        return _resolve_annotation(node)
+    except (_UnresolvedAnnotation, TypeError):
+        # Types defined or imported by the tool's own code are not known here; arguments are then passed through unchecked
+        logger.warning(f"Custom tool '{name}' has an annotation that cannot be read without running its code: {ast.unparse(node)}. Treating it as Any.")
+        return Any
+
+
+def describe_tool_function(code: str, name: str):
+    """
+    Returns a stand-in for the function a custom tool's code defines, with its name,
+    docstring and signature read from the source without executing it.
+
+    The function is chosen as in load_tool_function. Default values must be
+    literals. Raises SyntaxError for invalid code and ValueError if the code
+    defines no suitable function.
+    """
+    functions: Dict[str, ast.AST] = {}
+    for node in ast.parse(code).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions[node.name] = node
+    if not functions:
+        raise ValueError(f"Custom tool '{name}' does not define a function.")
+    node = functions.get(name) or list(functions.values())[-1]
+
+    args = node.args
+    positional = args.posonlyargs + args.args
+    defaults = [None] * (len(positional) - len(args.defaults)) + list(args.defaults)
+    parameters = []
+
+    def parameter(arg: ast.arg, kind, default: Optional[ast.expr]):
+        value = inspect.Parameter.empty
+        if default is not None:
+            try:
+                value = ast.literal_eval(default)
+            except ValueError:
+                raise ValueError(f"Custom tool '{name}' has a default value that is not a literal: {arg.arg}={ast.unparse(default)}.")
+        parameters.append(inspect.Parameter(arg.arg, kind, default=value, annotation=_annotation(arg.annotation, name)))
+
+    for i, arg in enumerate(positional):
+        kind = inspect.Parameter.POSITIONAL_ONLY if i < len(args.posonlyargs) else inspect.Parameter.POSITIONAL_OR_KEYWORD
+        parameter(arg, kind, defaults[i])
+    if args.vararg is not None:
+        parameter(args.vararg, inspect.Parameter.VAR_POSITIONAL, None)
+    for arg, default in zip(args.kwonlyargs, args.kw_defaults):
+        parameter(arg, inspect.Parameter.KEYWORD_ONLY, default)
+    if args.kwarg is not None:
+        parameter(args.kwarg, inspect.Parameter.VAR_KEYWORD, None)
+
+    def stand_in(*args, **kwargs):
+        raise ToolSandboxError(f"Custom tool '{name}' only runs in the tool sandbox.")
+
+    stand_in.__name__ = stand_in.__qualname__ = node.name
+    stand_in.__doc__ = ast.get_docstring(node, clean=False)
+    stand_in.__signature__ = inspect.Signature(parameters, return_annotation=_annotation(node.returns, name))
+    return stand_in
+
+
+# --- Worker process ---
+
+def _on_cpu_limit(signum, frame):
+    raise CpuLimitExceeded()
+
+
+def _set_cpu_limit(cpu_seconds: Optional[int]):
+    if resource is None or not cpu_seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = math.ceil(usage.ru_utime + usage.ru_stime) + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _clear_cpu_limit():
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _worker_main(conn, cpu_seconds: Optional[int], memory_limit_mb: Optional[int]):
+    """Serves tool calls sent by the parent until it sends None or closes the pipe."""
+    # The parent handles Ctrl+C and shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if resource is not None:
+        signal.signal(signal.SIGXCPU, _on_cpu_limit)
+        if memory_limit_mb:
+            limit = memory_limit_mb * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    functions: Dict[Tuple[str, str], Any] = {}
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if request is None:
+            break
+
+        digest, code, tool_id, name, kwargs = request
+        result = None
+        try:
+            func = functions.get((digest, name))
+            if func is None:
+                if code is None:
+                    raise ToolSandboxError(f"Custom tool '{name}' is not loaded in this worker.")
+                func = load_tool_function(compile(code, "<custom_tool>", "exec"), tool_id, name)
+                functions[(digest, name)] = func
+
+            _set_cpu_limit(cpu_seconds)
+            try:
+                result = func(**kwargs)
+                if inspect.iscoroutine(result):
+                    result = asyncio.run(result)
+            finally:
+                _clear_cpu_limit()
+            reply = ("ok", result)
+        except CpuLimitExceeded:
+            reply = ("error", f"Custom tool '{name}' exceeded its CPU limit of {cpu_seconds} seconds.")
+        except MemoryError:
+            reply = ("error", f"Custom tool '{name}' exceeded its memory limit of {memory_limit_mb} MB.")
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+
+        try:
+            conn.send(reply)
+        except (BrokenPipeError, OSError):
+            break
+        except Exception:
+            # The result could not be pickled, so fall back to its string form
+            conn.send(("ok", str(result)))
+
+
+# --- Parent side ---
+
+class _Worker:
+    """A sandbox worker process and the tools it has already loaded."""
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.calls = 0
+        self.loaded: Set[Tuple[str, str]] = set()
+
+
+class ToolSandbox:
+    """
+    A pool of warm worker processes that execute custom tool code.
+
+    Calls are dispatched to an idle worker; when every worker is busy, callers
+    wait for one to become free. A worker that times out, dies or reaches its
+    call limit is replaced by a freshly started one.
+    """
+
+    def __init__(
+        self,
+        workers: int = DEFAULT_SANDBOX_WORKERS,
+        max_calls_per_worker: int = DEFAULT_MAX_CALLS_PER_WORKER,
+        cpu_seconds_per_call: Optional[int] = DEFAULT_CPU_SECONDS_PER_CALL,
+        memory_limit_mb: Optional[int] = DEFAULT_MEMORY_LIMIT_MB,
+    ):
+        self.workers = workers
+        self.max_calls_per_worker = max_calls_per_worker
+        self.cpu_seconds_per_call = cpu_seconds_per_call
+        self.memory_limit_mb = memory_limit_mb
+        # forkserver keeps workers small: they are forked from a clean server
+        # process rather than from the (large, multi-threaded) API process.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self._context = multiprocessing.get_context(method)
+        if method == "forkserver":
+            self._context.set_forkserver_preload([__name__])
+        self._pool: List[_Worker] = []
+        # Reads workers' replies, at most one per worker at a time
+        self._receiver = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tool-sandbox-recv")
+        self._idle: Optional[asyncio.Queue] = None
+        self._pending: List[_Worker] = []
+        self._stopped = False
+        self.calls = 0
+        self.recycled = 0
+        self.killed = 0
+        self.crashed = 0
+
+    def _spawn(self) -> _Worker:
+        parent_conn, child_conn = self._context.Pipe(duplex=True)
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, self.cpu_seconds_per_call, self.memory_limit_mb),
+            name="tool-sandbox",
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        return _Worker(process, parent_conn)
+
+    def start(self):
+        """Starts the worker processes so that they are warm before the first call."""
+        self._stopped = False
+        self._pending = [self._spawn() for _ in range(self.workers)]
+        self._pool = list(self._pending)
+        logger.info(f"Started {self.workers} tool sandbox workers.")
+
+    def _idle_queue(self) -> asyncio.Queue:
+        # The queue is created lazily so that it belongs to the serving event loop
+        if self._idle is None:
+            self._idle = asyncio.Queue()
+            for worker in self._pending:
+                self._idle.put_nowait(worker)
+            self._pending = []
+        return self._idle
+
+    async def _replace(self, worker: _Worker):
+        if worker in self._pool:
+            self._pool.remove(worker)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._shutdown_worker, worker)
+        if self._stopped:
+            return
+        replacement = await loop.run_in_executor(None, self._spawn)
+        if self._stopped:
+            self._shutdown_worker(replacement)
+            return
+        self._pool.append(replacement)
+        self._idle_queue().put_nowait(replacement)
+
+    @staticmethod
+    def _shutdown_worker(worker: _Worker):
+        try:
+            if worker.process.is_alive():
+                worker.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        worker.conn.close()
+        worker.process.join(timeout=0.5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join(timeout=0.5)
+
+    async def _recv(self, worker: _Worker):
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = worker.conn.fileno()
+        try:
+            # Waits for the reply without holding a thread while the tool runs
+            loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        except NotImplementedError:
+            # Event loops without add_reader (e.g. the Windows Proactor loop) wait in the receiver thread instead
+            pass
+        else:
+            try:
+                await readable
+            finally:
+                loop.remove_reader(fd)
+        # Only the start of the reply is known to have arrived; a large result is read and unpickled off the event loop
+        return await loop.run_in_executor(self._receiver, worker.conn.recv)
+
+    async def call(self, digest: str, code: str, tool_id: Any, name: str, kwargs: Dict[str, Any]) -> Any:
+        """Runs a custom tool in a sandbox worker and returns its result."""
+        if self._stopped:
+            raise ToolSandboxError("The tool sandbox is not running.")
+        idle = self._idle_queue()
+        worker = await idle.get()
+        healthy = False
+        try:
+            key = (digest, name)
+            worker.conn.send((digest, None if key in worker.loaded else code, tool_id, name, kwargs))
+            status, payload = await self._recv(worker)
+            if status == "ok":
+                worker.loaded.add(key)
+            worker.calls += 1
+            self.calls += 1
+            healthy = True
+        except asyncio.CancelledError:
+            # The call timed out or was abandoned while the worker is still busy
+            self.killed += 1
+            worker.process.kill()
+            raise
+        except (EOFError, OSError) as e:
+            self.crashed += 1
+            raise ToolSandboxError(f"Sandbox worker for custom tool '{name}' exited unexpectedly.") from e
+        finally:
+            if healthy and worker.calls < self.max_calls_per_worker:
+                idle.put_nowait(worker)
+            else:
+                if healthy:
+                    self.recycled += 1
+                asyncio.get_running_loop().create_task(self._replace(worker))
+
+        if status == "error":
+            raise ToolSandboxError(payload)
+        return payload
+
+    def proxy(self, func, digest: str, code: str, tool_id: Any, name: str):
+        """
+        Returns an async function with the signature and docstring of `func`
+        that runs the tool in the sandbox instead of calling `func` itself.
+        """
+        sandbox = self
+
+        async def proxy(**kwargs: Any) -> Any:
+            return await sandbox.call(digest, code, tool_id, name, kwargs)
+
+        proxy.__name__ = func.__name__
+        proxy.__qualname__ = func.__qualname__
+        proxy.__doc__ = func.__doc__
+        proxy.__signature__ = inspect.signature(func)
+        return proxy
+
+    def stats(self) -> models.ToolSandboxStats:
+        """Returns worker and call counters for the sandbox."""
+        idle = self._idle.qsize() if self._idle is not None else len(self._pending)
+        return models.ToolSandboxStats(
+            workers=len(self._pool),
+            idle_workers=idle,
+            calls=self.calls,
+            recycled=self.recycled,
+            killed=self.killed,
+            crashed=self.crashed,
+            max_calls_per_worker=self.max_calls_per_worker,
+            cpu_seconds_per_call=self.cpu_seconds_per_call,
+            memory_limit_mb=self.memory_limit_mb,
+        )
+
+    def stop(self):
+        """Stops every worker process."""
+        self._stopped = True
+        for worker in self._pool:
+            self._shutdown_worker(worker)
+        self._pool = []
+        self._pending = []
+        self._idle = None
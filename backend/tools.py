@@ -1,16 +1,26 @@
 """
 Refactored tooling system using the MCP SDK.
 
-This module defines the tools for the server and provides a function
-to register them with a FastMCP server instance.
+This module defines the tools for the server and provides a registry
+that keeps them in sync with a FastMCP server instance.
 """
+import os
+import sys
 import time
+import hashlib
+import marshal
+from collections import OrderedDict
 from datetime import datetime
-from typing import Literal, Dict, Any
+from types import CodeType
+from typing import Literal, Dict, Any, Optional, Tuple
 import logging
 
 from mcp.server.fastmcp import FastMCP
 
+from tool_executor import ToolExecutor
+from tool_cache import ToolResultCache
+from tool_sandbox import ToolSandbox, load_tool_function, describe_tool_function
+
 logger = logging.getLogger(__name__)
 
 # --- Default Tool Definitions ---
@@ -59,45 +69,226 @@ def current_time() -> str:
     time.sleep(0.2)  # Simulate work
     return f"The current time is {datetime.now().isoformat()}"
 
+# Per-tool execution limits; tools not listed here use the executor defaults
+TOOL_LIMITS = {
+    "calculator": {"timeout": 5.0, "max_concurrency": 16},
+    "web_search": {"timeout": 15.0, "max_concurrency": 8},
+    "current_time": {"timeout": 5.0, "max_concurrency": 16},
+}
+
+# Deterministic default tools whose results may be cached, with their TTL in seconds.
+# Tools such as current_time must never be listed here.
+CACHEABLE_TOOLS = {
+    "calculator": 3600.0,
+    "web_search": 300.0,
+}
 
-def add_tools(mcp: FastMCP, custom_tools: Dict[str, Dict] = None):
+def register_tool(
+    mcp: FastMCP,
+    func,
+    name: Optional[str] = None,
+    executor: Optional[ToolExecutor] = None,
+    cache: Optional[ToolResultCache] = None,
+    cacheable: bool = False,
+    cache_ttl: Optional[float] = None,
+):
     """
-    Adds all the tools to the given FastMCP server instance.
+    Registers a single function as a tool, routing its calls through the executor
+    and, for cacheable tools, the result cache if given.
     """
-    # HACK: Clear existing tools before re-registering.
-    # This is necessary because the FastMCP library does not provide a public
-    # method to clear tools, and we need to re-register them to add/update/delete
-    # custom tools.
-    if hasattr(mcp, '_tool_manager') and hasattr(mcp._tool_manager, '_tools'):
-        mcp._tool_manager._tools = {}
-
-    # Register default tools
-    mcp.add_tool(calculator)
-    mcp.add_tool(web_search)
-    mcp.add_tool(current_time)
-
-    # Add custom tools
-    if custom_tools:
-        for tool_id, tool_data in custom_tools.items():
+    name = name or func.__name__
+    if executor is not None:
+        executor.configure_tool(name, **TOOL_LIMITS.get(name, {}))
+        func = executor.wrap(func, name)
+    if cache is not None and cacheable:
+        func = cache.wrap(func, name, cache_ttl)
+    mcp.add_tool(func, name=name)
+
+class ToolRegistrationError(Exception):
+    """Raised when a custom tool cannot be compiled or registered."""
+
+
+DEFAULT_TOOLS = (calculator, web_search, current_time)
+
+def source_hash(code: str) -> str:
+    """Returns the content hash used to cache a tool's compiled code."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+class ToolCodeCache:
+    """
+    Caches compiled custom tool code by the hash of its source.
+
+    Code objects are kept in memory and marshalled to disk, so unchanged tools
+    are not recompiled either while the server runs or after a restart.
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_entries: int = 8192):
+        # The marshal format is specific to the interpreter version
+        self.cache_dir = os.path.join(cache_dir, sys.implementation.cache_tag) if cache_dir else None
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_entries = max_entries
+        self._code: "OrderedDict[str, CodeType]" = OrderedDict()
+
+    def get(self, code: str) -> CodeType:
+        """Returns the compiled code object for the given source, compiling it only on a miss."""
+        digest = source_hash(code)
+        compiled = self._code.get(digest)
+        if compiled is not None:
+            self._code.move_to_end(digest)
+            return compiled
+
+        path = os.path.join(self.cache_dir, f"{digest}.bin") if self.cache_dir else None
+        if path and os.path.exists(path):
             try:
-                # DANGER: Using exec is a security risk if the code is not trusted.
-                # Here we are assuming the code is provided by a trusted user.
-                # A more secure implementation would use a sandboxed environment
-                # or a restricted subset of Python.
-                tool_code = tool_data['code']
-                tool_name = tool_data['name']
+                with open(path, "rb") as f:
+                    compiled = marshal.load(f)
+            except (OSError, EOFError, ValueError, TypeError):
+                compiled = None
+        if compiled is None:
+            compiled = compile(code, "<custom_tool>", "exec")
+            if path:
+                try:
+                    tmp_path = f"{path}.{os.getpid()}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        marshal.dump(compiled, f)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    logger.warning(f"Could not persist compiled tool code: {e}")
+
+        self._code[digest] = compiled
+        while len(self._code) > self.max_entries:
+            self._code.popitem(last=False)
+        return compiled
 
-                # Create a scope for the exec call
-                local_scope = {}
-                exec(tool_code, globals(), local_scope)
 
-                # The function should be defined in the local_scope
-                # We assume the code defines a single function
-                func = next(iter(local_scope.values()))
+class ToolRegistry:
+    """
+    Keeps the FastMCP server's tools in sync with the custom tools in the database.
 
-                # Register the function as a tool
-                mcp.add_tool(func, name=tool_name)
-                logger.info(f"Successfully registered custom tool: {tool_name}")
+    Custom tools run in the sandbox's worker processes when a sandbox is given,
+    and in the server process otherwise. With a sandbox, their code is not even
+    imported in the server process.
 
+    Custom tools are added, replaced and removed one at a time as they change, rather
+    than clearing and re-registering every tool. Re-registering a tool whose source
+    and settings are unchanged is a no-op.
+    """
+
+    def __init__(
+        self,
+        mcp: FastMCP,
+        executor: Optional[ToolExecutor] = None,
+        cache: Optional[ToolResultCache] = None,
+        code_cache: Optional[ToolCodeCache] = None,
+        sandbox: Optional[ToolSandbox] = None,
+    ):
+        self.mcp = mcp
+        self.executor = executor
+        self.cache = cache
+        self.sandbox = sandbox
+        self.code_cache = code_cache or ToolCodeCache()
+        # custom tool id -> (registered name, source hash, cacheable)
+        self._custom_tools: Dict[Any, Tuple[str, str, bool]] = {}
+        # custom tool id -> registered function, kept to restore it if a replacement fails to register
+        self._functions: Dict[Any, Any] = {}
+
+    def add_default_tools(self):
+        """Registers the built-in tools."""
+        for func in DEFAULT_TOOLS:
+            register_tool(
+                self.mcp, func, executor=self.executor, cache=self.cache,
+                cacheable=func.__name__ in CACHEABLE_TOOLS, cache_ttl=CACHEABLE_TOOLS.get(func.__name__),
+            )
+
+    def load_function(self, tool_id: Any, name: str, code: str):
+        """
+        Returns the function a custom tool's code defines.
+
+        With a sandbox, the code is never executed in the server process: the
+        function's signature and docstring are read from its source, and calls
+        are executed by the sandbox workers. Without one, the (cached) code is
+        executed here.
+        """
+        try:
+            if self.sandbox is not None:
+                return describe_tool_function(code, name)
+            compiled = self.code_cache.get(code)
+        except SyntaxError as e:
+            raise ToolRegistrationError(f"Custom tool '{name}' has invalid code: {e}") from e
+        except ValueError as e:
+            raise ToolRegistrationError(str(e)) from e
+
+        try:
+            return load_tool_function(compiled, tool_id, name)
+        except ValueError as e:
+            raise ToolRegistrationError(str(e)) from e
+        except Exception as e:
+            raise ToolRegistrationError(f"Custom tool '{name}' failed to load: {e}") from e
+
+    def upsert(self, tool_id: Any, name: str, code: str, cacheable: bool = False):
+        """Adds or replaces a single custom tool in the live registry."""
+        digest = source_hash(code)
+        current = self._custom_tools.get(tool_id)
+        if current == (name, digest, cacheable):
+            return
+
+        if self.mcp._tool_manager.get_tool(name) is not None and (current is None or current[0] != name):
+            raise ToolRegistrationError(f"A tool named '{name}' is already registered.")
+
+        func = self.load_function(tool_id, name, code)
+        if self.sandbox is not None:
+            func = self.sandbox.proxy(func, digest, code, tool_id, name)
+        if current is not None:
+            self._unregister(current[0])
+        try:
+            register_tool(self.mcp, func, name=name, executor=self.executor, cache=self.cache, cacheable=cacheable)
+        except Exception as e:
+            if current is not None:
+                # Put the working version back; the database still holds it
+                register_tool(self.mcp, self._functions[tool_id], name=current[0], executor=self.executor, cache=self.cache, cacheable=current[2])
+            raise ToolRegistrationError(f"Custom tool '{name}' could not be registered: {e}") from e
+        self._custom_tools[tool_id] = (name, digest, cacheable)
+        self._functions[tool_id] = func
+        logger.info(f"Successfully registered custom tool: {name}")
+
+    def remove(self, tool_id: Any):
+        """Removes a single custom tool from the live registry, if it is registered."""
+        current = self._custom_tools.pop(tool_id, None)
+        self._functions.pop(tool_id, None)
+        if current is not None:
+            self._unregister(current[0])
+            logger.info(f"Removed custom tool: {current[0]}")
+
+    def is_registered(self, tool_id: Any) -> bool:
+        """Whether a custom tool is currently registered."""
+        return tool_id in self._custom_tools
+
+    def _unregister(self, name: str):
+        if self.mcp._tool_manager.get_tool(name) is not None:
+            self.mcp.remove_tool(name)
+        if self.cache is not None:
+            self.cache.invalidate(name)
+
+    def load(self, custom_tools: Dict[Any, Dict]):
+        """Registers many custom tools, logging (rather than raising) individual failures."""
+        for tool_id, tool_data in custom_tools.items():
+            try:
+                self.upsert(tool_id, tool_data['name'], tool_data['code'], bool(tool_data.get('cacheable')))
             except Exception as e:
                 logger.error(f"Failed to register custom tool '{tool_data.get('name', 'unknown')}': {e}")
+
+    def is_cacheable(self, name: str) -> bool:
+        """Whether a registered tool's results may be reused, i.e. it is deterministic."""
+        if name in CACHEABLE_TOOLS:
+            return True
+        return any(cacheable for tool_name, _, cacheable in self._custom_tools.values() if tool_name == name)
+
+    def is_idempotent(self, name: str) -> bool:
+        """Whether identical concurrent calls of a tool may share one execution: built-in and cacheable tools."""
+        return name in (func.__name__ for func in DEFAULT_TOOLS) or self.is_cacheable(name)
+
+    def custom_tool_count(self) -> int:
+        """Returns the number of custom tools currently registered."""
+        return len(self._custom_tools)
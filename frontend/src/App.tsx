@@ -61,6 +61,7 @@ const App: React.FC = () => {
   const [sidebarWidth, setSidebarWidth] = useState(256); // Add this state
   const [isLoggedIn, setIsLoggedIn] = useState(false);
   const [authToken, setAuthToken] = useState<string | null>(null);
+  const [userId, setUserId] = useState<string | null>(null);
   const [selectedKbs, setSelectedKbs] = useState<string[]>([]);
   const [selectedDbs, setSelectedDbs] = useState<string[]>([]);
   const [isModelModalOpen, setIsModelModalOpen] = useState(false);
@@ -74,6 +75,9 @@ const App: React.FC = () => {
     max_retries: 2,
   });
 
+  // Sent with every request to an endpoint that acts on behalf of the logged-in user
+  const authHeaders = (): Record<string, string> => (authToken ? { Authorization: `Bearer ${authToken}` } : {});
+
   const inputRef = useRef<HTMLInputElement>(null);
   const chatEndRef = useRef<HTMLDivElement>(null);
 
@@ -94,7 +98,7 @@ const App: React.FC = () => {
   useEffect(() => {
     const fetchChatSessions = async () => {
       try {
-        const response = await fetch('http://localhost:8000/sessions');
+        const response = await fetch('http://localhost:8000/sessions', { headers: authHeaders() });
         if (response.ok) {
           const sessions: ChatSession[] = await response.json();
           if (sessions.length > 0) {
@@ -128,7 +132,7 @@ const App: React.FC = () => {
       fetchChatSessions();
       fetchModelSettings();
     }
-  }, [isLoggedIn]);
+  }, [isLoggedIn, authToken]);
 
   // Apply theme color
   useEffect(() => {
@@ -190,7 +194,7 @@ const App: React.FC = () => {
     try {
       const response = await fetch('http://localhost:8000/chat', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', ...authHeaders() },
         body: JSON.stringify({
           session_id: activeChatId,
           message: messageToSend,
@@ -250,7 +254,10 @@ const App: React.FC = () => {
     try {
       const response = await fetch('http://localhost:8000/new-session', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: {
+          'Content-Type': 'application/json',
+          ...authHeaders(),
+        },
         body: JSON.stringify({}), // Sending an empty body for now
       });
       if (response.ok) {
@@ -297,7 +304,7 @@ const App: React.FC = () => {
     const payload = {
       provider,
       api_key: keys[provider] || '',
-      user_id: authToken, // Pass the user's ID
+      user_id: userId, // Pass the user's ID
       ...settings,
     };
 
@@ -407,7 +414,7 @@ const App: React.FC = () => {
     // just the metadata. A real implementation would use FormData
     // and a different content-type.
     const payload = {
-      user_id: authToken, // Add the user's ID to the payload
+      user_id: userId, // Add the user's ID to the payload
       kb_name: data.kbName,
       vector_store: data.vectorStore,
       allowed_file_types: data.allowedFileTypes,
@@ -451,6 +458,7 @@ const App: React.FC = () => {
       const responseData = await response.json();
       if (response.ok) {
         setAuthToken(responseData.access_token);
+        setUserId(responseData.user_id);
         setIsLoggedIn(true);
       } else {
         alert(`Login failed: ${responseData.detail}`);